@@ -0,0 +1,52 @@
+"""cache generations
+
+Revision ID: 4465d4e319b9
+Revises: 479658f6f92d
+Create Date: 2026-10-18 09:12:41.208114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4465d4e319b9'
+down_revision: Union[str, None] = '479658f6f92d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('cache_generations',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('generation', sa.BigInteger(), nullable=False, server_default='0'),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.execute("INSERT INTO cache_generations (name, generation) VALUES ('thread_labels', 0)")
+
+    # Any write to thread_labels bumps its generation so the query assistant
+    # can drop cached retrieval results that were built from older labels.
+    op.execute("""
+        CREATE OR REPLACE FUNCTION bump_cache_generation() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO cache_generations (name, generation) VALUES (TG_TABLE_NAME, 1)
+            ON CONFLICT (name) DO UPDATE SET generation = cache_generations.generation + 1;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER thread_labels_bump_cache_generation
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON thread_labels
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_cache_generation();
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS thread_labels_bump_cache_generation ON thread_labels")
+    op.execute("DROP FUNCTION IF EXISTS bump_cache_generation()")
+    op.drop_table('cache_generations')
@@ -0,0 +1,62 @@
+"""embedding incremental state
+
+Revision ID: 8c2f0d6a4b71
+Revises: 4465d4e319b9
+Create Date: 2026-10-18 10:02:17.493210
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c2f0d6a4b71'
+down_revision: Union[str, None] = '4465d4e319b9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Every existing embedding was produced by this model
+LEGACY_MODEL_ID = 'sentence-transformers/all-mpnet-base-v2'
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('embeddings', sa.Column('model_id', sa.String(), nullable=True))
+    op.add_column('embeddings', sa.Column('content_hash', sa.String(length=32), nullable=True))
+    op.add_column('embeddings', sa.Column('embedded_at', sa.TIMESTAMP(), server_default=sa.text('now()'), nullable=False))
+    op.execute(f"UPDATE embeddings SET model_id = '{LEGACY_MODEL_ID}'")
+    op.execute("""
+        UPDATE embeddings e SET content_hash = md5(m.text)
+        FROM messages m WHERE m.message_id = e.message_id
+    """)
+    op.alter_column('embeddings', 'model_id', nullable=False)
+    op.alter_column('embeddings', 'content_hash', nullable=False)
+
+    # One row per (message, model) so a new model can be backfilled next to the live one
+    op.drop_constraint('embeddings_pkey', 'embeddings', type_='primary')
+    op.create_primary_key('embeddings_pkey', 'embeddings', ['message_id', 'model_id'])
+
+    # Keyset scans by creation time for incremental runs
+    op.create_index('ix_messages_created_message_id', 'messages', ['created', 'message_id'])
+
+    op.create_table('embedding_watermarks',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('last_created', sa.TIMESTAMP(), nullable=False),
+    sa.Column('last_message_id', sa.String(), nullable=False),
+    sa.Column('updated_at', sa.TIMESTAMP(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('embedding_watermarks')
+    op.drop_index('ix_messages_created_message_id', table_name='messages')
+    op.execute(f"DELETE FROM embeddings WHERE model_id <> '{LEGACY_MODEL_ID}'")
+    op.drop_constraint('embeddings_pkey', 'embeddings', type_='primary')
+    op.create_primary_key('embeddings_pkey', 'embeddings', ['message_id'])
+    op.drop_column('embeddings', 'embedded_at')
+    op.drop_column('embeddings', 'content_hash')
+    op.drop_column('embeddings', 'model_id')
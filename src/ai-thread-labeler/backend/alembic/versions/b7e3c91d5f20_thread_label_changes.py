@@ -0,0 +1,54 @@
+"""thread label changes
+
+Revision ID: b7e3c91d5f20
+Revises: 8c2f0d6a4b71
+Create Date: 2026-10-18 14:37:05.612384
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e3c91d5f20'
+down_revision: Union[str, None] = '8c2f0d6a4b71'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('thread_label_changes',
+    sa.Column('id', sa.BigInteger(), sa.Identity(), nullable=False),
+    sa.Column('thread_id', sa.String(), nullable=False),
+    sa.Column('changed_at', sa.TIMESTAMP(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    # Log the thread (parent message) of every labelled message that changes, so
+    # update_answer_store.py re-materializes only those threads' answers.
+    op.execute("""
+        CREATE OR REPLACE FUNCTION log_thread_label_change() RETURNS trigger AS $$
+        DECLARE
+            changed_id text := CASE WHEN TG_OP = 'DELETE' THEN OLD.message_id ELSE NEW.message_id END;
+        BEGIN
+            INSERT INTO thread_label_changes (thread_id)
+            SELECT COALESCE(m.parent_id, m.message_id) FROM messages m WHERE m.message_id = changed_id;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER thread_labels_log_change
+        AFTER INSERT OR UPDATE OR DELETE ON thread_labels
+        FOR EACH ROW EXECUTE FUNCTION log_thread_label_change();
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS thread_labels_log_change ON thread_labels")
+    op.execute("DROP FUNCTION IF EXISTS log_thread_label_change()")
+    op.drop_table('thread_label_changes')
@@ -0,0 +1,44 @@
+"""embeddings vector hnsw
+
+Revision ID: d41a6e8b2c93
+Revises: b7e3c91d5f20
+Create Date: 2026-10-18 16:05:48.274913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41a6e8b2c93'
+down_revision: Union[str, None] = 'b7e3c91d5f20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Model served by the query assistant; the index is partial so a model being
+# backfilled next to it does not slow down or pollute the live graph
+MODEL_ID = 'sentence-transformers/all-mpnet-base-v2'
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # HNSW over cosine distance for SEARCH_BACKEND=pgvector. all-mpnet-base-v2 ends in a
+    # Normalize layer, so stored vectors are already unit length even though
+    # extract_embeddings encodes with normalize=False; cosine then ranks like the FAISS
+    # inner product and stays correct for any vector that isn't. Built concurrently so
+    # the embedding jobs keep writing.
+    with op.get_context().autocommit_block():
+        op.execute(f"""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_embeddings_vector_hnsw
+            ON embeddings USING hnsw (vector vector_cosine_ops)
+            WITH (m = 16, ef_construction = 200)
+            WHERE model_id = '{MODEL_ID}'
+        """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_embeddings_vector_hnsw")
@@ -0,0 +1,66 @@
+"""messages ingest seq
+
+Revision ID: e6c4f2a9b813
+Revises: d41a6e8b2c93
+Create Date: 2026-10-18 18:21:40.318057
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6c4f2a9b813'
+down_revision: Union[str, None] = 'd41a6e8b2c93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Ingestion order for incremental embedding runs. Webex `created` is not it: the
+    # loader pages newest-first and backfills new rooms / earlier START_DATEs later.
+    op.execute("CREATE SEQUENCE messages_ingest_seq")
+    op.add_column('messages', sa.Column('ingest_seq', sa.BigInteger(),
+                                        server_default=sa.text("nextval('messages_ingest_seq')"), nullable=False))
+    op.execute("ALTER SEQUENCE messages_ingest_seq OWNED BY messages.ingest_seq")
+    op.create_index('ix_messages_ingest_seq', 'messages', ['ingest_seq'], unique=True)
+
+    # An edited text moves the message past every watermark, so the next run re-embeds it
+    op.execute("""
+        CREATE OR REPLACE FUNCTION bump_message_ingest_seq() RETURNS trigger AS $$
+        BEGIN
+            NEW.ingest_seq := nextval('messages_ingest_seq');
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER messages_bump_ingest_seq
+        BEFORE UPDATE OF text ON messages
+        FOR EACH ROW WHEN (OLD.text IS DISTINCT FROM NEW.text)
+        EXECUTE FUNCTION bump_message_ingest_seq();
+    """)
+
+    # Watermarks restart at 0: the first run re-checks every message once (embedded ones
+    # are skipped by their content hash) and picks up the ones the created keyset missed
+    op.drop_column('embedding_watermarks', 'last_created')
+    op.drop_column('embedding_watermarks', 'last_message_id')
+    op.add_column('embedding_watermarks', sa.Column('last_seq', sa.BigInteger(), server_default='0', nullable=False))
+    # Only the created keyset scanned it; every message write would otherwise keep paying for it
+    op.drop_index('ix_messages_created_message_id', table_name='messages')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index('ix_messages_created_message_id', 'messages', ['created', 'message_id'])
+    op.drop_column('embedding_watermarks', 'last_seq')
+    op.add_column('embedding_watermarks', sa.Column('last_message_id', sa.String(), server_default='', nullable=False))
+    op.add_column('embedding_watermarks', sa.Column('last_created', sa.TIMESTAMP(),
+                                                    server_default=sa.text("'-infinity'"), nullable=False))
+    op.execute("DROP TRIGGER IF EXISTS messages_bump_ingest_seq ON messages")
+    op.execute("DROP FUNCTION IF EXISTS bump_message_ingest_seq()")
+    op.drop_index('ix_messages_ingest_seq', table_name='messages')
+    op.drop_column('messages', 'ingest_seq')  # drops the owned sequence too
@@ -0,0 +1,53 @@
+"""message text answer changes
+
+Revision ID: f3a9d7c51e26
+Revises: e6c4f2a9b813
+Create Date: 2026-10-18 21:05:12.447190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a9d7c51e26'
+down_revision: Union[str, None] = 'e6c4f2a9b813'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Stored answers and cached results carry message text, so an edited or deleted
+    # message counts as a label change: its thread is logged for update_answer_store.py
+    # and the thread_labels generation moves on, sending queries to SQL until then.
+    op.execute("""
+        CREATE OR REPLACE FUNCTION log_message_text_change() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO thread_label_changes (thread_id) VALUES (COALESCE(OLD.parent_id, OLD.message_id));
+            INSERT INTO cache_generations (name, generation) VALUES ('thread_labels', 1)
+            ON CONFLICT (name) DO UPDATE SET generation = cache_generations.generation + 1;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER messages_log_text_change
+        AFTER UPDATE OF text ON messages
+        FOR EACH ROW WHEN (OLD.text IS DISTINCT FROM NEW.text)
+        EXECUTE FUNCTION log_message_text_change();
+    """)
+    op.execute("""
+        CREATE TRIGGER messages_log_delete
+        AFTER DELETE ON messages
+        FOR EACH ROW EXECUTE FUNCTION log_message_text_change();
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS messages_log_delete ON messages")
+    op.execute("DROP TRIGGER IF EXISTS messages_log_text_change ON messages")
+    op.execute("DROP FUNCTION IF EXISTS log_message_text_change()")
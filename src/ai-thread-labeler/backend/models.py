@@ -1,23 +1,37 @@
-from sqlalchemy import Column, String, Text, Boolean, ForeignKey, TIMESTAMP
+from sqlalchemy import Column, String, Text, Boolean, ForeignKey, TIMESTAMP, BigInteger, Identity
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from pgvector.sqlalchemy import Vector 
-from sqlalchemy import Float
+from sqlalchemy import Float, func, text as sql_text
 import uuid
 
 Base = declarative_base()
 
+class CacheGenerations(Base):
+    __tablename__ = 'cache_generations'
+    name = Column(String, primary_key=True)  # table whose changes invalidate caches, e.g. 'thread_labels'
+    generation = Column(BigInteger, nullable=False, default=0, server_default='0')
+
 class Classifications(Base):
     __tablename__ = 'classifications'
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     message_id = Column(String, ForeignKey('messages.message_id', ondelete="CASCADE"), nullable=False)
     category = Column(String, nullable=False)
 
+class EmbeddingWatermarks(Base):
+    __tablename__ = 'embedding_watermarks'
+    name = Column(String, primary_key=True)  # e.g. 'embed:<model_id>' or 'reembed:<model_id>'
+    last_seq = Column(BigInteger, nullable=False, server_default='0')  # messages.ingest_seq embedded up to
+    updated_at = Column(TIMESTAMP, nullable=False, server_default=func.now())
+
 class Embeddings(Base):
     __tablename__ = 'embeddings'
     message_id = Column(String, ForeignKey('messages.message_id', ondelete="CASCADE"), primary_key=True)
+    model_id = Column(String, primary_key=True)  # embedding model that produced the vector
     vector = Column(Vector(768), nullable=False)
+    content_hash = Column(String(32), nullable=False)  # md5(messages.text) when embedded
+    embedded_at = Column(TIMESTAMP, nullable=False, server_default=func.now())
 
 class Messages(Base):
     __tablename__ = 'messages'
@@ -30,6 +44,9 @@ class Messages(Base):
     person_email = Column(String, nullable=False)
     text = Column(Text, nullable=False)
     created = Column(TIMESTAMP, nullable=False)
+    # Insertion order (bumped when text changes), for incremental embedding runs
+    ingest_seq = Column(BigInteger, nullable=False, unique=True,
+                        server_default=sql_text("nextval('messages_ingest_seq')"))
 
 class ProcessedMessages(Base):
     __tablename__ = 'processed_messages'
@@ -43,6 +60,12 @@ class Spaces(Base):
     room_id = Column(String, primary_key=True)
     space_name = Column(String, nullable=False)
 
+class ThreadLabelChanges(Base):
+    __tablename__ = 'thread_label_changes'
+    id = Column(BigInteger, Identity(), primary_key=True)
+    thread_id = Column(String, nullable=False)  # parent message_id of a relabelled message, logged by trigger
+    changed_at = Column(TIMESTAMP, nullable=False, server_default=func.now())
+
 class ThreadLabels(Base):
     __tablename__ = 'thread_labels'
     message_id = Column(String, ForeignKey('messages.message_id'), primary_key=True)
@@ -0,0 +1,177 @@
+"""
+Precomputed thread answers, shipped next to the FAISS index: for every thread with
+an answer-labelled reply, exactly what the query assistant returns for it (thread
+question, first answer, follow-ups), so the common request path needs no SQL.
+
+Two files share a path prefix (ANSWER_STORE_PATH):
+    <prefix>.npy   uint8, UTF-8 JSON records back to back; memory-mapped
+    <prefix>.npz   threads            sorted parent message_ids (S<n>)
+                   offsets            int64 (n+1); record i is blob[offsets[i]:offsets[i+1]]
+                   labels_generation  cache_generations['thread_labels'] the store reflects
+                   last_change_id     last thread_label_changes row applied
+
+Threads without an answer (or whose answer-labelled replies are all empty) are not
+stored, so a thread missing from a store that is current (labels_generation equal to
+the live generation) has no answer. When labels (or the text of a message) have
+changed since, the query assistant falls back to SQL until update_answer_store.py has
+applied the logged changes.
+
+Records are keyed by thread (parent message_id), not by FAISS position, so one store
+serves the parent and whole-thread indexes and survives appends and compactions.
+"""
+import json
+import os
+
+import numpy as np
+
+# Parents with their replies and reply labels, for threads that have an answer
+_RECORDS_SQL = """
+    SELECT p.message_id, p.text, c.message_id, c.text, l.label
+    FROM messages p
+    JOIN messages c ON c.parent_id = p.message_id
+    LEFT JOIN thread_labels l ON l.message_id = c.message_id
+    WHERE p.parent_id IS NULL {where}
+      AND EXISTS (
+          SELECT 1 FROM messages a JOIN thread_labels al ON al.message_id = a.message_id
+          WHERE a.parent_id = p.message_id AND al.label = 'answer'
+      )
+    ORDER BY p.message_id, c.created
+"""
+
+
+def select_answer(children):
+    """
+    First 'answer' child of (message_id, text, label) children in creation order;
+    later answers and clarifications become follow-ups. Returns (answer, follow_ups).
+    """
+    answer = None
+    follow_ups = []
+    for _, text, label in children:
+        if label == "answer" and not answer:
+            answer = text
+        elif label in {"clarification", "answer"}:
+            follow_ups.append(text)
+    return answer, follow_ups
+
+
+class AnswerStore:
+    def __init__(self, threads: np.ndarray, offsets: np.ndarray, blob: np.ndarray,
+                 labels_generation: int, last_change_id: int):
+        self.threads = threads
+        self.offsets = offsets
+        self.blob = blob
+        self.labels_generation = labels_generation
+        self.last_change_id = last_change_id
+
+    def __len__(self):
+        return len(self.threads)
+
+    @classmethod
+    def build(cls, records: dict, labels_generation: int, last_change_id: int) -> "AnswerStore":
+        """Store from {thread_id: record}; records are dicts as returned by fetch_answer_records."""
+        thread_ids = sorted(records)
+        encoded = [json.dumps(records[thread_id], ensure_ascii=False).encode("utf-8") for thread_id in thread_ids]
+        return cls._from_encoded(thread_ids, encoded, labels_generation, last_change_id)
+
+    @classmethod
+    def _from_encoded(cls, thread_ids: list[str], encoded: list[bytes], labels_generation: int, last_change_id: int):
+        ids = [thread_id.encode("utf-8") for thread_id in thread_ids]
+        threads = np.array(ids, dtype=f"S{max((len(i) for i in ids), default=1)}")
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(threads, offsets, blob, labels_generation, last_change_id)
+
+    def get(self, thread_id: str) -> dict | None:
+        """Stored record for thread_id, or None if the thread has no answer."""
+        key = thread_id.encode("utf-8")
+        i = int(np.searchsorted(self.threads, key))
+        if i == len(self.threads) or self.threads[i] != key:
+            return None
+        return json.loads(self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes())
+
+    def updated(self, records: dict, labels_generation: int, last_change_id: int) -> "AnswerStore":
+        """
+        New store with records ({thread_id: record, or None = no answer any more})
+        applied. Unchanged records are copied as bytes, not re-encoded.
+        """
+        merged = {
+            thread_id.decode("utf-8"): self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes()
+            for i, thread_id in enumerate(self.threads)
+        }
+        for thread_id, record in records.items():
+            if record is None:
+                merged.pop(thread_id, None)
+            else:
+                merged[thread_id] = json.dumps(record, ensure_ascii=False).encode("utf-8")
+        thread_ids = sorted(merged)
+        return AnswerStore._from_encoded(thread_ids, [merged[t] for t in thread_ids],
+                                         labels_generation, last_change_id)
+
+
+def fetch_answer_records(conn, thread_ids: list[str] | None = None) -> dict:
+    """{thread_id: record} for answered threads among thread_ids, or every answered thread when None."""
+    with conn.cursor() as cur:
+        if thread_ids is None:
+            cur.execute(_RECORDS_SQL.format(where=""))
+        else:
+            cur.execute(_RECORDS_SQL.format(where="AND p.message_id = ANY(%s)"), (list(thread_ids),))
+        rows = cur.fetchall()
+
+    threads = {}
+    for parent_id, thread_question, child_id, child_text, label in rows:
+        thread = threads.setdefault(parent_id, {"thread_question": thread_question, "children": []})
+        thread["children"].append((child_id, child_text, label))
+    records = {}
+    for parent_id, thread in threads.items():
+        answer, follow_ups = select_answer(thread["children"])
+        if not answer:
+            continue  # only NULL/empty answer-labelled replies; the SQL path skips these threads too
+        records[parent_id] = {
+            "thread_id": parent_id,
+            "thread_question": thread["thread_question"],
+            "answer": answer,
+            "follow_ups": follow_ups,
+        }
+    return records
+
+
+def read_labels_generation(conn) -> int:
+    with conn.cursor() as cur:
+        cur.execute("SELECT generation FROM cache_generations WHERE name = 'thread_labels'")
+        row = cur.fetchone()
+    return row[0] if row else 0
+
+
+def store_files(prefix: str) -> tuple[str, str]:
+    """(blob .npy, index .npz) paths of the store at prefix."""
+    return prefix + ".npy", prefix + ".npz"
+
+
+def save_answer_store(prefix: str, store: AnswerStore):
+    """Write the blob, then the index; a reader pairing mismatched files is rejected by load_answer_store."""
+    blob_path, index_path = store_files(prefix)
+    for path, write in (
+        (blob_path, lambda f: np.save(f, store.blob)),
+        (index_path, lambda f: np.savez(f, threads=store.threads, offsets=store.offsets,
+                                        labels_generation=store.labels_generation,
+                                        last_change_id=store.last_change_id)),
+    ):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+
+
+def load_answer_store(prefix: str, mmap: bool = True) -> AnswerStore | None:
+    """The store at prefix, or None if it was never built. Raises ValueError if its files disagree."""
+    blob_path, index_path = store_files(prefix)
+    if not os.path.exists(index_path) or not os.path.exists(blob_path):
+        return None
+    with np.load(index_path) as data:
+        threads, offsets = data["threads"], data["offsets"]
+        labels_generation, last_change_id = int(data["labels_generation"]), int(data["last_change_id"])
+    blob = np.load(blob_path, mmap_mode="r" if mmap else None)
+    if len(blob) != offsets[-1]:
+        raise ValueError(f"{blob_path} has {len(blob)} bytes but {index_path} expects {offsets[-1]}")
+    return AnswerStore(threads, offsets, blob, labels_generation, last_change_id)
@@ -0,0 +1,80 @@
+"""
+Embedding throughput vs. worker count, for sizing backfill hosts.
+
+Encodes the same sample of messages with extract_embeddings.py's serial path and
+with its process pool at each worker count, and prints messages/sec and speedup.
+Only encoding is timed (model loading is excluded, DB writes are not done).
+
+Usage:
+    python bench_embedding_workers.py --workers 1 2 4 8 --sample 2000
+    python bench_embedding_workers.py --synthetic --sample 1000   # no DB needed
+    python bench_embedding_workers.py --backend onnx --workers 1 2 4
+"""
+import argparse
+import os
+import time
+
+import psycopg2
+from config import DB_CONFIG, EMBED_BATCH_SIZE, EMBEDDING_BACKEND, EMBEDDING_MODEL_NAME
+from encoder import BACKENDS
+from extract_embeddings import encode_serial, encode_parallel, threads_per_worker
+
+
+def _load_texts(sample: int, synthetic: bool) -> list[tuple]:
+    if synthetic:
+        words = "certificate rotation fails on the staging cluster after upgrading the helm chart".split()
+        return [(f"synthetic-{i}", " ".join(words[i % len(words):] + words[:i % len(words)]) * (1 + i % 4), None)
+                for i in range(sample)]
+    conn = psycopg2.connect(**DB_CONFIG)
+    with conn.cursor() as cur:
+        cur.execute("SELECT message_id, text, created FROM messages ORDER BY created DESC LIMIT %s", (sample,))
+        rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+def _batches(rows, batch_size: int):
+    for start in range(0, len(rows), batch_size):
+        yield rows[start:start + batch_size]
+
+
+def _timed(encoded) -> tuple[int, float]:
+    # Pull the first batch before starting the clock so model loading is not measured
+    next(encoded)
+    start = time.perf_counter()
+    count = sum(len(rows) for rows, _ in encoded)
+    return count, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding throughput per worker count")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4],
+                        help="Worker counts to measure (1 = in-process)")
+    parser.add_argument("--sample", type=int, default=2000, help="Messages to encode per run")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument("--threads-per-worker", type=int, default=0, help="0 = cores / workers")
+    parser.add_argument("--synthetic", action="store_true", help="Use generated texts instead of the messages table")
+    parser.add_argument("--backend", default=EMBEDDING_BACKEND, choices=BACKENDS, help="Encoder implementation")
+    args = parser.parse_args()
+
+    rows = _load_texts(args.sample, args.synthetic)
+    print(f"{len(rows)} messages | batch size {args.batch_size} | {os.cpu_count()} cores | {args.backend}")
+    print(f"{'workers':>8} {'threads':>8} {'msgs/s':>10} {'speedup':>8}")
+
+    baseline = None
+    for workers in args.workers:
+        threads = threads_per_worker(workers, args.threads_per_worker)
+        if workers == 1:
+            encoded = encode_serial(_batches(rows, args.batch_size), args.batch_size,
+                                    EMBEDDING_MODEL_NAME, args.backend)
+        else:
+            encoded = encode_parallel(_batches(rows, args.batch_size), args.batch_size, workers, threads,
+                                      EMBEDDING_MODEL_NAME, args.backend)
+        count, elapsed = _timed(encoded)
+        rate = count / elapsed if elapsed else 0.0
+        baseline = baseline or rate
+        print(f"{workers:>8} {threads:>8} {rate:>10.1f} {rate / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Compare FAISS index types on our embeddings: recall@k against exact search,
+single-query latency percentiles, build time and memory.
+
+Candidates (sized from the corpus): exact Flat, HNSW with several M / efSearch,
+HNSW over 8-bit scalar (SQ8) and product (PQ) quantized storage, IVF-Flat and
+IVF-PQ with several nprobe. Quantized candidates are also measured with exact
+re-ranking of k * --rerank candidates (what the query assistant does with
+FAISS_RERANK_FACTOR), and the report lists memory saved and recall lost against
+HNSW32,Flat. Each row of the report is a complete index_config.json entry, so a
+winner can be copied over as-is; --write-config does that for the fastest
+candidate (by p95) that meets --min-recall.
+
+Vectors come from the embeddings table (parent messages, current model), the
+existing index file (--from-index, exact-storage indexes only) or are generated
+(--synthetic N). --queries of them are held out of the base and used as queries.
+
+Usage:
+    python bench_index_types.py --report index_report.md
+    python bench_index_types.py --from-index faiss_index_finetuned.bin --k 5
+    python bench_index_types.py --synthetic 50000 --write-config
+"""
+import argparse
+import json
+import math
+import time
+
+import faiss
+import numpy as np
+from config import DB_CONFIG, EMBEDDING_MODEL_NAME, INDEX_CONFIG_PATH
+from index_store import build_index, apply_search_config, rerank
+
+
+def _load_vectors(args) -> np.ndarray:
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        # Clustered data, closer to sentence embeddings than uniform noise
+        centers = rng.standard_normal((max(args.synthetic // 100, 8), args.dim)).astype(np.float32)
+        vectors = centers[rng.integers(0, len(centers), args.synthetic)]
+        vectors += 0.3 * rng.standard_normal(vectors.shape).astype(np.float32)
+    elif args.from_index:
+        index = faiss.read_index(args.from_index)
+        vectors = index.reconstruct_n(0, index.ntotal)
+    else:
+        import psycopg2
+        from embedding_io import load_embeddings
+        conn = psycopg2.connect(**DB_CONFIG)
+        _, vectors = load_embeddings(conn, """
+            SELECT m.message_id, e.vector
+            FROM messages m
+            JOIN embeddings e ON m.message_id = e.message_id AND e.model_id = %s
+            WHERE m.parent_id IS NULL
+        """, (EMBEDDING_MODEL_NAME,))
+        conn.close()
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def _candidates(n: int, d: int) -> list[tuple[dict, list[dict]]]:
+    """(build config, [search configs]) pairs; search configs override the build's defaults."""
+    nlist = max(1, min(int(4 * math.sqrt(n)), n // 39))  # faiss wants >= 39 training points per list
+    pq_m = next(m for m in (d // 8, d // 16, d // 32, 1) if m and d % m == 0)
+    pq_bits = 8 if n >= 256 * 39 else 4
+    nprobes = [p for p in (1, 4, 8, 16, 32) if p <= nlist]
+    candidates = [({"factory": "Flat"}, [{}])]
+    for m in (16, 32, 48):
+        candidates.append(({"factory": f"HNSW{m},Flat", "efConstruction": 200},
+                           [{"efSearch": ef} for ef in (16, 32, 64, 100, 200)]))
+    for storage in ("SQ8", f"PQ{pq_m}"):
+        candidates.append(({"factory": f"HNSW32,{storage}", "efConstruction": 200},
+                           [{"efSearch": ef} for ef in (32, 64, 100, 200)]))
+    candidates.append(({"factory": f"IVF{nlist},Flat"}, [{"nprobe": p} for p in nprobes]))
+    candidates.append(({"factory": f"IVF{nlist},PQ{pq_m}x{pq_bits}"}, [{"nprobe": p} for p in nprobes]))
+    return candidates
+
+
+def _recall(I: np.ndarray, ground_truth: np.ndarray, k: int) -> float:
+    hits = sum(len(set(row[:k]) & set(gt[:k])) for row, gt in zip(I, ground_truth))
+    return hits / (k * len(ground_truth))
+
+
+def _search(index, queries: np.ndarray, k: int, exact_vectors=None, rerank_factor: int = 0):
+    if exact_vectors is None:
+        return index.search(queries, k)
+    _, candidates = index.search(queries, k * rerank_factor)
+    return rerank(exact_vectors, queries, candidates, k, index.metric_type)
+
+
+def _latencies_ms(search, queries: np.ndarray) -> np.ndarray:
+    timings = np.empty(len(queries))
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        search(queries[i:i + 1])
+        timings[i] = (time.perf_counter() - start) * 1000
+    return timings
+
+
+def run(args):
+    vectors = _load_vectors(args)
+    rng = np.random.default_rng(1)
+    order = rng.permutation(len(vectors))
+    num_queries = min(args.queries, len(vectors) // 5)
+    queries, base = vectors[order[:num_queries]], np.ascontiguousarray(vectors[order[num_queries:]])
+    n, d = base.shape
+    print(f"📐 base={n} queries={num_queries} dim={d} k={args.k}")
+
+    exact = faiss.IndexFlatIP(d)
+    exact.add(base)
+    _, ground_truth = exact.search(queries, args.k)
+
+    rows = []
+    for build_config, search_configs in _candidates(n, d):
+        build_config = {"metric": "inner_product", **build_config}
+        try:
+            start = time.perf_counter()
+            index = build_index(base, build_config)
+            build_seconds = time.perf_counter() - start
+        except RuntimeError as e:
+            print(f"⏭️ {build_config['factory']}: skipped ({str(e).splitlines()[0]})")
+            continue
+        memory_bytes = faiss.serialize_index(index).nbytes
+        # Quantized storage: also measure re-ranking against the exact vectors (kept in
+        # RAM here; the query assistant memory-maps them, so they are not resident)
+        quantized = any(code in build_config["factory"] for code in ("SQ", "PQ"))
+        rerank_factors = [0, args.rerank] if quantized and args.rerank else [0]
+        for search_config in search_configs:
+            config = {**build_config, **search_config}
+            apply_search_config(index, config)
+            for factor in rerank_factors:
+                exact_vectors = base if factor else None
+                _, I = _search(index, queries, args.k, exact_vectors, factor)
+                latencies = _latencies_ms(lambda q: _search(index, q, args.k, exact_vectors, factor), queries)
+                row = {
+                    "config": config,
+                    "rerank": factor,
+                    "recall": round(_recall(I, ground_truth, args.k), 4),
+                    "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+                    "p95_ms": round(float(np.percentile(latencies, 95)), 4),
+                    "p99_ms": round(float(np.percentile(latencies, 99)), 4),
+                    "build_s": round(build_seconds, 3),
+                    "memory_mb": round(memory_bytes / 2**20, 2),
+                    "rerank_file_mb": round(base.nbytes / 2**20, 2) if factor else 0.0,
+                }
+                rows.append(row)
+                print(f"{_label(config, factor):<40} recall@{args.k}={row['recall']:.3f} p50={row['p50_ms']:.3f}ms "
+                      f"p95={row['p95_ms']:.3f}ms build={row['build_s']:.2f}s mem={row['memory_mb']:.1f}MB")
+    return rows, {"base": n, "queries": num_queries, "dim": d, "k": args.k}
+
+
+def _label(config: dict, rerank_factor: int = 0) -> str:
+    extra = [f"{key}={config[key]}" for key in ("efSearch", "nprobe") if key in config]
+    if rerank_factor:
+        extra.append(f"rerank x{rerank_factor}")
+    return config["factory"] + (f" ({', '.join(extra)})" if extra else "")
+
+
+def _savings(rows: list[dict]) -> list[dict]:
+    """Memory saved and recall lost by each quantized setting vs HNSW32,Flat at the same efSearch."""
+    reference = {row["config"].get("efSearch"): row for row in rows if row["config"]["factory"] == "HNSW32,Flat"}
+    savings = []
+    for row in rows:
+        factory = row["config"]["factory"]
+        base = reference.get(row["config"].get("efSearch"))
+        if base is None or not factory.startswith("HNSW32,") or factory == "HNSW32,Flat":
+            continue
+        savings.append({
+            "label": _label(row["config"], row["rerank"]),
+            "memory_saved_mb": round(base["memory_mb"] - row["memory_mb"], 2),
+            "memory_saved_pct": round(100 * (1 - row["memory_mb"] / base["memory_mb"]), 1),
+            "recall_lost": round(base["recall"] - row["recall"], 4),
+        })
+    return savings
+
+
+def _choose(rows: list[dict], min_recall: float):
+    eligible = [row for row in rows if row["recall"] >= min_recall]
+    return min(eligible, key=lambda row: (row["p95_ms"], row["memory_mb"])) if eligible else None
+
+
+def _write_report(path: str, rows: list[dict], meta: dict, chosen):
+    savings = _savings(rows)
+    if path.endswith(".json"):
+        with open(path, "w") as f:
+            json.dump({"meta": meta, "results": rows, "quantization": savings, "chosen": chosen}, f, indent=2)
+        return
+    lines = [
+        f"# FAISS index comparison (base={meta['base']}, queries={meta['queries']}, dim={meta['dim']})",
+        "",
+        f"| index | recall@{meta['k']} | p50 ms | p95 ms | p99 ms | build s | memory MB | re-rank file MB |",
+        "|---|---|---|---|---|---|---|---|",
+    ]
+    for row in rows:
+        lines.append(f"| {_label(row['config'], row['rerank'])} | {row['recall']:.3f} | {row['p50_ms']:.3f} "
+                     f"| {row['p95_ms']:.3f} | {row['p99_ms']:.3f} | {row['build_s']:.2f} | {row['memory_mb']:.1f} "
+                     f"| {row['rerank_file_mb']:.1f} |")
+    if savings:
+        lines += [
+            "",
+            "## Quantization vs HNSW32,Flat (same efSearch)",
+            "",
+            "| index | memory saved MB | memory saved % | recall lost |",
+            "|---|---|---|---|",
+        ]
+        for saving in savings:
+            lines.append(f"| {saving['label']} | {saving['memory_saved_mb']:.1f} | {saving['memory_saved_pct']:.1f} "
+                         f"| {saving['recall_lost']:+.4f} |")
+    if chosen:
+        lines += ["", f"Chosen: `{json.dumps(chosen['config'])}`"
+                      + (f" with FAISS_RERANK_FACTOR={chosen['rerank']}" if chosen["rerank"] else "")]
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FAISS index type comparison")
+    parser.add_argument("--k", type=int, default=5, help="Neighbours per query (query_service uses 5)")
+    parser.add_argument("--queries", type=int, default=200, help="Vectors held out as queries")
+    parser.add_argument("--from-index", type=str, default=None, help="Read vectors from an exact-storage index file")
+    parser.add_argument("--synthetic", type=int, default=0, help="Generate N vectors instead of reading them")
+    parser.add_argument("--dim", type=int, default=768, help="Dimension for --synthetic")
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads during the benchmark")
+    parser.add_argument("--rerank", type=int, default=4,
+                        help="Re-rank k * N candidates of quantized indexes against exact vectors (0 = off)")
+    parser.add_argument("--min-recall", type=float, default=0.95)
+    parser.add_argument("--report", type=str, default="index_report.md", help=".md or .json")
+    parser.add_argument("--write-config", action="store_true",
+                        help=f"Write the chosen configuration to {INDEX_CONFIG_PATH}")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+    rows, meta = run(args)
+    chosen = _choose(rows, args.min_recall)
+    _write_report(args.report, rows, meta, chosen)
+    print(f"📝 Report written to {args.report}")
+    if chosen is None:
+        print(f"⚠️ No candidate reached recall {args.min_recall}")
+    else:
+        print(f"🏆 Fastest with recall >= {args.min_recall}: {_label(chosen['config'], chosen['rerank'])}")
+        if args.write_config:
+            with open(INDEX_CONFIG_PATH, "w") as f:
+                json.dump(chosen["config"], f, indent=2)
+                f.write("\n")
+            print(f"✅ Wrote {INDEX_CONFIG_PATH}; rebuild with setup_faiss_index_and_idmap.py")
+            if chosen["rerank"]:
+                print(f"ℹ️ Serve with FAISS_RERANK_FACTOR={chosen['rerank']}")
@@ -0,0 +1,161 @@
+"""
+Benchmark the pgvector search backend (SEARCH_BACKEND=pgvector) against the FAISS
+path the query assistant uses today, on the live corpus.
+
+For each efSearch both paths answer the same queries, end to end as served:
+    faiss     FAISS search of the index file, then the thread/label hydration query
+    pgvector  one statement: HNSW search on embeddings.vector joined with threads/labels
+and are scored on recall@k of parent threads against exact NumPy search over the
+embeddings table, plus p50/p95 latency. pgvector wins when it matches FAISS recall
+(within --recall-tolerance) at no worse p95; then the index files and their sync
+jobs can go.
+
+Queries are parent embeddings with a little noise, so the exact neighbour is not
+always the query itself. Requires the embeddings_vector_hnsw migration; the plan of
+one query is checked so a sequential scan is reported instead of timed silently.
+
+Usage:
+    python bench_pgvector.py
+    python bench_pgvector.py --k 5 --ef 40 100 200 --queries 500
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+import psycopg2
+from config import DB_CONFIG, EMBEDDING_MODEL_NAME, FAISS_INDEX_PATH, FAISS_ID_MAP_PATH, PGVECTOR_ITERATIVE_SCAN
+from embedding_io import load_embeddings
+from id_map import load_id_map
+from index_store import exact_search, search_params as faiss_search_params
+from pgvector_search import search_sql, search_params
+from vector_store import PgvectorStore
+
+# Same statement as query_service._hydrate_threads
+_HYDRATE_SQL = """
+    SELECT p.message_id, p.text, c.message_id, c.text, l.label
+    FROM messages p
+    LEFT JOIN messages c ON c.parent_id = p.message_id
+    LEFT JOIN thread_labels l ON l.message_id = c.message_id
+    WHERE p.message_id = ANY(%s)
+    ORDER BY p.message_id, c.created
+"""
+
+
+def _queries(vectors: np.ndarray, count: int, noise: float) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(len(vectors), min(count, len(vectors)), replace=False)]
+    queries = queries + noise * rng.standard_normal(queries.shape).astype(np.float32)
+    faiss.normalize_L2(queries)
+    return queries
+
+
+def _faiss_search(cur, index, id_map, query_vec: np.ndarray, k: int, ef: int) -> list[str]:
+    _, I = index.search(query_vec[None], k, params=faiss_search_params(index, ef_search=ef))
+    parent_ids = [msg_id for msg_id in id_map.resolve(I)[0] if msg_id is not None]
+    cur.execute(_HYDRATE_SQL, (parent_ids,))
+    cur.fetchall()
+    return parent_ids
+
+
+def _pgvector_search(store, query_vec: np.ndarray, k: int, ef: int) -> list[str]:
+    # The same PgvectorStore statements the query assistant serves with SEARCH_BACKEND=pgvector
+    parent_ids, _, _ = store.search_threads(query_vec[None], k, ef)[0]
+    return parent_ids
+
+
+def _uses_hnsw(cur, query_vec: np.ndarray, k: int) -> bool:
+    cur.execute("EXPLAIN " + search_sql(EMBEDDING_MODEL_NAME), search_params(query_vec, k))
+    return any("ix_embeddings_vector_hnsw" in row[0] for row in cur.fetchall())
+
+
+def _measure(search, conn, queries: np.ndarray, truth: list[set], k: int):
+    latencies = np.empty(len(queries))
+    hits = 0
+    with conn.cursor() as cur:
+        for i, query_vec in enumerate(queries):
+            start = time.perf_counter()
+            parent_ids = search(cur, query_vec)
+            latencies[i] = (time.perf_counter() - start) * 1000
+            conn.rollback()  # end the transaction, dropping the set_config(..., true) settings
+            hits += len(set(parent_ids[:k]) & truth[i])
+    return {
+        "recall": hits / (k * len(queries)),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+    }
+
+
+def run(args):
+    conn = psycopg2.connect(**DB_CONFIG)
+    message_ids, vectors = load_embeddings(conn, """
+        SELECT m.message_id, e.vector
+        FROM messages m
+        JOIN embeddings e ON m.message_id = e.message_id AND e.model_id = %s
+        WHERE m.parent_id IS NULL
+    """, (EMBEDDING_MODEL_NAME,))
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    queries = _queries(vectors, args.queries, args.noise)
+    _, I = exact_search(vectors, queries, args.k)
+    truth = [{message_ids[i] for i in row if i >= 0} for row in I]
+    print(f"📐 corpus={len(vectors)} parents, queries={len(queries)}, k={args.k}")
+
+    with conn.cursor() as cur:
+        if not _uses_hnsw(cur, queries[0], args.k):
+            print("⚠️ The plan does not use ix_embeddings_vector_hnsw; pgvector timings are for a sequential scan. "
+                  "Run the embeddings_vector_hnsw migration and ANALYZE embeddings.")
+    conn.rollback()
+
+    index = faiss.read_index(FAISS_INDEX_PATH)
+    id_map = load_id_map(FAISS_ID_MAP_PATH)
+    store = PgvectorStore(conn, EMBEDDING_MODEL_NAME, iterative_scan=PGVECTOR_ITERATIVE_SCAN)
+    if index.ntotal != len(vectors):
+        print(f"⚠️ {FAISS_INDEX_PATH} holds {index.ntotal} vectors, the embeddings table {len(vectors)}; "
+              "FAISS recall includes its sync lag")
+
+    rows = []
+    for ef in args.ef:
+        ef = max(ef, args.k)
+        for backend, search in (
+            ("faiss", lambda cur, q: _faiss_search(cur, index, id_map, q, args.k, ef)),
+            ("pgvector", lambda cur, q: _pgvector_search(store, q, args.k, ef)),
+        ):
+            row = {"backend": backend, "ef": ef, **_measure(search, conn, queries, truth, args.k)}
+            rows.append(row)
+            print(f"{backend:<9} ef={ef:<4} recall@{args.k}={row['recall']:.3f} "
+                  f"p50={row['p50_ms']:.2f}ms p95={row['p95_ms']:.2f}ms")
+    conn.close()
+    return rows
+
+
+def _verdict(rows: list[dict], tolerance: float):
+    """Per efSearch, whether pgvector matches FAISS recall at no worse p95."""
+    by_ef = {}
+    for row in rows:
+        by_ef.setdefault(row["ef"], {})[row["backend"]] = row
+    wins = []
+    for ef, pair in by_ef.items():
+        faiss_row, pg_row = pair["faiss"], pair["pgvector"]
+        if pg_row["recall"] >= faiss_row["recall"] - tolerance and pg_row["p95_ms"] <= faiss_row["p95_ms"]:
+            wins.append(ef)
+    return wins
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="pgvector vs FAISS search benchmark")
+    parser.add_argument("--k", type=int, default=5, help="Threads per query (query_service uses 5)")
+    parser.add_argument("--ef", type=int, nargs="+", default=[40, 100, 200], help="efSearch values to compare")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.05, help="Gaussian noise added to sampled query vectors")
+    parser.add_argument("--recall-tolerance", type=float, default=0.01)
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads during the benchmark")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+    wins = _verdict(run(args), args.recall_tolerance)
+    if wins:
+        print(f"🏆 pgvector matches FAISS recall at no worse p95 for efSearch {wins}; "
+              f"serve with SEARCH_BACKEND=pgvector PGVECTOR_EF_SEARCH={min(wins)}")
+    else:
+        print("❌ pgvector does not beat the FAISS path at this corpus size; keep SEARCH_BACKEND=faiss")
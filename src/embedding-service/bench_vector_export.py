@@ -0,0 +1,94 @@
+"""
+Vector export benchmark: text rows + eval() (the old setup_faiss_index_and_idmap.py
+path) vs. binary COPY decoded into a preallocated float32 matrix (embedding_io).
+
+Usage:
+    python bench_vector_export.py                    # against the embeddings table
+    python bench_vector_export.py --synthetic 20000  # decode cost only, no DB needed
+"""
+import argparse
+import struct
+import time
+
+import numpy as np
+import psycopg2
+from config import DB_CONFIG, EMBEDDING_MODEL_NAME
+from embedding_io import load_embeddings, _BinaryCopyDecoder
+
+QUERY = """
+    SELECT m.message_id, e.vector
+    FROM messages m
+    JOIN embeddings e ON m.message_id = e.message_id AND e.model_id = %s
+    ORDER BY m.created
+"""
+
+
+def _text_path(conn):
+    with conn.cursor() as cur:
+        cur.execute(QUERY, (EMBEDDING_MODEL_NAME,))
+        rows = cur.fetchall()
+    message_ids = [row[0] for row in rows]
+    vectors = np.array([np.array(eval(row[1]), dtype=np.float32) for row in rows])
+    return message_ids, vectors
+
+
+def _bench_db(repeats: int):
+    conn = psycopg2.connect(**DB_CONFIG)
+    results = {}
+    for name, load in [("text + eval", lambda: _text_path(conn)),
+                       ("binary COPY", lambda: load_embeddings(conn, QUERY, (EMBEDDING_MODEL_NAME,)))]:
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            ids, vectors = load()
+            timings.append(time.perf_counter() - start)
+        results[name] = (min(timings), vectors)
+        print(f"{name:>14}: {len(ids)} vectors in {min(timings):.3f}s (best of {repeats})")
+    conn.close()
+    text_vectors = results["text + eval"][1]
+    binary_vectors = results["binary COPY"][1]
+    print(f"{'max abs diff':>14}: {np.abs(text_vectors - binary_vectors).max() if len(text_vectors) else 0.0:.2e}")
+    print(f"{'speedup':>14}: {results['text + eval'][0] / results['binary COPY'][0]:.1f}x")
+
+
+def _bench_synthetic(rows: int, dim: int):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((rows, dim)).astype(np.float32)
+    ids = [f"synthetic-message-{i:08d}" for i in range(rows)]
+
+    # What psycopg2 hands back for a vector column without an adapter
+    text_rows = [(msg_id, "[" + ",".join(map(str, vec.tolist())) + "]") for msg_id, vec in zip(ids, vectors)]
+    stream = bytearray(b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0))
+    for msg_id, vec in zip(ids, vectors):
+        raw_id = msg_id.encode("utf-8")
+        raw_vec = struct.pack(">hh", dim, 0) + vec.astype(">f4").tobytes()
+        stream += struct.pack(">hi", 2, len(raw_id)) + raw_id + struct.pack(">i", len(raw_vec)) + raw_vec
+    stream += struct.pack(">h", -1)
+
+    start = time.perf_counter()
+    np.array([np.array(eval(text), dtype=np.float32) for _, text in text_rows])
+    text_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    decoder = _BinaryCopyDecoder(rows, dim)
+    chunk = 1 << 20
+    for offset in range(0, len(stream), chunk):
+        decoder.write(stream[offset:offset + chunk])
+    binary_seconds = time.perf_counter() - start
+    assert np.array_equal(decoder.vectors[:rows], vectors)
+
+    print(f"{'text + eval':>14}: {rows} x {dim} decoded in {text_seconds:.3f}s")
+    print(f"{'binary COPY':>14}: {rows} x {dim} decoded in {binary_seconds:.3f}s")
+    print(f"{'speedup':>14}: {text_seconds / binary_seconds:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Text vs binary vector export")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--synthetic", type=int, default=0, help="Decode N generated rows instead of querying the DB")
+    parser.add_argument("--dim", type=int, default=768)
+    args = parser.parse_args()
+    if args.synthetic:
+        _bench_synthetic(args.synthetic, args.dim)
+    else:
+        _bench_db(args.repeats)
@@ -11,4 +11,118 @@ DB_CONFIG = {
 
 FAISS_INDEX_PATH="/Users/pperiasa/git/ai-assistant/src/embedding-service/faiss_index_finetuned.bin"
 #FAISS_ID_MAP_PATH="/Users/pperiasa/git/ai-assistant/src/embedding-service/faiss_index_finetuned.ids"
-FAISS_ID_MAP_PATH="/Users/pperiasa/git/ai-assistant/src/embedding-service/faiss_id_map.pkl"
\ No newline at end of file
+#FAISS_ID_MAP_PATH="/Users/pperiasa/git/ai-assistant/src/embedding-service/faiss_id_map.pkl"
+FAISS_ID_MAP_PATH="/Users/pperiasa/git/ai-assistant/src/embedding-service/faiss_id_map.npy"
+# Deleted/merged thread mask and updater bookkeeping, next to the index
+FAISS_TOMBSTONES_PATH = os.path.splitext(FAISS_INDEX_PATH)[0] + ".tombstones.npy"
+FAISS_INDEX_STATE_PATH = os.path.splitext(FAISS_INDEX_PATH)[0] + ".state.json"
+# Exact float32 vectors for re-ranking a quantized (SQ8/PQ) index, aligned with index positions
+FAISS_VECTORS_PATH = os.path.splitext(FAISS_INDEX_PATH)[0] + ".vectors.npy"
+# Space and creation time per index position, for filtered search
+FAISS_METADATA_PATH = os.path.splitext(FAISS_INDEX_PATH)[0] + ".metadata.npz"
+# Whole-thread index: parent and reply messages all embedded, hits aggregated per thread
+# (setup_thread_index.py). Same sibling files as the parent index, plus the message → thread map.
+THREAD_INDEX_PATH = os.path.join(os.path.dirname(FAISS_INDEX_PATH), "faiss_index_threads.bin")
+THREAD_ID_MAP_PATH = os.path.splitext(THREAD_INDEX_PATH)[0] + ".ids.npy"
+THREAD_TOMBSTONES_PATH = os.path.splitext(THREAD_INDEX_PATH)[0] + ".tombstones.npy"
+THREAD_INDEX_STATE_PATH = os.path.splitext(THREAD_INDEX_PATH)[0] + ".state.json"
+THREAD_VECTORS_PATH = os.path.splitext(THREAD_INDEX_PATH)[0] + ".vectors.npy"
+THREAD_METADATA_PATH = os.path.splitext(THREAD_INDEX_PATH)[0] + ".metadata.npz"
+THREAD_MAP_PATH = os.path.splitext(THREAD_INDEX_PATH)[0] + ".threads.npz"
+# BM25 index over thread text, the lexical leg of hybrid search (lexical_index.py)
+LEXICAL_INDEX_PATH = os.path.splitext(FAISS_INDEX_PATH)[0] + ".lexical.npz"
+# Precomputed thread answers (answer_store.py): <prefix>.npy records + <prefix>.npz index
+ANSWER_STORE_PATH = os.path.splitext(FAISS_INDEX_PATH)[0] + ".answers"
+# Index type and build/search parameters used by the build and update scripts
+INDEX_CONFIG_PATH = os.getenv("INDEX_CONFIG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "index_config.json"))
+
+# Query assistant runtime
+# Threads used for CPU-bound work (query encoding, FAISS search) off the event loop
+QUERY_EXECUTOR_WORKERS = int(os.getenv("QUERY_EXECUTOR_WORKERS", "4"))
+
+# Query assistant DB connection pool (psycopg_pool)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+# Seconds a request may wait for a free connection before failing
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+
+# Query assistant caches (query vector + retrieval result)
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "3600"))
+# How often to check cache_generations for thread_labels changes
+LABELS_GENERATION_POLL_SECONDS = float(os.getenv("LABELS_GENERATION_POLL_SECONDS", "5"))
+
+# Largest batch accepted by the query assistant's POST /api/batch
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "1000"))
+
+# Query engine loading
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/all-mpnet-base-v2")
+# Encoder implementation (see encoder.py): "sentence-transformers" or "onnx"
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "sentence-transformers")
+# export_onnx_encoder.py writes one subdirectory per model here
+ONNX_MODELS_DIR = os.getenv("ONNX_MODELS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "onnx"))
+# Index served by the query assistant: "parent" (one vector per thread root) or
+# "thread" (every message; hits aggregated into thread scores, see thread_map.py)
+INDEX_MODE = os.getenv("INDEX_MODE", "parent")
+# Thread mode: score = max | mean | topk_sum of a thread's message hits (topk_sum adds its
+# best THREAD_AGGREGATION_TOP_N), over k * THREAD_CANDIDATE_FACTOR message candidates
+THREAD_AGGREGATION = os.getenv("THREAD_AGGREGATION", "max")
+THREAD_AGGREGATION_TOP_N = int(os.getenv("THREAD_AGGREGATION_TOP_N", "3"))
+THREAD_CANDIDATE_FACTOR = int(os.getenv("THREAD_CANDIDATE_FACTOR", "4"))
+# Query assistant vector store (vector_store.py): "faiss" (the index files above),
+# "exact" (the same vectors as an in-memory matrix, brute force; best for corpora of a
+# few thousand threads) or "pgvector" (HNSW index inside Postgres, searched and joined
+# with threads/labels in one statement; see pgvector_search.py and bench_pgvector.py).
+# pgvector serves parent threads only. verify_vector_stores.py compares them.
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "faiss")
+# pgvector hnsw.ef_search when the request gives none, and iterative index scans
+# (pgvector >= 0.8) so joins and filters still yield k threads
+PGVECTOR_EF_SEARCH = int(os.getenv("PGVECTOR_EF_SEARCH", "100"))
+PGVECTOR_ITERATIVE_SCAN = os.getenv("PGVECTOR_ITERATIVE_SCAN", "1") == "1"
+# Memory-map the FAISS index instead of reading it fully into RAM
+FAISS_MMAP = os.getenv("FAISS_MMAP", "0") == "1"
+# Load model/index in a background thread so the web app starts serving /healthz immediately
+ENGINE_BACKGROUND_LOAD = os.getenv("ENGINE_BACKGROUND_LOAD", "1") == "1"
+# Poll the FAISS index files and hot swap them when they change (0 disables)
+INDEX_WATCH_INTERVAL_SECONDS = float(os.getenv("INDEX_WATCH_INTERVAL_SECONDS", "0"))
+
+# extract_embeddings.py: rows pulled per round trip from the server-side cursor,
+# texts per model.encode() call, and rows per committed chunk
+EMBED_FETCH_SIZE = int(os.getenv("EMBED_FETCH_SIZE", "2000"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_COMMIT_ROWS = int(os.getenv("EMBED_COMMIT_ROWS", "1000"))
+# Incremental runs re-check this many ingest_seq values below the watermark, for rows
+# whose inserting transaction committed after a run had already read past them
+EMBED_SEQ_LOOKBACK = int(os.getenv("EMBED_SEQ_LOOKBACK", "10000"))
+# Parallel backfill: encoder processes and torch threads per process (0 = cores / workers)
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "1"))
+EMBED_THREADS_PER_WORKER = int(os.getenv("EMBED_THREADS_PER_WORKER", "0"))
+
+# Quantized indexes fetch k * FAISS_RERANK_FACTOR candidates for exact re-ranking (0 disables)
+FAISS_RERANK_FACTOR = int(os.getenv("FAISS_RERANK_FACTOR", "4"))
+
+# update_faiss_index.py: rebuild (compact) the index once this share of positions is tombstoned
+FAISS_COMPACT_TOMBSTONE_RATIO = float(os.getenv("FAISS_COMPACT_TOMBSTONE_RATIO", "0.2"))
+
+# Query assistant search effort: per-request k / efSearch are clamped to these caps.
+# SEARCH_EF_DEFAULT=0 uses the efSearch stored in the index file.
+SEARCH_K_DEFAULT = int(os.getenv("SEARCH_K_DEFAULT", "5"))
+SEARCH_K_MAX = int(os.getenv("SEARCH_K_MAX", "50"))
+SEARCH_EF_DEFAULT = int(os.getenv("SEARCH_EF_DEFAULT", "0"))
+SEARCH_EF_MAX = int(os.getenv("SEARCH_EF_MAX", "512"))
+# Load shedding: once this many searches are in flight, efSearch is scaled down
+# proportionally (never below SEARCH_EF_MIN or k). 0 disables shedding.
+SEARCH_SHED_IN_FLIGHT = int(os.getenv("SEARCH_SHED_IN_FLIGHT", "16"))
+SEARCH_EF_MIN = int(os.getenv("SEARCH_EF_MIN", "16"))
+# Filtered searches admitting at most this many vectors scan them exactly instead of
+# walking the HNSW graph, which degrades when most neighbours are filtered out
+SEARCH_FILTER_EXACT_MAX = int(os.getenv("SEARCH_FILTER_EXACT_MAX", "20000"))
+
+# Hybrid search: fuse BM25 hits with FAISS hits by reciprocal rank (score 1 / (HYBRID_RRF_K + rank)).
+# Threads found only by BM25 are returned with faiss_score 0.0 (see query_service._fuse)
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+# Lexical latency budget: postings scored per query term set (rarest terms first, 0 = no cap),
+# and the per-query time above which a search counts as over budget in /metrics
+LEXICAL_MAX_POSTINGS = int(os.getenv("LEXICAL_MAX_POSTINGS", "100000"))
+LEXICAL_BUDGET_MS = float(os.getenv("LEXICAL_BUDGET_MS", "5"))
@@ -0,0 +1,109 @@
+"""
+Bulk export of (message_id, vector) rows from Postgres into a float32 matrix.
+
+Rows are streamed with COPY ... TO STDOUT (FORMAT binary). pgvector's binary
+form is int16 dim, int16 unused, then dim big-endian float4s, so each vector is
+copied straight from the wire buffer into a preallocated row of the output
+matrix. No Python float or list objects are created.
+"""
+import struct
+
+import numpy as np
+
+_COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+_HEADER_LEN = len(_COPY_SIGNATURE) + 8  # signature, int32 flags, int32 extension length
+_INT16 = struct.Struct(">h")
+_INT32 = struct.Struct(">i")
+_VECTOR_HEADER = struct.Struct(">hh")
+
+
+class _BinaryCopyDecoder:
+    """File-like sink for cursor.copy_expert() that decodes rows as chunks arrive."""
+
+    def __init__(self, expected_rows: int, dim: int):
+        self.dim = dim
+        self.vectors = np.empty((max(expected_rows, 1), dim), dtype=np.float32)
+        self.message_ids = []
+        self._buf = bytearray()
+        self._pos = 0
+        self._header_done = False
+        self.finished = False
+        self._row_dtype = np.dtype(">f4")
+
+    def write(self, data):
+        self._buf += data
+        self._parse()
+        # Drop consumed bytes so the buffer stays around one COPY chunk in size
+        del self._buf[:self._pos]
+        self._pos = 0
+        return len(data)
+
+    def _parse(self):
+        buf = self._buf
+        if not self._header_done:
+            if len(buf) < _HEADER_LEN:
+                return
+            if bytes(buf[:len(_COPY_SIGNATURE)]) != _COPY_SIGNATURE:
+                raise ValueError("Not a PostgreSQL binary COPY stream")
+            extension_len = _INT32.unpack_from(buf, len(_COPY_SIGNATURE) + 4)[0]
+            if len(buf) < _HEADER_LEN + extension_len:
+                return
+            self._pos = _HEADER_LEN + extension_len
+            self._header_done = True
+
+        vector_bytes = 4 + 4 * self.dim
+        while True:
+            pos = self._pos
+            if len(buf) - pos < 2:
+                return
+            fields = _INT16.unpack_from(buf, pos)[0]
+            if fields == -1:  # trailer
+                self._pos = pos + 2
+                self.finished = True
+                return
+            if fields != 2:
+                raise ValueError(f"Expected 2 columns (message_id, vector), got {fields}")
+
+            # message_id: int32 length + utf-8 bytes
+            if len(buf) - pos < 6:
+                return
+            id_len = _INT32.unpack_from(buf, pos + 2)[0]
+            vec_at = pos + 6 + id_len
+            # Check the vector length as soon as it arrives: a wrong dim must fail, not wait for bytes
+            if len(buf) - vec_at < 4:
+                return
+            vec_len = _INT32.unpack_from(buf, vec_at)[0]
+            if vec_len != vector_bytes:
+                raise ValueError(f"Vector field is {vec_len} bytes, expected {vector_bytes} for dim {self.dim}")
+            if len(buf) - vec_at < 4 + vector_bytes:
+                return
+            dim, _ = _VECTOR_HEADER.unpack_from(buf, vec_at + 4)
+            if dim != self.dim:
+                raise ValueError(f"Vector has dimension {dim}, expected {self.dim}")
+
+            row = len(self.message_ids)
+            if row == len(self.vectors):
+                # More rows than counted (concurrent inserts); grow geometrically
+                self.vectors = np.resize(self.vectors, (len(self.vectors) * 2, self.dim))
+            # Big-endian view over the wire bytes; assignment byte-swaps into float32
+            self.vectors[row] = np.frombuffer(buf, dtype=self._row_dtype, count=self.dim, offset=vec_at + 8)
+            self.message_ids.append(bytes(buf[pos + 6:vec_at]).decode("utf-8"))
+            self._pos = vec_at + 4 + vector_bytes
+
+
+def load_embeddings(conn, query: str, params=None, dim: int = 768):
+    """
+    Run query (which must select exactly message_id, vector) and return
+    (message_ids, float32 matrix of shape (n, dim)) in query order.
+    """
+    with conn.cursor() as cur:
+        bound = cur.mogrify(query, params).decode("utf-8")
+        cur.execute(f"SELECT COUNT(*) FROM ({bound}) AS q")
+        expected = cur.fetchone()[0]
+        decoder = _BinaryCopyDecoder(expected, dim)
+        cur.copy_expert(f"COPY ({bound}) TO STDOUT WITH (FORMAT binary)", decoder, size=1 << 20)
+    if not decoder.finished:
+        raise ValueError(f"COPY stream ended without its trailer after {len(decoder.message_ids)} rows")
+    rows = len(decoder.message_ids)
+    return decoder.message_ids, decoder.vectors[:rows]
+
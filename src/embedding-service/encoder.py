@@ -0,0 +1,99 @@
+"""
+Text encoders shared by the query assistant and the embedding jobs.
+
+Every backend has the same interface:
+    encoder.dimension                                   -> int
+    encoder.encode(texts, batch_size=32, normalize=False) -> float32 array (len(texts), dimension)
+
+Backends (EMBEDDING_BACKEND):
+- "sentence-transformers": the PyTorch model, the reference implementation.
+- "onnx": the same transformer exported by export_onnx_encoder.py and run with
+  ONNX Runtime, by default the int8 dynamically quantized graph. Pooling and
+  normalization are replayed in NumPy from the exported encoder.json. Run
+  verify_onnx_encoder.py to check its speedup and drift before switching.
+
+Backend libraries are imported when an encoder is created, so only the one in use
+needs to be installed.
+"""
+import json
+import os
+
+import numpy as np
+from config import ONNX_MODELS_DIR
+
+BACKENDS = ("sentence-transformers", "onnx")
+
+
+class SentenceTransformerEncoder:
+    def __init__(self, model_name: str, threads: int = 0):
+        if threads > 0:
+            import torch
+            torch.set_num_threads(threads)
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: list[str], batch_size: int = 32, normalize: bool = False) -> np.ndarray:
+        vectors = self.model.encode(texts, batch_size=batch_size, normalize_embeddings=normalize)
+        return np.asarray(vectors, dtype=np.float32)
+
+
+class OnnxEncoder:
+    def __init__(self, model_dir: str, threads: int = 0, quantized: bool = True):
+        try:
+            import onnxruntime as ort
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise ImportError("The onnx encoder backend needs onnxruntime and transformers installed") from e
+        with open(os.path.join(model_dir, "encoder.json")) as f:
+            self.meta = json.load(f)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        model_file = self.meta["quantized_file" if quantized else "model_file"]
+        self.session = ort.InferenceSession(os.path.join(model_dir, model_file), options,
+                                            providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.dimension = self.meta["dimension"]
+
+    def _pool(self, hidden: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        if self.meta["pooling"] == "cls":
+            return hidden[:, 0]
+        mask = mask[..., None].astype(np.float32)
+        return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self, texts: list[str], batch_size: int = 32, normalize: bool = False) -> np.ndarray:
+        vectors = np.empty((len(texts), self.dimension), dtype=np.float32)
+        # Longest first, like sentence-transformers, so each batch pads to similar lengths
+        order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+        for start in range(0, len(texts), batch_size):
+            rows = order[start:start + batch_size]
+            tokens = self.tokenizer([texts[i] for i in rows], padding=True, truncation=True,
+                                    max_length=self.meta["max_seq_length"], return_tensors="np")
+            feeds = {name: tokens[name].astype(np.int64) for name in self.input_names}
+            hidden = self.session.run(None, feeds)[0]
+            vectors[rows] = self._pool(hidden, tokens["attention_mask"])
+        if normalize or self.meta["normalize"]:
+            vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors
+
+
+def onnx_model_dir(model_name: str) -> str:
+    return os.path.join(ONNX_MODELS_DIR, model_name.replace("/", "__"))
+
+
+def load_encoder(model_name: str, backend: str = "sentence-transformers", threads: int = 0,
+                 quantized: bool = True, onnx_dir: str | None = None):
+    """Create the encoder for backend. threads > 0 caps the backend's intra-op threads."""
+    if backend == "sentence-transformers":
+        return SentenceTransformerEncoder(model_name, threads)
+    if backend == "onnx":
+        onnx_dir = onnx_dir or onnx_model_dir(model_name)
+        encoder = OnnxEncoder(onnx_dir, threads, quantized)
+        if encoder.meta["model_name"] != model_name:
+            raise ValueError(f"{onnx_dir} was exported from {encoder.meta['model_name']}, not {model_name}")
+        return encoder
+    raise ValueError(f"Unknown encoder backend {backend!r}; expected one of {BACKENDS}")
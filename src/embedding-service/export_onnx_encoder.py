@@ -0,0 +1,104 @@
+"""
+Export a sentence-transformers model for the "onnx" encoder backend (encoder.py).
+
+Writes to onnx/<model name>/ (or --out):
+    model.onnx          transformer graph, float32
+    model_int8.onnx     same graph with int8 dynamic quantization of the weights
+                        (activations are quantized per batch at run time)
+    tokenizer files
+    encoder.json        pooling / normalization / max length, replayed by OnnxEncoder
+
+Check the result with verify_onnx_encoder.py before setting EMBEDDING_BACKEND=onnx.
+
+Usage:
+    python export_onnx_encoder.py
+    python export_onnx_encoder.py --model sentence-transformers/all-MiniLM-L12-v2 --opset 17
+"""
+import argparse
+import json
+import os
+
+import torch
+from sentence_transformers import SentenceTransformer
+from onnxruntime.quantization import quantize_dynamic, QuantType
+from config import EMBEDDING_MODEL_NAME
+from encoder import onnx_model_dir
+
+
+class _HiddenStates(torch.nn.Module):
+    """Transformer forward returning last_hidden_state only, for a plain ONNX output."""
+
+    def __init__(self, transformer):
+        super().__init__()
+        self.transformer = transformer
+
+    def forward(self, input_ids, attention_mask):
+        return self.transformer(input_ids=input_ids, attention_mask=attention_mask)[0]
+
+
+def _pooling_mode(model: SentenceTransformer) -> str:
+    pooling = next(module for module in model if type(module).__name__ == "Pooling")
+    config = pooling.get_config_dict()
+    # Older sentence-transformers store one pooling_mode_<name> flag per mode
+    mode = config.get("pooling_mode") or "+".join(
+        key[len("pooling_mode_"):] for key, enabled in config.items() if key.startswith("pooling_mode_") and enabled
+    )
+    modes = {"cls": "cls", "cls_token": "cls", "mean": "mean", "mean_tokens": "mean"}
+    if mode not in modes:
+        raise SystemExit(f"❌ Unsupported pooling {mode!r}; only mean and cls are replayed")
+    return modes[mode]
+
+
+def export(model_name: str, out_dir: str, opset: int):
+    os.makedirs(out_dir, exist_ok=True)
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+    pooling = _pooling_mode(model)
+
+    model_path = os.path.join(out_dir, "model.onnx")
+    quantized_path = os.path.join(out_dir, "model_int8.onnx")
+    sample = tokenizer(["export sample sentence"], return_tensors="pt")
+    print(f"📦 Exporting {model_name} to {model_path}")
+    with torch.no_grad():
+        torch.onnx.export(
+            _HiddenStates(transformer),
+            (sample["input_ids"], sample["attention_mask"]),
+            model_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=opset,
+            dynamo=False,  # TorchScript exporter: no onnxscript dependency, stable dynamic axes
+        )
+
+    print(f"🗜️ Quantizing weights to int8: {quantized_path}")
+    quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+
+    tokenizer.save_pretrained(out_dir)
+    meta = {
+        "model_name": model_name,
+        "dimension": model.get_sentence_embedding_dimension(),
+        "max_seq_length": model.max_seq_length,
+        "pooling": pooling,
+        "normalize": any(type(module).__name__ == "Normalize" for module in model),
+        "model_file": "model.onnx",
+        "quantized_file": "model_int8.onnx",
+    }
+    with open(os.path.join(out_dir, "encoder.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    size_mb = {path: os.path.getsize(path) / 2**20 for path in (model_path, quantized_path)}
+    print(f"✅ Exported to {out_dir} (float32 {size_mb[model_path]:.0f}MB, int8 {size_mb[quantized_path]:.0f}MB)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a sentence-transformers model to ONNX + int8")
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    parser.add_argument("--out", default=None, help="Output directory (default: onnx/<model>)")
+    parser.add_argument("--opset", type=int, default=17)
+    args = parser.parse_args()
+    export(args.model, args.out or onnx_model_dir(args.model), args.opset)
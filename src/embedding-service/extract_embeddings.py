@@ -1,41 +1,302 @@
+"""
+Incrementally embed messages for one embedding model.
+
+Each embedding row stores the model_id that produced it and an md5 content_hash of
+the text it was built from. Runs are driven by a watermark per model in
+embedding_watermarks over messages.ingest_seq, which follows insertion order (not
+Webex `created`: the loader pages newest-first and backfills rooms later) and is
+bumped whenever a message's text changes. A normal run only reads messages past the
+watermark, minus EMBED_SEQ_LOOKBACK, and skips any whose hash already matches.
+
+What an incremental run can miss: a message whose inserting transaction commits
+after a run has read more than EMBED_SEQ_LOOKBACK sequence values past it (sequence
+values are handed out at insert time, not at commit). The loader commits page by
+page, so that needs a very long open transaction; --rescan catches it either way.
+
+Modes:
+    (default)   new messages since the watermark
+    --rescan    all messages whose embedding is missing or whose text changed
+                (hash mismatch); does not move the watermark
+    --reembed   every message again for --model, e.g. after switching models.
+                Rows for other models are untouched, so serving keeps using the
+                current model's vectors while this runs. Resumable via its own
+                watermark; runs at lowered CPU priority.
+
+Messages are streamed from a server-side cursor, encoded in batches and written
+in committed chunks on a separate connection, so memory stays flat and a crash
+only loses the chunk in progress.
+
+With --workers N the batches are encoded by N processes, each with its own model
+copy and thread count, while this process stays the single reader/writer.
+--backend onnx encodes with the exported int8 ONNX model instead of PyTorch
+(see encoder.py); the vectors are stored under the same model_id.
+
+Usage:
+    python extract_embeddings.py
+    python extract_embeddings.py --batch-size 128 --commit-rows 5000 --limit 10000
+    python extract_embeddings.py --workers 4 --threads-per-worker 2
+    python extract_embeddings.py --backend onnx --workers 4
+    python extract_embeddings.py --rescan
+    python extract_embeddings.py --reembed --model sentence-transformers/all-MiniLM-L12-v2
+"""
+import argparse
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+
 import psycopg2
 from psycopg2.extras import execute_values
-from sentence_transformers import SentenceTransformer
-import numpy as np
-from config import DB_CONFIG
-
-# Load the sentence transformer model
-model = SentenceTransformer("sentence-transformers/all-mpnet-base-v2") 
-
-# Connect to PostgreSQL
-conn = psycopg2.connect(**DB_CONFIG)
-cur = conn.cursor()
-
-# Fetch messages that don't have embeddings
-cur.execute("""
-    SELECT message_id, text FROM messages
-    WHERE message_id NOT IN (SELECT message_id FROM embeddings)
-""")
-messages = cur.fetchall()
-
-if messages:
-    data_to_insert = []
-    
-    for msg_id, text in messages:
-        embedding = model.encode(text)  # Convert text to vector
-        data_to_insert.append((msg_id, embedding.tolist()))
-
-    # Insert embeddings into the database
-    execute_values(cur, """
-        INSERT INTO embeddings (message_id, vector)
-        VALUES %s
-    """, data_to_insert, template="(%s, %s)")
-
-    conn.commit()
-    print(f"Inserted {len(data_to_insert)} embeddings.")
-
-else:
-    print("No new messages to process.")
-
-cur.close()
-conn.close()
+from config import (
+    DB_CONFIG, EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND, EMBED_FETCH_SIZE, EMBED_BATCH_SIZE, EMBED_COMMIT_ROWS,
+    EMBED_WORKERS, EMBED_THREADS_PER_WORKER, EMBED_SEQ_LOOKBACK
+)
+from encoder import BACKENDS, load_encoder
+
+# Set in each pool worker by _init_worker
+_worker_model = None
+_worker_batch_size = None
+
+# Watermark before any message
+_START = 0
+
+_SELECT_CHANGED = """
+    FROM messages m
+    LEFT JOIN embeddings e ON e.message_id = m.message_id AND e.model_id = %(model_id)s
+    WHERE m.ingest_seq > %(seq)s
+      AND (e.message_id IS NULL OR e.content_hash <> md5(m.text))
+"""
+
+_SELECT_ALL = """
+    FROM messages m
+    WHERE m.ingest_seq > %(seq)s
+"""
+
+
+def content_hash(text: str) -> str:
+    """Same value as Postgres md5(text) for a UTF-8 database."""
+    return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+
+def _watermark_name(model_id: str, reembed: bool) -> str:
+    return f"{'reembed' if reembed else 'embed'}:{model_id}"
+
+
+def _get_watermark(conn, name: str):
+    with conn.cursor() as cur:
+        cur.execute("SELECT last_seq FROM embedding_watermarks WHERE name = %s", (name,))
+        row = cur.fetchone()
+    return row[0] if row else _START
+
+
+def _set_watermark(cur, name: str, seq: int):
+    # Never moves back: a chunk of lookback rows ends below the stored watermark
+    cur.execute("""
+        INSERT INTO embedding_watermarks (name, last_seq, updated_at)
+        VALUES (%s, %s, now())
+        ON CONFLICT (name) DO UPDATE
+        SET last_seq = GREATEST(embedding_watermarks.last_seq, EXCLUDED.last_seq), updated_at = now()
+    """, (name, seq))
+
+
+def _count_pending(conn, where_sql: str, params: dict) -> int:
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) " + where_sql, params)
+        return cur.fetchone()[0]
+
+
+def _write_chunk(write_conn, model_id: str, rows, watermark_name: str | None, last_key, force: bool):
+    """
+    Upsert one chunk and advance the watermark in the same transaction, so a crash
+    can never record progress for rows that were not written.
+    """
+    with write_conn.cursor() as cur:
+        execute_values(cur, f"""
+            INSERT INTO embeddings (message_id, model_id, content_hash, vector, embedded_at)
+            VALUES %s
+            ON CONFLICT (message_id, model_id) DO UPDATE
+            SET vector = EXCLUDED.vector, content_hash = EXCLUDED.content_hash, embedded_at = now()
+            {'' if force else 'WHERE embeddings.content_hash <> EXCLUDED.content_hash'}
+        """, [(msg_id, model_id, digest, vec) for msg_id, digest, vec in rows],
+            template="(%s, %s, %s, %s, now())", page_size=len(rows))
+        if watermark_name is not None:
+            _set_watermark(cur, watermark_name, last_key)
+    write_conn.commit()
+
+
+def _stream_batches(cur, batch_size: int, fetch_size: int, limit: int | None):
+    """
+    Encode batches of batch_size rows. Rows come from the named cursor fetch_size at
+    a time: fetchmany() ignores itersize, so each call is one server round trip.
+    """
+    pending = []
+    fetched = 0
+    while limit is None or fetched < limit:
+        rows = cur.fetchmany(fetch_size if limit is None else min(fetch_size, limit - fetched))
+        if not rows:
+            break
+        fetched += len(rows)
+        pending.extend(rows)
+        while len(pending) >= batch_size:
+            yield pending[:batch_size]
+            pending = pending[batch_size:]
+    if pending:
+        yield pending
+
+
+def _encode(model, batch, batch_size: int):
+    """Encode (message_id, text, ingest_seq) rows. Returns ([(message_id, hash, vector)], last ingest_seq)."""
+    vectors = model.encode([text for _, text, _ in batch], batch_size=batch_size)
+    rows = [(msg_id, content_hash(text), vec.tolist()) for (msg_id, text, _), vec in zip(batch, vectors)]
+    return rows, batch[-1][2]
+
+
+def encode_serial(batches, batch_size: int, model_id: str = EMBEDDING_MODEL_NAME,
+                  backend: str = EMBEDDING_BACKEND):
+    """Encode batches in this process."""
+    model = load_encoder(model_id, backend)
+    for batch in batches:
+        yield _encode(model, batch, batch_size)
+
+
+def _init_worker(model_name: str, threads: int, batch_size: int, backend: str):
+    global _worker_model, _worker_batch_size
+    # Capped threads: otherwise every worker starts one thread per core and they fight over the CPU
+    _worker_model = load_encoder(model_name, backend, threads)
+    _worker_batch_size = batch_size
+
+
+def _encode_in_worker(batch):
+    return _encode(_worker_model, batch, _worker_batch_size)
+
+
+def threads_per_worker(workers: int, requested: int = 0) -> int:
+    return requested if requested > 0 else max(1, (os.cpu_count() or 1) // workers)
+
+
+def encode_parallel(batches, batch_size: int, workers: int, threads: int,
+                    model_id: str = EMBEDDING_MODEL_NAME, backend: str = EMBEDDING_BACKEND):
+    """
+    Encode batches on a pool of worker processes, yielding results in input order
+    (the watermark must only advance past rows that are written). At most 2 batches
+    per worker are in flight, so a large backfill is never read into memory ahead
+    of the encoders.
+    """
+    window = threading.BoundedSemaphore(workers * 2)
+
+    def throttled():
+        for batch in batches:
+            window.acquire()
+            yield batch
+
+    # spawn: forking a process that already initialised torch threads can deadlock
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(workers, initializer=_init_worker,
+                      initargs=(model_id, threads, batch_size, backend)) as pool:
+        for result in pool.imap(_encode_in_worker, throttled()):
+            window.release()
+            yield result
+
+
+def run(batch_size: int, commit_rows: int, fetch_size: int, limit: int | None = None,
+        workers: int = 1, threads: int = 0, model_id: str = EMBEDDING_MODEL_NAME,
+        mode: str = "incremental", backend: str = EMBEDDING_BACKEND):
+    reembed = mode == "reembed"
+    watermark_name = None if mode == "rescan" else _watermark_name(model_id, reembed)
+    if reembed:
+        # Background job: let the query assistant and DB win any CPU contention.
+        # Encoder processes inherit the niceness.
+        os.nice(10)
+
+    # Reader holds one long transaction for the named cursor; writer commits independently
+    read_conn = psycopg2.connect(**DB_CONFIG)
+    write_conn = psycopg2.connect(**DB_CONFIG)
+
+    start_key = _START if watermark_name is None else _get_watermark(write_conn, watermark_name)
+    where_sql = _SELECT_ALL if reembed else _SELECT_CHANGED
+    # Re-embedding resumes exactly; incremental runs also re-check the lookback window,
+    # where the content hash skips everything already embedded
+    from_seq = start_key if reembed else max(_START, start_key - EMBED_SEQ_LOOKBACK)
+    params = {"model_id": model_id, "seq": from_seq}
+
+    pending = _count_pending(write_conn, where_sql, params)
+    if limit is not None:
+        pending = min(pending, limit)
+    if not pending:
+        print(f"No new or changed messages for {model_id}.")
+        read_conn.close()
+        write_conn.close()
+        return
+    print(f"📥 {pending} messages to embed with {model_id} ({mode}, from ingest_seq {from_seq}; "
+          f"backend={backend}, batch={batch_size}, commit every {commit_rows}, workers={workers})")
+
+    cur = read_conn.cursor(name="extract_embeddings_stream")
+    cur.execute("SELECT m.message_id, m.text, m.ingest_seq " + where_sql + " ORDER BY m.ingest_seq", params)
+
+    batches = _stream_batches(cur, batch_size, fetch_size, limit)
+    if workers > 1:
+        threads = threads_per_worker(workers, threads)
+        print(f"🧵 {workers} encoder processes x {threads} threads")
+        encoded = encode_parallel(batches, batch_size, workers, threads, model_id, backend)
+    else:
+        encoded = encode_serial(batches, batch_size, model_id, backend)
+
+    start = time.perf_counter()
+    done = 0
+    chunk = []
+    last_key = start_key
+    try:
+        for rows, last_key in encoded:
+            chunk.extend(rows)
+            if len(chunk) >= commit_rows:
+                _write_chunk(write_conn, model_id, chunk, watermark_name, last_key, force=reembed)
+                done += len(chunk)
+                chunk = []
+                rate = done / (time.perf_counter() - start)
+                print(f"💾 {done}/{pending} embedded ({rate:.1f} messages/sec)")
+
+        if chunk:
+            _write_chunk(write_conn, model_id, chunk, watermark_name, last_key, force=reembed)
+            done += len(chunk)
+
+        if reembed and (limit is None or done < limit):
+            # Finished: the normal incremental run for this model continues from here,
+            # and the next --reembed starts over from the beginning
+            incremental = _get_watermark(write_conn, _watermark_name(model_id, False))
+            with write_conn.cursor() as wcur:
+                if incremental < last_key:
+                    _set_watermark(wcur, _watermark_name(model_id, False), last_key)
+                wcur.execute("DELETE FROM embedding_watermarks WHERE name = %s", (watermark_name,))
+            write_conn.commit()
+            print(f"🏁 Re-embed for {model_id} complete")
+    except KeyboardInterrupt:
+        print(f"⏸️ Interrupted; {done} embeddings committed. Re-run to resume.")
+        raise
+    finally:
+        cur.close()
+        read_conn.close()
+        write_conn.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ Upserted {done} embeddings in {elapsed:.1f}s ({done / elapsed if elapsed else 0:.1f} messages/sec)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed new or changed messages for one model")
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME, help="Embedding model (stored as model_id)")
+    parser.add_argument("--backend", default=EMBEDDING_BACKEND, choices=BACKENDS, help="Encoder implementation")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--rescan", action="store_true", help="Check every message's hash, not just new ones")
+    mode.add_argument("--reembed", action="store_true", help="Re-embed every message for --model in the background")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="Texts per model.encode() call")
+    parser.add_argument("--commit-rows", type=int, default=EMBED_COMMIT_ROWS, help="Rows per committed chunk")
+    parser.add_argument("--fetch-size", type=int, default=EMBED_FETCH_SIZE, help="Rows per server-side cursor round trip")
+    parser.add_argument("--limit", type=int, default=None, help="Stop after this many messages")
+    parser.add_argument("--workers", type=int, default=EMBED_WORKERS, help="Encoder processes (1 = encode in-process)")
+    parser.add_argument("--threads-per-worker", type=int, default=EMBED_THREADS_PER_WORKER,
+                        help="Threads per encoder process (0 = cores / workers)")
+    args = parser.parse_args()
+    run_mode = "reembed" if args.reembed else "rescan" if args.rescan else "incremental"
+    run(args.batch_size, args.commit_rows, args.fetch_size, args.limit, args.workers,
+        args.threads_per_worker, args.model, run_mode, args.backend)
@@ -0,0 +1,84 @@
+"""
+Compact FAISS id map: index position → message_id.
+
+Stored as a single .npy array of fixed-width byte strings (dtype S<n>, n = longest
+message_id), so it can be memory-mapped instead of unpickled and a whole FAISS
+result matrix is resolved with one fancy-indexing call.
+
+Convert an existing map:
+    python id_map.py faiss_index_finetuned.ids faiss_id_map.npy
+    python id_map.py faiss_id_map.pkl faiss_id_map.npy
+"""
+import os
+import pickle
+import sys
+
+import numpy as np
+
+
+class IdMap:
+    def __init__(self, ids: np.ndarray):
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_ids(cls, message_ids: list[str]) -> "IdMap":
+        return cls(_to_array(message_ids))
+
+    def __getitem__(self, position: int) -> str:
+        return self.ids[position].decode("utf-8")
+
+    def resolve(self, I: np.ndarray) -> np.ndarray:
+        """
+        Map a FAISS index matrix (any shape) to message_ids in one vectorized lookup.
+        Positions FAISS could not fill (-1) or outside the map come back as None.
+        """
+        I = np.asarray(I)
+        valid = (I >= 0) & (I < len(self.ids))
+        message_ids = np.char.decode(self.ids[np.where(valid, I, 0)], "utf-8").astype(object)
+        message_ids[~valid] = None
+        return message_ids
+
+
+def save_id_map(path: str, message_ids: list[str]):
+    """Write message_ids (in index position order) as a fixed-width .npy, atomically."""
+    ids = _to_array(message_ids)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, ids)
+    os.replace(tmp_path, path)
+
+
+def load_id_map(path: str, mmap: bool = True) -> IdMap:
+    """Load an id map. Legacy .pkl dicts and .ids text files are converted in memory."""
+    if path.endswith(".pkl"):
+        print(f"⚠️ Loading legacy pickled id map {path}; convert it with id_map.py")
+        with open(path, "rb") as f:
+            id_map = pickle.load(f)
+        return IdMap(_to_array([id_map[i] for i in range(len(id_map))]))
+    if path.endswith(".ids"):
+        return IdMap(_to_array(_read_ids_file(path)))
+    return IdMap(np.load(path, mmap_mode="r" if mmap else None))
+
+
+def _to_array(message_ids: list[str]) -> np.ndarray:
+    # Fixed width = longest encoded id; numpy strips the null padding on read
+    encoded = [msg_id.encode("utf-8") for msg_id in message_ids]
+    return np.array(encoded, dtype=f"S{max((len(e) for e in encoded), default=1)}")
+
+
+def _read_ids_file(path: str) -> list[str]:
+    with open(path) as f:
+        return [line.rstrip("\n") for line in f if line.strip()]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python id_map.py <faiss_id_map.pkl | index.ids> <output.npy>")
+        sys.exit(1)
+    source, target = sys.argv[1], sys.argv[2]
+    id_map = load_id_map(source)
+    save_id_map(target, [id_map[i] for i in range(len(id_map))])
+    print(f"✅ Wrote {len(id_map)} ids to {target} ({os.path.getsize(target)} bytes)")
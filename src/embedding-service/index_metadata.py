@@ -0,0 +1,92 @@
+"""
+Per-vector metadata for filtered FAISS search: the space and creation time of the
+thread at each index position.
+
+Stored as one .npz of compact arrays, aligned with index positions:
+    spaces       sorted unique space_ids
+    space_codes  int32 per position, index into spaces
+    created      int64 per position, parent message creation time (epoch seconds)
+
+A filter is evaluated with a couple of vectorized comparisons into a boolean mask,
+which the query engine hands to FAISS as an IDSelectorBitmap, so non-matching
+vectors are skipped during the search rather than discarded afterwards.
+"""
+import os
+from datetime import datetime
+
+import numpy as np
+
+
+def _epoch_seconds(created) -> np.ndarray:
+    return np.array(created, dtype="datetime64[s]").astype(np.int64)
+
+
+class IndexMetadata:
+    def __init__(self, spaces: np.ndarray, space_codes: np.ndarray, created: np.ndarray):
+        self.spaces = spaces
+        self.space_codes = space_codes
+        self.created = created
+
+    def __len__(self):
+        return len(self.space_codes)
+
+    @classmethod
+    def from_rows(cls, space_ids: list[str], created: list[datetime]) -> "IndexMetadata":
+        spaces, codes = np.unique(np.array(space_ids, dtype=str), return_inverse=True)
+        return cls(spaces, codes.astype(np.int32), _epoch_seconds(created))
+
+    def extend(self, other: "IndexMetadata") -> "IndexMetadata":
+        """Metadata for positions appended to the index."""
+        all_spaces = np.concatenate([self.spaces[self.space_codes], other.spaces[other.space_codes]])
+        spaces, codes = np.unique(all_spaces, return_inverse=True)
+        return IndexMetadata(spaces, codes.astype(np.int32), np.concatenate([self.created, other.created]))
+
+    def take(self, positions: np.ndarray) -> "IndexMetadata":
+        """Metadata for a subset of positions, e.g. the live ones after compaction."""
+        return IndexMetadata(self.spaces, self.space_codes[positions], self.created[positions])
+
+    def mask(self, space_id: str | None = None, since: datetime | None = None,
+             until: datetime | None = None) -> np.ndarray | None:
+        """Boolean mask of positions matching every given filter; None when no filter is given."""
+        if space_id is None and since is None and until is None:
+            return None
+        allowed = np.ones(len(self), dtype=bool)
+        if space_id is not None:
+            code = np.searchsorted(self.spaces, space_id)
+            if code == len(self.spaces) or self.spaces[code] != space_id:
+                return np.zeros(len(self), dtype=bool)
+            allowed &= self.space_codes == code
+        if since is not None:
+            allowed &= self.created >= _epoch_seconds(since)
+        if until is not None:
+            allowed &= self.created < _epoch_seconds(until)
+        return allowed
+
+
+# Placeholder for positions whose message no longer exists (they are tombstoned)
+_MISSING = ("", datetime(1970, 1, 1))
+
+
+def fetch_metadata(conn, message_ids: list[str]) -> IndexMetadata:
+    """Space and creation time for message_ids (in that order) from the messages table."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT message_id, space_id, created FROM messages WHERE message_id = ANY(%s)",
+                    (list(message_ids),))
+        rows = {msg_id: (space_id, created) for msg_id, space_id, created in cur.fetchall()}
+    found = [rows.get(msg_id, _MISSING) for msg_id in message_ids]
+    return IndexMetadata.from_rows([space_id for space_id, _ in found], [created for _, created in found])
+
+
+def save_metadata(path: str, metadata: IndexMetadata):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, spaces=metadata.spaces, space_codes=metadata.space_codes, created=metadata.created)
+    os.replace(tmp_path, path)
+
+
+def load_metadata(path: str) -> IndexMetadata | None:
+    """Metadata saved next to the index, or None for an index built without it."""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return IndexMetadata(data["spaces"], data["space_codes"], data["created"])
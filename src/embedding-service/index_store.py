@@ -0,0 +1,280 @@
+"""
+Building and persisting the servable FAISS index.
+
+The index type and its build/search parameters come from index_config.json
+(see bench_index_types.py for how to choose them), e.g.
+    {"factory": "HNSW32,Flat", "metric": "inner_product", "efConstruction": 200, "efSearch": 100}
+    {"factory": "IVF64,Flat", "metric": "inner_product", "nprobe": 8}
+
+Files that make up a servable FAISS index besides the index itself:
+
+- tombstones (.npy, uint8 per index position): 1 = position is deleted/merged and
+  must never be returned. HNSW cannot remove vectors, so deletes are masked at
+  search time until the next compaction.
+- state (.json): bookkeeping for update_faiss_index.py (model, embedding watermark,
+  last compaction).
+- vectors (.npy, float32 per index position): only for quantized indexes (SQ8, PQ).
+  The compressed index finds candidates, which are re-scored against these exact
+  vectors. The file is memory-mapped, so only the candidate rows are paged in.
+- metadata (.npz): space and creation time per position, for filtered search
+  (see index_metadata.py).
+- manifest (.manifest.json): a build id and the size, mtime and digest of every file
+  above (plus the id map, thread map, lexical index and answer store) as one build
+  wrote them. It is written after the index, and a reader refuses files whose size
+  or mtime don't match it, so a reload can't pair the index with side files of
+  another build that happen to have the same length. Jobs refreshing only some files
+  (update_answer_store.py) re-stamp them under a new build id.
+  verify_index_manifest.py checks the digests offline.
+
+All writes go to a temp file and are swapped in with os.replace so a hot-reloading
+query assistant never reads a half-written file.
+"""
+import hashlib
+import json
+import os
+import uuid
+
+import faiss
+import numpy as np
+
+
+def load_index_config(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def build_index(vectors: np.ndarray, config: dict):
+    """Create, train (if needed) and fill an index from normalized float32 vectors."""
+    metric = faiss.METRIC_INNER_PRODUCT if config.get("metric", "inner_product") == "inner_product" else faiss.METRIC_L2
+    index = faiss.index_factory(vectors.shape[1], config["factory"], metric)
+    if "efConstruction" in config:
+        index.hnsw.efConstruction = config["efConstruction"]
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    apply_search_config(index, config)
+    return index
+
+
+def apply_search_config(index, config: dict):
+    """Search-time knobs are stored in the index file, so set them before writing it."""
+    params = faiss.ParameterSpace()
+    for name in ("efSearch", "nprobe"):
+        if config.get(name) is not None:
+            params.set_index_parameter(index, name, config[name])
+
+
+def has_exact_storage(index) -> bool:
+    """True if reconstruct() returns the original vectors (flat storage, no quantization)."""
+    storage = index.storage if hasattr(index, "hnsw") else index
+    return isinstance(faiss.downcast_index(storage), faiss.IndexFlat)
+
+
+def sync_exact_vectors(path: str, index, vectors: np.ndarray):
+    """Write the re-rank vectors for a quantized index; remove a stale file for an exact one."""
+    if has_exact_storage(index):
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.ascontiguousarray(vectors, dtype=np.float32))
+    os.replace(tmp_path, path)
+
+
+def load_exact_vectors(path: str):
+    """Memory-mapped re-rank vectors, or None if the index has none."""
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode="r")
+
+
+def rerank(exact_vectors, queries: np.ndarray, I: np.ndarray, k: int, metric=faiss.METRIC_INNER_PRODUCT):
+    """
+    Re-score first-stage candidates I (positions, -1 = none) against exact vectors and
+    return the best k per query as (D, I), ordered like a faiss search of the same metric.
+    """
+    valid = I >= 0
+    candidates = np.asarray(exact_vectors[np.where(valid, I, 0)], dtype=np.float32)  # (nq, c, d)
+    if metric == faiss.METRIC_INNER_PRODUCT:
+        scores = np.einsum("qcd,qd->qc", candidates, queries)
+        scores[~valid] = -np.inf
+        order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    else:
+        scores = ((candidates - queries[:, None, :]) ** 2).sum(axis=2)
+        scores[~valid] = np.inf
+        order = np.argsort(scores, axis=1, kind="stable")[:, :k]
+    D = np.take_along_axis(scores, order, axis=1)
+    I = np.where(np.take_along_axis(valid, order, axis=1), np.take_along_axis(I, order, axis=1), -1)
+    return D, I
+
+
+def write_index_atomic(index, path: str):
+    tmp_path = path + ".tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def save_tombstones(path: str, tombstones: np.ndarray):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, tombstones.astype(np.uint8))
+    os.replace(tmp_path, path)
+
+
+def load_tombstones(path: str, ntotal: int) -> np.ndarray:
+    """Tombstone mask for an index of ntotal vectors; all live if the file does not exist."""
+    if not os.path.exists(path):
+        return np.zeros(ntotal, dtype=np.uint8)
+    return np.load(path)
+
+
+def bitmap_selector(allowed: np.ndarray):
+    """
+    IDSelector admitting the positions where allowed (bool per position) is True.
+    Returns (selector, bitmap); hold on to bitmap as long as selector is used, since
+    faiss does not own it.
+    """
+    bitmap = np.packbits(allowed, bitorder="little")
+    return faiss.IDSelectorBitmap(len(allowed), faiss.swig_ptr(bitmap)), bitmap
+
+
+def live_selector(tombstones: np.ndarray):
+    """bitmap_selector that skips tombstoned positions, or (None, None) when nothing is deleted."""
+    if not tombstones.any():
+        return None, None
+    return bitmap_selector(tombstones == 0)
+
+
+def exact_search(vectors: np.ndarray, queries: np.ndarray, k: int, metric=faiss.METRIC_INNER_PRODUCT):
+    """Brute-force search of queries over the rows of vectors; (D, I) padded with -1 like faiss."""
+    if metric == faiss.METRIC_INNER_PRODUCT:
+        scores = queries @ vectors.T
+    else:
+        scores = -((queries ** 2).sum(axis=1)[:, None] - 2 * queries @ vectors.T + (vectors ** 2).sum(axis=1)[None])
+    top = min(k, scores.shape[1])
+    if top:
+        best = np.argpartition(-scores, top - 1, axis=1)[:, :top]
+        best = np.take_along_axis(best, np.argsort(-np.take_along_axis(scores, best, axis=1), axis=1), axis=1)
+    else:
+        best = np.empty((len(queries), 0), dtype=np.int64)
+    D = np.full((len(queries), k), -np.inf if metric == faiss.METRIC_INNER_PRODUCT else np.inf, dtype=np.float32)
+    I = np.full((len(queries), k), -1, dtype=np.int64)
+    D[:, :top] = np.take_along_axis(scores, best, axis=1) * (1 if metric == faiss.METRIC_INNER_PRODUCT else -1)
+    I[:, :top] = best
+    return D, I
+
+
+def search_params(index, selector=None, ef_search: int | None = None):
+    """
+    Per-search parameters for index, or None to use what is stored in the index.
+    Passing params replaces the index's own efSearch/nprobe, so they are carried over.
+    ef_search only applies to HNSW indexes.
+    """
+    if selector is None and ef_search is None:
+        return None
+    if hasattr(index, "hnsw"):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=ef_search or index.hnsw.efSearch)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    return faiss.SearchParameters(sel=selector)
+
+
+def read_state(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_state(path: str, state: dict):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+
+def manifest_path(index_path: str) -> str:
+    return os.path.splitext(index_path)[0] + ".manifest.json"
+
+
+def _file_stamp(path: str) -> dict:
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _stamp_files(paths) -> dict:
+    return {os.path.basename(path): {**_file_stamp(path), "blake2b": file_digest(path)}
+            for path in paths if path and os.path.exists(path)}
+
+
+def write_manifest(index_path: str, paths: list[str]) -> str:
+    """
+    Record a new build id and the stamp (size, mtime, digest) of the index and each
+    existing side file in paths. Call after the index itself is written; returns the build id.
+    """
+    build_id = uuid.uuid4().hex
+    write_state(manifest_path(index_path), {"build_id": build_id, "files": _stamp_files((index_path, *paths))})
+    return build_id
+
+
+def update_manifest(index_path: str, paths: list[str]):
+    """
+    Re-stamp the files in paths under a new build id, keeping the other files' entries
+    (e.g. after refreshing only the answer store). Returns the build id, or None when
+    the index has no manifest to update.
+    """
+    manifest = read_state(manifest_path(index_path))
+    if not manifest:
+        return None
+    files = manifest["files"]
+    for path in paths:
+        if path:
+            files.pop(os.path.basename(path), None)
+    files.update(_stamp_files(paths))
+    build_id = uuid.uuid4().hex
+    write_state(manifest_path(index_path), {"build_id": build_id, "files": files})
+    return build_id
+
+
+def verify_manifest(index_path: str, paths: list[str], optional: tuple = (), full: bool = False):
+    """
+    Build id of the index and the existing side files in paths, or None for an index
+    built before manifests. Raises ValueError when any file is not the one its build wrote.
+    optional files are only checked when the manifest lists them (the lexical index and
+    answer store belong to the parent index's build, not the thread index's).
+    Files are compared by size and mtime, a stat instead of a read, so copies must
+    preserve mtimes (cp -p, rsync -a); full=True also compares content digests.
+    """
+    manifest = read_state(manifest_path(index_path))
+    if not manifest:
+        return None
+    build_id = manifest["build_id"]
+    files = manifest.get("files", {})
+    for path in (index_path, *paths, *optional):
+        if not path:
+            continue
+        name = os.path.basename(path)
+        if not os.path.exists(path):
+            if name in files:
+                raise ValueError(f"{path} of index build {build_id} is missing")
+            continue
+        if name not in files:
+            if path in optional:
+                continue
+            raise ValueError(f"{path} is not part of index build {build_id}")
+        expected = files[name]
+        if _file_stamp(path) != {"size": expected["size"], "mtime_ns": expected["mtime_ns"]}:
+            raise ValueError(f"{path} does not match index build {build_id}")
+        if full and file_digest(path) != expected["blake2b"]:
+            raise ValueError(f"{path} content does not match index build {build_id}")
+    return build_id
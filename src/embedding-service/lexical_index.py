@@ -0,0 +1,228 @@
+"""
+In-process BM25 index over thread text, the lexical leg of hybrid retrieval.
+
+One document per thread (parent message followed by its replies), keyed by the
+parent message_id so lexical hits line up with FAISS hits and are fused with them
+by reciprocal rank in the query assistant. The tokenizer keeps identifiers such
+as ERR_CONN-504, v2.14.1 or api/v1/rooms whole (and also indexes their parts),
+which is exactly what sentence embeddings blur.
+
+Stored as one .npz next to the FAISS index, postings in CSR layout:
+    vocab         sorted unique terms
+    offsets       int64 (V+1); postings of term t are [offsets[t], offsets[t+1])
+    postings      int32 document number, ascending within a term
+    tf            uint16 term frequency
+    doc_ids       S<n> parent message_id per document
+    doc_len       int32 tokens per document
+    tombstones    uint8 per document; 1 = thread replaced or deleted
+    spaces, space_codes, created   filter metadata per document (index_metadata.py)
+
+Updates re-tokenize only changed threads: their old documents are tombstoned and
+the new ones merged into the postings (integer arrays only), until compact()
+drops the tombstones.
+
+Build or refresh it with setup_faiss_index_and_idmap.py / update_faiss_index.py.
+"""
+import os
+import re
+from collections import Counter
+
+import numpy as np
+from index_metadata import IndexMetadata
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:[._:/\-][a-z0-9]+)*")
+_SEPARATORS = re.compile(r"[._:/\-]")
+_BM25_K1 = 1.2
+_BM25_B = 0.75
+_TF_MAX = np.iinfo(np.uint16).max
+
+# Parent message followed by its replies, in creation order
+_THREADS_SQL = """
+    SELECT p.message_id, p.space_id, p.created,
+           p.text || COALESCE(E'\\n' || string_agg(c.text, E'\\n' ORDER BY c.created), '')
+    FROM messages p
+    LEFT JOIN messages c ON c.parent_id = p.message_id
+    WHERE p.parent_id IS NULL {where}
+    GROUP BY p.message_id, p.space_id, p.created, p.text
+    ORDER BY p.created
+"""
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased word/identifier tokens; compound identifiers also yield their parts."""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(_SEPARATORS.split(token))
+    return tokens
+
+
+def _postings(texts: list[str]):
+    """Tokenize documents into (vocab, term_ids, docs, tf, doc_len) with vocab sorted."""
+    term_index = {}
+    term_ids, docs, tf, doc_len = [], [], [], []
+    for doc, text in enumerate(texts):
+        counts = Counter(tokenize(text))
+        doc_len.append(sum(counts.values()))
+        term_ids.extend(term_index.setdefault(term, len(term_index)) for term in counts)
+        docs.extend([doc] * len(counts))
+        tf.extend(counts.values())
+    vocab = np.array(list(term_index), dtype=str)
+    order = np.argsort(vocab)
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    return (vocab[order], rank[np.array(term_ids, dtype=np.int64)], np.array(docs, dtype=np.int32),
+            np.minimum(np.array(tf, dtype=np.int64), _TF_MAX).astype(np.uint16), np.array(doc_len, dtype=np.int32))
+
+
+def _csr(vocab_size: int, term_ids: np.ndarray, docs: np.ndarray, tf: np.ndarray):
+    """Group (term, doc, tf) triples by term. Callers pass docs ascending within each term,
+    so a stable sort on the term alone keeps them ascending (and is mostly presorted runs)."""
+    order = np.argsort(term_ids, kind="stable")
+    offsets = np.zeros(vocab_size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(term_ids, minlength=vocab_size), out=offsets[1:])
+    return offsets, docs[order], tf[order]
+
+
+class LexicalIndex:
+    def __init__(self, vocab, offsets, postings, tf, doc_ids, doc_len, tombstones, metadata: IndexMetadata):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.postings = postings
+        self.tf = tf
+        self.doc_ids = doc_ids
+        self.doc_len = doc_len
+        self.tombstones = tombstones
+        self.metadata = metadata
+        self.live = tombstones == 0
+        self.live_count = int(self.live.sum())
+        avgdl = float(doc_len[self.live].mean()) if self.live_count else 1.0
+        # BM25 length normalization per document, precomputed once per snapshot
+        self._norm = (_BM25_K1 * (1 - _BM25_B + _BM25_B * doc_len / max(avgdl, 1e-9))).astype(np.float32)
+        # Document frequency over live documents only: postings of tombstoned documents
+        # stay until compact(), and counting them would understate idf (even below zero)
+        live_postings = np.concatenate([[0], np.cumsum(self.live[postings], dtype=np.int64)])
+        self._live_df = live_postings[offsets[1:]] - live_postings[offsets[:-1]]
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    @classmethod
+    def build(cls, doc_ids: list[str], texts: list[str], metadata: IndexMetadata) -> "LexicalIndex":
+        vocab, term_ids, docs, tf, doc_len = _postings(texts)
+        offsets, postings, tf = _csr(len(vocab), term_ids, docs, tf)
+        encoded = [doc_id.encode("utf-8") for doc_id in doc_ids]
+        ids = np.array(encoded, dtype=f"S{max((len(e) for e in encoded), default=1)}")
+        return cls(vocab, offsets, postings, tf, ids, doc_len, np.zeros(len(ids), dtype=np.uint8), metadata)
+
+    def updated(self, doc_ids: list[str], texts: list[str], metadata: IndexMetadata,
+                removed: set[str] = frozenset()) -> "LexicalIndex":
+        """
+        New index with doc_ids (re)indexed from texts and removed threads dropped.
+        Existing documents for those threads are tombstoned, not rewritten.
+        """
+        replaced = set(doc_ids) | set(removed)
+        tombstones = self.tombstones.copy()
+        if replaced:
+            current = np.char.decode(self.doc_ids, "utf-8")
+            tombstones[np.isin(current, list(replaced))] = 1
+        if not doc_ids:
+            return LexicalIndex(self.vocab, self.offsets, self.postings, self.tf, self.doc_ids,
+                                self.doc_len, tombstones, self.metadata)
+
+        added = LexicalIndex.build(doc_ids, texts, metadata)
+        vocab = np.union1d(self.vocab, added.vocab)
+        # Old and new postings as (term, doc) pairs over the merged vocabulary
+        old_terms = np.searchsorted(vocab, self.vocab)[np.repeat(np.arange(len(self.vocab)), np.diff(self.offsets))]
+        new_terms = np.searchsorted(vocab, added.vocab)[np.repeat(np.arange(len(added.vocab)), np.diff(added.offsets))]
+        term_ids = np.concatenate([old_terms, new_terms])
+        docs = np.concatenate([self.postings, added.postings + len(self)]).astype(np.int32)
+        offsets, postings, tf = _csr(len(vocab), term_ids, docs, np.concatenate([self.tf, added.tf]))
+        width = max(self.doc_ids.dtype.itemsize, added.doc_ids.dtype.itemsize)
+        doc_ids = np.concatenate([self.doc_ids.astype(f"S{width}"), added.doc_ids.astype(f"S{width}")])
+        return LexicalIndex(vocab, offsets, postings, tf, doc_ids,
+                            np.concatenate([self.doc_len, added.doc_len]),
+                            np.concatenate([tombstones, added.tombstones]),
+                            self.metadata.extend(metadata))
+
+    def compact(self) -> "LexicalIndex":
+        """Drop tombstoned documents and terms that no longer occur."""
+        keep = np.flatnonzero(self.live)
+        renumber = np.full(len(self), -1, dtype=np.int64)
+        renumber[keep] = np.arange(len(keep))
+        term_ids = np.repeat(np.arange(len(self.vocab)), np.diff(self.offsets))
+        kept = renumber[self.postings] >= 0
+        used, term_ids = np.unique(term_ids[kept], return_inverse=True)
+        offsets, postings, tf = _csr(len(used), term_ids, renumber[self.postings[kept]].astype(np.int32),
+                                     self.tf[kept])
+        return LexicalIndex(self.vocab[used], offsets, postings, tf, self.doc_ids[keep], self.doc_len[keep],
+                            np.zeros(len(keep), dtype=np.uint8), self.metadata.take(keep))
+
+    def search(self, query: str, k: int, allowed: np.ndarray | None = None, max_postings: int = 0):
+        """
+        Top k (doc_ids, BM25 scores) for query. allowed masks documents (e.g. a
+        metadata filter). max_postings > 0 bounds the work: terms are scored rarest
+        first and the most common ones are skipped once the budget is spent. idf counts
+        live documents only, so scores match a fresh build before compaction.
+        """
+        terms = np.unique(np.array(tokenize(query), dtype=str))
+        if not len(terms) or not len(self.vocab) or not self.live_count:
+            return [], []
+        slots = np.minimum(np.searchsorted(self.vocab, terms), len(self.vocab) - 1)
+        slots = slots[self.vocab[slots] == terms]
+        if not len(slots):
+            return [], []
+        df = self.offsets[slots + 1] - self.offsets[slots]
+        order = np.argsort(df, kind="stable")
+        if max_postings > 0:
+            within = np.searchsorted(np.cumsum(df[order]), max_postings, side="right")
+            order = order[:max(within, 1)]
+        slots, df = slots[order], df[order]
+
+        live_df = self._live_df[slots]
+        idf = np.log1p((self.live_count - live_df + 0.5) / (live_df + 0.5)).astype(np.float32)
+        docs = np.concatenate([self.postings[self.offsets[s]:self.offsets[s + 1]] for s in slots])
+        tf = np.concatenate([self.tf[self.offsets[s]:self.offsets[s + 1]] for s in slots]).astype(np.float32)
+        weights = np.repeat(idf, df) * tf * (_BM25_K1 + 1) / (tf + self._norm[docs])
+        scores = np.bincount(docs, weights=weights, minlength=len(self))
+        scores[~self.live] = 0
+        if allowed is not None:
+            scores[~allowed] = 0
+
+        hits = np.flatnonzero(scores > 0)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return np.char.decode(self.doc_ids[hits], "utf-8").tolist(), scores[hits].tolist()
+
+
+def fetch_threads(conn, parent_ids: list[str] | None = None):
+    """(doc_ids, texts, metadata) for parent_ids, or for every thread when None."""
+    with conn.cursor() as cur:
+        if parent_ids is None:
+            cur.execute(_THREADS_SQL.format(where=""))
+        else:
+            cur.execute(_THREADS_SQL.format(where="AND p.message_id = ANY(%s)"), (list(parent_ids),))
+        rows = cur.fetchall()
+    metadata = IndexMetadata.from_rows([row[1] for row in rows], [row[2] for row in rows])
+    return [row[0] for row in rows], [row[3] for row in rows], metadata
+
+
+def save_lexical_index(path: str, index: LexicalIndex):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, vocab=index.vocab, offsets=index.offsets, postings=index.postings, tf=index.tf,
+                 doc_ids=index.doc_ids, doc_len=index.doc_len, tombstones=index.tombstones,
+                 spaces=index.metadata.spaces, space_codes=index.metadata.space_codes,
+                 created=index.metadata.created)
+    os.replace(tmp_path, path)
+
+
+def load_lexical_index(path: str) -> LexicalIndex | None:
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        metadata = IndexMetadata(data["spaces"], data["space_codes"], data["created"])
+        return LexicalIndex(data["vocab"], data["offsets"], data["postings"], data["tf"], data["doc_ids"],
+                            data["doc_len"], data["tombstones"], metadata)
@@ -0,0 +1,95 @@
+"""
+Thread search inside Postgres with pgvector, an alternative to the FAISS files
+(SEARCH_BACKEND=pgvector in the query assistant).
+
+One statement finds the nearest parent messages through the HNSW index on
+embeddings.vector (see the embeddings_vector_hnsw migration) and joins their
+replies and reply labels, so there is no separate hydration query and no index
+files to keep in sync with the database.
+
+The HNSW index is partial on model_id, so the statement inlines the model id as a
+literal: the planner only uses a partial index when the predicate matches it at
+plan time. Scores are cosine similarities (1 - cosine distance), the same values
+the FAISS inner-product index returns for normalized vectors.
+
+Run through vector_store.PgvectorStore by the query assistant (psycopg 3) and by
+verify_vector_stores.py / bench_pgvector.py (psycopg2); both use %(name)s parameters.
+"""
+import numpy as np
+
+# Session settings for one search, applied with set_config(..., is_local => true) so
+# they end with the transaction. Iterative scans (pgvector >= 0.8) keep reading the
+# graph when the join/filters drop candidates, instead of returning fewer than k rows.
+# set_config takes text, so ef_search is passed as a string.
+SETTINGS_SQL = "SELECT set_config('hnsw.ef_search', %(ef_search)s, true)"
+ITERATIVE_SCAN_SQL = "SELECT set_config('hnsw.iterative_scan', 'relaxed_order', true)"
+
+# Nearest parent messages only: (message_id, score) rows, best first
+_NEAREST_SQL = """
+        SELECT m.message_id, 1 - (e.vector <=> %(query)s::vector) AS score
+        FROM embeddings e
+        JOIN messages m ON m.message_id = e.message_id
+        WHERE e.model_id = {model_id} AND m.parent_id IS NULL{filters}
+        ORDER BY e.vector <=> %(query)s::vector
+        LIMIT %(k)s
+"""
+
+_SEARCH_SQL = """
+    WITH hits AS MATERIALIZED ({nearest})
+    SELECT h.message_id, h.score, p.text, c.message_id, c.text, l.label
+    FROM hits h
+    JOIN messages p ON p.message_id = h.message_id
+    LEFT JOIN messages c ON c.parent_id = p.message_id
+    LEFT JOIN thread_labels l ON l.message_id = c.message_id
+    ORDER BY h.score DESC, h.message_id, c.created
+"""
+
+_FILTERS = {
+    "space_id": " AND m.space_id = %(space_id)s",
+    "since": " AND m.created >= %(since)s",
+    "until": " AND m.created < %(until)s",
+}
+
+
+def _literal(value: str) -> str:
+    # Quote for SQL, and escape % since the statement also carries %(name)s parameters
+    return "'" + value.replace("'", "''").replace("%", "%%") + "'"
+
+
+def nearest_sql(model_id: str, space_id=None, since=None, until=None) -> str:
+    """Nearest-parents statement for model_id with the given filters (values are passed as parameters)."""
+    given = {"space_id": space_id, "since": since, "until": until}
+    filters = "".join(clause for name, clause in _FILTERS.items() if given[name] is not None)
+    return _NEAREST_SQL.format(model_id=_literal(model_id), filters=filters)
+
+
+def search_sql(model_id: str, space_id=None, since=None, until=None) -> str:
+    """nearest_sql joined with the replies and reply labels of every hit."""
+    return _SEARCH_SQL.format(nearest=nearest_sql(model_id, space_id, since, until))
+
+
+def search_params(query_vec: np.ndarray, k: int, space_id=None, since=None, until=None) -> dict:
+    return {"query": vector_literal(query_vec), "k": k, "space_id": space_id, "since": since, "until": until}
+
+
+def vector_literal(vec: np.ndarray) -> str:
+    """pgvector text input for one vector, e.g. '[0.1,-0.2,...]'."""
+    return "[" + ",".join(f"{v:.7g}" for v in np.asarray(vec, dtype=np.float32).ravel()) + "]"
+
+
+def group_threads(rows):
+    """
+    Rows of the search statement → (parent_ids, scores, threads) with parents in score
+    order and threads shaped like the query assistant's hydrated threads:
+    {parent_id: {"thread_question": str, "children": [(message_id, text, label), ...]}}.
+    """
+    parent_ids, scores, threads = [], [], {}
+    for parent_id, score, thread_question, child_id, child_text, label in rows:
+        thread = threads.get(parent_id)
+        if thread is None:
+            thread = threads[parent_id] = {"thread_question": thread_question, "children": []}
+            parent_ids.append(parent_id)
+            scores.append(float(score))
+        if child_id is not None:
+            thread["children"].append((child_id, child_text, label))
+    return parent_ids, scores, threads
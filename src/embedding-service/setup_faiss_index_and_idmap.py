@@ -1,57 +1,113 @@
 import faiss
 import numpy as np
 import psycopg2
-import pickle
-from config import DB_CONFIG
+from config import DB_CONFIG, EMBEDDING_MODEL_NAME, INDEX_CONFIG_PATH
+from id_map import save_id_map
+from index_metadata import fetch_metadata, save_metadata
+from lexical_index import LexicalIndex, fetch_threads, save_lexical_index
+from answer_store import (
+    AnswerStore, fetch_answer_records, read_labels_generation, save_answer_store, store_files
+)
+from embedding_io import load_embeddings
+from index_store import (
+    save_tombstones, write_state, write_index_atomic, write_manifest, load_index_config, build_index,
+    sync_exact_vectors
+)
 
 # Connect to PostgreSQL
 conn = psycopg2.connect(**DB_CONFIG)
-cursor = conn.cursor()
 
-# Step 1: Fetch parent message embeddings (FAISS should use only parent threads)
-cursor.execute("""
+# Step 1: Fetch parent message embeddings (FAISS should use only parent threads),
+# streamed as binary COPY straight into a float32 matrix
+message_ids, embeddings = load_embeddings(conn, """
     SELECT m.message_id, e.vector
     FROM messages m
-    JOIN embeddings e ON m.message_id = e.message_id
+    JOIN embeddings e ON m.message_id = e.message_id AND e.model_id = %s
     WHERE m.parent_id IS NULL
     ORDER BY m.created
-""")
-rows = cursor.fetchall()
+""", (EMBEDDING_MODEL_NAME,))
 
-if not rows:
+if not message_ids:
     print("❌ No parent message embeddings found.")
     exit(1)
 
-# Step 2: Extract message_ids and vectors
-message_ids = [row[0] for row in rows]
-embeddings = np.array([np.array(eval(row[1]), dtype=np.float32) for row in rows])
-
-# Step 3: Normalize vectors (for cosine similarity)
+# Step 2: Normalize vectors (for cosine similarity)
 faiss.normalize_L2(embeddings)
 
-# Step 4: Build FAISS HNSW index with inner product (cosine similarity)
-dim = embeddings.shape[1]
-index = faiss.IndexHNSWFlat(dim, 32, faiss.METRIC_INNER_PRODUCT)
-index.hnsw.efConstruction = 200
-index.hnsw.efSearch = 100
-index.add(embeddings)
+# Step 3: Build the FAISS index configured in index_config.json (inner product = cosine similarity)
+index_config = load_index_config(INDEX_CONFIG_PATH)
+index = build_index(embeddings, index_config)
+print(f"🏗️ Built {index_config['factory']} index")
+
+# Step 4: Side files (including the lexical index and answer store) first, then the
+# index, then the manifest naming this build. Until the manifest is written a
+# hot-reloading query assistant rejects the files, so it never pairs the new index
+# with side files of the previous build.
+save_id_map("faiss_id_map.npy", message_ids)
+print("✅ FAISS ID map saved to faiss_id_map.npy")
+
+# Space and creation time per position, for filtered search
+save_metadata("faiss_index_finetuned.metadata.npz", fetch_metadata(conn, message_ids))
+print("✅ Filter metadata saved to faiss_index_finetuned.metadata.npz")
+
+# Fresh index has no tombstones
+save_tombstones("faiss_index_finetuned.tombstones.npy", np.zeros(len(message_ids), dtype=np.uint8))
+
+# Quantized (SQ8/PQ) indexes keep the exact vectors on disk for re-ranking their candidates
+sync_exact_vectors("faiss_index_finetuned.vectors.npy", index, embeddings)
+
+# BM25 index over parent + reply text, fused with FAISS hits for hybrid search
+lexical = LexicalIndex.build(*fetch_threads(conn))
+save_lexical_index("faiss_index_finetuned.lexical.npz", lexical)
+print(f"✅ Lexical index saved with {len(lexical)} threads, {len(lexical.vocab)} terms")
+
+# Precomputed answers for every labelled thread, served without SQL while labels are unchanged
+labels_generation = read_labels_generation(conn)
+with conn.cursor() as cur:
+    cur.execute("SELECT COALESCE(MAX(id), 0) FROM thread_label_changes")
+    last_change_id = cur.fetchone()[0]
+answers = AnswerStore.build(fetch_answer_records(conn), labels_generation, last_change_id)
+save_answer_store("faiss_index_finetuned.answers", answers)
+with conn.cursor() as cur:
+    cur.execute("DELETE FROM thread_label_changes WHERE id <= %s", (last_change_id,))
+conn.commit()
+print(f"✅ Answer store saved with {len(answers)} answered threads (labels generation {labels_generation})")
 
-# Step 5: Save FAISS index
-faiss.write_index(index, "faiss_index_finetuned.bin")
-print(f"✅ FAISS index saved with {len(message_ids)} parent messages.")
+write_index_atomic(index, "faiss_index_finetuned.bin")
+build_id = write_manifest("faiss_index_finetuned.bin", [
+    "faiss_id_map.npy", "faiss_index_finetuned.metadata.npz", "faiss_index_finetuned.tombstones.npy",
+    "faiss_index_finetuned.vectors.npy", "faiss_index_finetuned.lexical.npz",
+    *store_files("faiss_index_finetuned.answers"),
+])
+print(f"✅ FAISS index saved with {len(message_ids)} parent messages (build {build_id}).")
 
-# Step 6: Save ID map: index position → message_id
-id_map = {i: msg_id for i, msg_id in enumerate(message_ids)}
-with open("faiss_id_map.pkl", "wb") as f:
-    pickle.dump(id_map, f)
-print("✅ FAISS ID map saved to faiss_id_map.pkl")
+# Step 5: Record the embedding watermark for update_faiss_index.py
+with conn.cursor() as cur:
+    cur.execute("""
+        SELECT MAX(e.embedded_at)
+        FROM messages m
+        JOIN embeddings e ON m.message_id = e.message_id AND e.model_id = %s
+        WHERE m.parent_id IS NULL
+    """, (EMBEDDING_MODEL_NAME,))
+    last_embedded_at = cur.fetchone()[0]
+    cur.execute("SELECT MAX(created) FROM messages")
+    lexical_last_created = cur.fetchone()[0]
+write_state("faiss_index_finetuned.state.json", {
+    "model_id": EMBEDDING_MODEL_NAME,
+    "index_config": index_config,
+    "last_embedded_at": last_embedded_at.isoformat() if last_embedded_at else None,
+    "ntotal": len(message_ids),
+    "tombstones": 0,
+    "lexical_last_created": lexical_last_created.isoformat() if lexical_last_created else None,
+    "build_id": build_id,
+})
+print("✅ Index state reset")
 
-# Step 7: Save message_ids to .ids file (optional but useful)
+# Step 6: Save message_ids to .ids file (optional but useful)
 with open("faiss_index_finetuned.ids", "w") as f:
     for msg_id in message_ids:
         f.write(msg_id + "\n")
 print("✅ Message IDs saved to faiss_index_finetuned.ids")
 
 # Clean up
-cursor.close()
 conn.close()
@@ -0,0 +1,82 @@
+"""
+Build the whole-thread FAISS index (INDEX_MODE=thread) from scratch.
+
+Unlike setup_faiss_index_and_idmap.py, which indexes parent messages only, every
+message with an embedding is indexed, so replies holding the answer vocabulary are
+searchable too. Next to the index it writes the usual id map, tombstones, state,
+re-rank vectors and filter metadata, plus the message → thread map the query
+assistant aggregates hits with (thread_map.py). Filter metadata is the thread's
+(parent's) space and creation time, so filters select whole threads.
+
+Keep it current with: python update_faiss_index.py --mode thread
+"""
+import faiss
+import numpy as np
+import psycopg2
+from config import (
+    DB_CONFIG, EMBEDDING_MODEL_NAME, INDEX_CONFIG_PATH, THREAD_INDEX_PATH, THREAD_ID_MAP_PATH,
+    THREAD_TOMBSTONES_PATH, THREAD_INDEX_STATE_PATH, THREAD_VECTORS_PATH, THREAD_METADATA_PATH, THREAD_MAP_PATH
+)
+from id_map import save_id_map
+from index_metadata import fetch_metadata, save_metadata
+from thread_map import ThreadMap, fetch_thread_ids, save_thread_map
+from embedding_io import load_embeddings
+from index_store import (
+    save_tombstones, write_state, write_index_atomic, write_manifest, load_index_config, build_index,
+    sync_exact_vectors
+)
+
+conn = psycopg2.connect(**DB_CONFIG)
+
+# Step 1: Every embedded message, threads kept together in creation order
+message_ids, embeddings = load_embeddings(conn, """
+    SELECT m.message_id, e.vector
+    FROM messages m
+    JOIN embeddings e ON m.message_id = e.message_id AND e.model_id = %s
+    ORDER BY m.created
+""", (EMBEDDING_MODEL_NAME,))
+
+if not message_ids:
+    print("❌ No message embeddings found.")
+    exit(1)
+
+# Step 2: Normalize and build the index configured in index_config.json
+faiss.normalize_L2(embeddings)
+index_config = load_index_config(INDEX_CONFIG_PATH)
+index = build_index(embeddings, index_config)
+print(f"🏗️ Built {index_config['factory']} index over {len(message_ids)} messages")
+
+# Step 3: Message → thread map and the thread's space/created for filtering
+thread_ids = fetch_thread_ids(conn, message_ids)
+save_thread_map(THREAD_MAP_PATH, ThreadMap.from_ids(thread_ids))
+save_metadata(THREAD_METADATA_PATH, fetch_metadata(conn, thread_ids))
+print(f"✅ Thread map saved: {len(message_ids)} messages in {len(set(thread_ids))} threads")
+
+# Step 4: Id map, re-rank vectors (quantized indexes only) and tombstones, then the index.
+# The index goes last and atomically, then the manifest naming this build: until it is
+# written a hot reload rejects the files rather than pairing them with the previous build.
+save_id_map(THREAD_ID_MAP_PATH, message_ids)
+sync_exact_vectors(THREAD_VECTORS_PATH, index, embeddings)
+save_tombstones(THREAD_TOMBSTONES_PATH, np.zeros(len(message_ids), dtype=np.uint8))
+write_index_atomic(index, THREAD_INDEX_PATH)
+build_id = write_manifest(THREAD_INDEX_PATH, [
+    THREAD_ID_MAP_PATH, THREAD_VECTORS_PATH, THREAD_TOMBSTONES_PATH, THREAD_METADATA_PATH, THREAD_MAP_PATH
+])
+print(f"✅ Thread index saved to {THREAD_INDEX_PATH} (build {build_id})")
+
+# Step 5: Embedding watermark for update_faiss_index.py --mode thread
+with conn.cursor() as cur:
+    cur.execute("SELECT MAX(embedded_at) FROM embeddings WHERE model_id = %s", (EMBEDDING_MODEL_NAME,))
+    last_embedded_at = cur.fetchone()[0]
+write_state(THREAD_INDEX_STATE_PATH, {
+    "model_id": EMBEDDING_MODEL_NAME,
+    "mode": "thread",
+    "index_config": index_config,
+    "last_embedded_at": last_embedded_at.isoformat() if last_embedded_at else None,
+    "ntotal": len(message_ids),
+    "tombstones": 0,
+    "build_id": build_id,
+})
+print("✅ Tombstones and index state reset")
+
+conn.close()
@@ -0,0 +1,102 @@
+import struct
+
+import numpy as np
+import pytest
+
+from embedding_io import _BinaryCopyDecoder, load_embeddings
+
+
+def _copy_stream(rows, dim, extension=b""):
+    """PostgreSQL binary COPY output for (message_id, pgvector) rows."""
+    out = bytearray(b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, len(extension)) + extension)
+    for message_id, vector in rows:
+        encoded = message_id.encode("utf-8")
+        out += struct.pack(">hi", 2, len(encoded)) + encoded
+        out += struct.pack(">ihh", 4 + 4 * dim, dim, 0) + np.asarray(vector, dtype=">f4").tobytes()
+    return bytes(out + struct.pack(">h", -1))
+
+
+def _rows(n, dim, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+    return [(f"msg-{i}-é", vectors[i]) for i in range(n)], vectors
+
+
+@pytest.mark.parametrize("chunk", [1, 3, 17, 1 << 20])
+def test_decodes_rows_in_any_chunking(chunk):
+    rows, vectors = _rows(5, 8)
+    stream = _copy_stream(rows, 8, extension=b"ext!")
+    decoder = _BinaryCopyDecoder(expected_rows=5, dim=8)
+    for i in range(0, len(stream), chunk):
+        assert decoder.write(stream[i:i + chunk]) == len(stream[i:i + chunk])
+    assert decoder.message_ids == [message_id for message_id, _ in rows]
+    np.testing.assert_array_equal(decoder.vectors[:5], vectors)
+
+
+def test_grows_past_the_expected_row_count():
+    rows, vectors = _rows(9, 4)
+    decoder = _BinaryCopyDecoder(expected_rows=2, dim=4)
+    decoder.write(_copy_stream(rows, 4))
+    assert len(decoder.message_ids) == 9
+    np.testing.assert_array_equal(decoder.vectors[:9], vectors)
+
+
+def test_rejects_other_streams_and_dimensions():
+    with pytest.raises(ValueError, match="binary COPY"):
+        _BinaryCopyDecoder(1, 4).write(b"id,vector\n" + b"x" * 32)
+    rows, _ = _rows(1, 4)
+    with pytest.raises(ValueError, match="is 20 bytes, expected 36 for dim 8"):
+        _BinaryCopyDecoder(1, 8).write(_copy_stream(rows, 4))
+
+
+class _FakeCursor:
+    def __init__(self, stream, count):
+        self.stream = stream
+        self.count = count
+        self.statements = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def mogrify(self, query, params):
+        return (query % tuple(f"'{p}'" for p in params)).encode("utf-8")
+
+    def execute(self, sql):
+        self.statements.append(sql)
+
+    def fetchone(self):
+        return (self.count,)
+
+    def copy_expert(self, sql, file, size):
+        self.statements.append(sql)
+        for i in range(0, len(self.stream), 10):
+            file.write(self.stream[i:i + 10])
+
+
+class _FakeConn:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self):
+        return self._cursor
+
+
+def test_load_embeddings_trims_to_the_rows_received():
+    rows, vectors = _rows(3, 6)
+    cursor = _FakeCursor(_copy_stream(rows, 6), count=5)  # rows deleted between COUNT and COPY
+    message_ids, matrix = load_embeddings(_FakeConn(cursor), "SELECT message_id, vector FROM e WHERE m = %s",
+                                          ("model",), dim=6)
+    assert message_ids == [message_id for message_id, _ in rows]
+    assert matrix.dtype == np.float32 and matrix.shape == (3, 6)
+    np.testing.assert_array_equal(matrix, vectors)
+    assert cursor.statements[-1].startswith("COPY (SELECT message_id, vector FROM e WHERE m = 'model')")
+    assert "FORMAT binary" in cursor.statements[-1]
+
+
+def test_load_embeddings_rejects_a_truncated_stream():
+    rows, _ = _rows(3, 6)
+    cursor = _FakeCursor(_copy_stream(rows, 6)[:-30], count=3)
+    with pytest.raises(ValueError, match="without its trailer after 2 rows"):
+        load_embeddings(_FakeConn(cursor), "SELECT message_id, vector FROM e WHERE m = %s", ("model",), dim=6)
@@ -0,0 +1,35 @@
+import pickle
+
+import numpy as np
+
+from id_map import IdMap, load_id_map, save_id_map
+
+IDS = ["Y2lzY29zcGFyazovL3VzL01FU1NBR0UvYQ", "short", "ünïcode-id"]
+
+
+def test_resolve_maps_a_result_matrix_and_marks_unfilled_positions():
+    id_map = IdMap.from_ids(IDS)
+    resolved = id_map.resolve(np.array([[2, 0, -1], [1, 3, 0]]))
+    assert resolved.shape == (2, 3)
+    assert resolved.tolist() == [[IDS[2], IDS[0], None], [IDS[1], None, IDS[0]]]
+
+
+def test_saved_map_round_trips_memory_mapped(tmp_path):
+    path = str(tmp_path / "ids.npy")
+    save_id_map(path, IDS)
+    id_map = load_id_map(path)
+    assert isinstance(id_map.ids, np.memmap)
+    assert [id_map[i] for i in range(len(id_map))] == IDS
+    assert not (tmp_path / "ids.npy.tmp").exists()
+
+
+def test_legacy_pickle_and_ids_file_are_converted(tmp_path):
+    pkl = tmp_path / "faiss_id_map.pkl"
+    with open(pkl, "wb") as f:
+        pickle.dump({i: msg_id for i, msg_id in enumerate(IDS)}, f)
+    ids_file = tmp_path / "index.ids"
+    ids_file.write_text("\n".join(IDS) + "\n", encoding="utf-8")
+    for path in (pkl, ids_file):
+        id_map = load_id_map(str(path))
+        assert id_map.ids.dtype.kind == "S"
+        assert id_map.resolve(np.array([0, 1, 2])).tolist() == IDS
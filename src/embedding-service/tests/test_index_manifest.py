@@ -0,0 +1,71 @@
+import os
+
+import numpy as np
+import pytest
+
+from index_store import manifest_path, update_manifest, verify_manifest, write_manifest
+
+
+@pytest.fixture
+def build(tmp_path):
+    index = tmp_path / "index.bin"
+    side = tmp_path / "index.tombstones.npy"
+    index.write_bytes(b"index-1")
+    np.save(side, np.zeros(4, dtype=np.uint8))
+    build_id = write_manifest(str(index), [str(side), str(tmp_path / "absent.npy")])
+    return str(index), str(side), build_id
+
+
+def test_unchanged_files_verify(build):
+    index, side, build_id = build
+    assert verify_manifest(index, [side]) == build_id
+    assert verify_manifest(index, [side], full=True) == build_id
+
+
+def test_rewritten_side_file_of_the_same_size_is_rejected(build):
+    index, side, _ = build
+    stat = os.stat(side)
+    np.save(side, np.ones(4, dtype=np.uint8))
+    os.utime(side, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    with pytest.raises(ValueError, match="does not match"):
+        verify_manifest(index, [side])
+
+
+def test_full_check_catches_content_behind_a_preserved_mtime(build):
+    index, side, _ = build
+    stat = os.stat(side)
+    np.save(side, np.ones(4, dtype=np.uint8))
+    os.utime(side, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert verify_manifest(index, [side])  # size and mtime agree
+    with pytest.raises(ValueError, match="content does not match"):
+        verify_manifest(index, [side], full=True)
+
+
+def test_missing_and_unlisted_files_are_rejected(build, tmp_path):
+    index, side, _ = build
+    extra = tmp_path / "index.vectors.npy"
+    np.save(extra, np.zeros((4, 2), dtype=np.float32))
+    with pytest.raises(ValueError, match="not part of index build"):
+        verify_manifest(index, [side, str(extra)])
+    os.remove(side)
+    with pytest.raises(ValueError, match="is missing"):
+        verify_manifest(index, [side])
+
+
+def test_index_without_manifest_is_unchecked(build):
+    index, side, _ = build
+    os.remove(manifest_path(index))
+    assert verify_manifest(index, [side]) is None
+
+
+def test_optional_files_are_checked_only_when_listed(build, tmp_path):
+    index, side, build_id = build
+    answers = tmp_path / "index.answers.npy"
+    np.save(answers, np.zeros(3, dtype=np.uint8))
+    assert verify_manifest(index, [side], optional=(str(answers),)) == build_id
+    new_build_id = update_manifest(index, [str(answers)])
+    assert new_build_id != build_id
+    assert verify_manifest(index, [side], optional=(str(answers),)) == new_build_id
+    np.save(answers, np.ones(5, dtype=np.uint8))
+    with pytest.raises(ValueError, match="does not match"):
+        verify_manifest(index, [side], optional=(str(answers),))
@@ -0,0 +1,51 @@
+from datetime import date, datetime
+
+import numpy as np
+
+from index_metadata import IndexMetadata, load_metadata, save_metadata
+
+SPACES = ["room-b", "room-a", "room-b", "room-c", "room-a"]
+CREATED = [datetime(2024, 1, 1, 12), datetime(2024, 2, 1), datetime(2024, 3, 1),
+           datetime(2024, 3, 1, 23, 59), datetime(2024, 4, 1)]
+
+
+def _metadata():
+    return IndexMetadata.from_rows(SPACES, CREATED)
+
+
+def test_no_filter_means_no_mask():
+    assert _metadata().mask() is None
+
+
+def test_space_mask():
+    metadata = _metadata()
+    assert metadata.mask(space_id="room-a").tolist() == [False, True, False, False, True]
+    assert not metadata.mask(space_id="room-z").any()
+    assert not metadata.mask(space_id="room-0").any()  # sorts before every known space
+
+
+def test_date_masks_are_since_inclusive_until_exclusive():
+    metadata = _metadata()
+    assert metadata.mask(since=datetime(2024, 3, 1)).tolist() == [False, False, True, True, True]
+    assert metadata.mask(until=datetime(2024, 3, 1)).tolist() == [True, True, False, False, False]
+    # Days from the API are midnight boundaries
+    assert metadata.mask(since=date(2024, 2, 1), until=date(2024, 3, 2)).tolist() == [False, True, True, True, False]
+
+
+def test_filters_combine():
+    metadata = _metadata()
+    assert metadata.mask(space_id="room-b", since=date(2024, 2, 1)).tolist() == [False, False, True, False, False]
+
+
+def test_extend_take_and_round_trip(tmp_path):
+    metadata = _metadata().extend(IndexMetadata.from_rows(["room-d"], [datetime(2024, 5, 1)]))
+    assert metadata.mask(space_id="room-b").tolist() == [True, False, True, False, False, False]
+    assert metadata.mask(space_id="room-d").tolist() == [False] * 5 + [True]
+    live = metadata.take(np.array([1, 3, 5]))
+    assert live.mask(space_id="room-a").tolist() == [True, False, False]
+
+    path = str(tmp_path / "index.metadata.npz")
+    save_metadata(path, live)
+    loaded = load_metadata(path)
+    assert loaded.mask(since=date(2024, 3, 1)).tolist() == [False, True, True]
+    assert load_metadata(str(tmp_path / "absent.npz")) is None
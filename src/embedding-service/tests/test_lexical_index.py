@@ -0,0 +1,117 @@
+import math
+from collections import Counter
+from datetime import datetime
+
+import pytest
+
+from index_metadata import IndexMetadata
+from lexical_index import LexicalIndex, tokenize
+
+DOCS = {
+    "t1": "Calls drop with ERR_CONN-504 after upgrading to v2.14.1",
+    "t2": "How do I list rooms with api/v1/rooms? The rooms endpoint returns 403",
+    "t3": "Meeting audio drops every few minutes, audio works in the browser",
+    "t4": "ERR_CONN-504 again: the proxy closes idle connections",
+    "t5": "Rooms are missing from the sidebar after the upgrade",
+}
+
+
+def _metadata(doc_ids, space="space-a"):
+    return IndexMetadata.from_rows([space] * len(doc_ids), [datetime(2024, 1, 1)] * len(doc_ids))
+
+
+def _build(docs):
+    return LexicalIndex.build(list(docs), list(docs.values()), _metadata(docs))
+
+
+def _naive_bm25(docs, query, k1=1.2, b=0.75):
+    """Textbook BM25 (Lucene idf) over docs, one document at a time."""
+    counts = {doc_id: Counter(tokenize(text)) for doc_id, text in docs.items()}
+    avgdl = sum(sum(c.values()) for c in counts.values()) / len(counts)
+    scores = {}
+    for doc_id, tf in counts.items():
+        dl = sum(tf.values())
+        score = 0.0
+        for term in set(tokenize(query)):
+            df = sum(1 for c in counts.values() if term in c)
+            if not tf[term]:
+                continue
+            idf = math.log(1 + (len(counts) - df + 0.5) / (df + 0.5))
+            score += idf * tf[term] * (k1 + 1) / (tf[term] + k1 * (1 - b + b * dl / avgdl))
+        if score > 0:
+            scores[doc_id] = score
+    return scores
+
+
+def test_tokenize_keeps_identifiers_and_their_parts():
+    tokens = tokenize("See ERR_CONN-504 in api/v1/rooms")
+    assert "err_conn-504" in tokens
+    assert {"err", "conn", "504", "api/v1/rooms", "rooms"} <= set(tokens)
+
+
+@pytest.mark.parametrize("query", ["ERR_CONN-504", "rooms upgrade", "audio drops", "rooms api/v1/rooms 403"])
+def test_search_matches_naive_bm25(query):
+    index = _build(DOCS)
+    expected = _naive_bm25(DOCS, query)
+    doc_ids, scores = index.search(query, k=len(DOCS))
+    assert set(doc_ids) == set(expected)
+    for doc_id, score in zip(doc_ids, scores):
+        assert score == pytest.approx(expected[doc_id], rel=1e-5)
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_search_returns_top_k():
+    doc_ids, _ = _build(DOCS).search("rooms upgrade audio", k=2)
+    expected = _naive_bm25(DOCS, "rooms upgrade audio")
+    assert doc_ids == sorted(expected, key=expected.get, reverse=True)[:2]
+
+
+def test_unknown_terms_and_empty_queries_return_nothing():
+    index = _build(DOCS)
+    assert index.search("kubernetes", k=5) == ([], [])
+    assert index.search("", k=5) == ([], [])
+
+
+def test_allowed_mask_filters_documents():
+    index = _build(DOCS)
+    allowed = index.metadata.mask("space-a", None, None).copy()
+    allowed[list(DOCS).index("t1")] = False
+    doc_ids, _ = index.search("ERR_CONN-504", k=5, allowed=allowed)
+    assert doc_ids == ["t4"]
+
+
+def test_updated_and_compacted_index_scores_like_a_fresh_build():
+    changed = {"t2": "Rooms endpoint fixed, api/v1/rooms works again", "t6": "New room audio issue"}
+    index = _build(DOCS).updated(list(changed), list(changed.values()), _metadata(changed), removed={"t3"})
+    current = {doc_id: text for doc_id, text in {**DOCS, **changed}.items() if doc_id != "t3"}
+    assert index.live_count == len(current)
+
+    fresh = _build(current)
+    compacted = index.compact()
+    assert len(compacted) == len(current)
+    for query in ("rooms", "audio", "ERR_CONN-504 upgrade"):
+        ids, scores = compacted.search(query, k=len(current))
+        fresh_ids, fresh_scores = fresh.search(query, k=len(current))
+        assert dict(zip(ids, scores)) == pytest.approx(dict(zip(fresh_ids, fresh_scores)))
+        # Before compaction, replaced and removed documents are never returned
+        assert "t3" not in index.search(query, k=len(DOCS) + 1)[0]
+
+
+def test_deletes_before_compaction_score_like_a_fresh_build():
+    # Many documents share "rooms", then most of them are removed: counting their
+    # tombstoned postings in df would push idf below zero
+    docs = {f"r{i}": f"rooms sidebar issue {i}" for i in range(8)}
+    docs.update({"x1": "rooms audio", "x2": "audio drops"})
+    removed = {f"r{i}" for i in range(7)}
+    index = _build(docs).updated([], [], _metadata([]), removed=removed)
+    changed = {"x2": "audio drops after rooms upgrade"}
+    index = index.updated(list(changed), list(changed.values()), _metadata(changed))
+    current = {doc_id: text for doc_id, text in {**docs, **changed}.items() if doc_id not in removed}
+
+    fresh = _build(current)
+    for query in ("rooms", "audio", "rooms audio upgrade", "sidebar"):
+        ids, scores = index.search(query, k=len(docs))
+        fresh_ids, fresh_scores = fresh.search(query, k=len(docs))
+        assert ids == fresh_ids
+        assert scores == pytest.approx(fresh_scores, rel=1e-5)
+        assert all(score > 0 for score in scores)
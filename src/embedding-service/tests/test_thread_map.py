@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from thread_map import ThreadMap, load_thread_map, save_thread_map
+
+# Positions 0-2 belong to thread "a", 3-4 to "b", 5 to "c"
+THREADS = ThreadMap.from_ids(["a", "a", "a", "b", "b", "c"])
+I = np.array([[0, 3, 1, 5, 2, 4],
+              [5, -1, -1, -1, -1, -1]])
+D = np.array([[0.9, 0.8, 0.7, 0.6, 0.1, 0.5],
+              [0.4, 0.0, 0.0, 0.0, 0.0, 0.0]], dtype=np.float32)
+
+
+def _aggregate(how, k=3, top_n=2):
+    return [(ids, pytest.approx(scores)) for ids, scores in THREADS.aggregate(D, I, k, how, top_n)]
+
+
+def test_max():
+    assert _aggregate("max") == [(["a", "b", "c"], [0.9, 0.8, 0.6]), (["c"], [0.4])]
+
+
+def test_mean():
+    # a: (0.9 + 0.7 + 0.1) / 3, b: (0.8 + 0.5) / 2
+    assert _aggregate("mean") == [(["b", "c", "a"], [0.65, 0.6, 1.7 / 3]), (["c"], [0.4])]
+
+
+def test_topk_sum_counts_only_the_best_top_n_hits():
+    # a: 0.9 + 0.7 (0.1 is the third hit), b: 0.8 + 0.5
+    assert _aggregate("topk_sum") == [(["a", "b", "c"], [1.6, 1.3, 0.6]), (["c"], [0.4])]
+    assert THREADS.aggregate(D, I, 3, "topk_sum", top_n=1) == _aggregate("max")
+
+
+def test_k_truncates_per_row_and_empty_results():
+    assert _aggregate("max", k=1) == [(["a"], [0.9]), (["c"], [0.4])]
+    assert THREADS.aggregate(D[:1], np.full((1, 6), -1), k=3) == [([], [])]
+
+
+def test_unknown_aggregation_is_rejected():
+    with pytest.raises(ValueError, match="Unknown thread aggregation"):
+        THREADS.aggregate(D, I, 3, how="median")
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "threads.npz")
+    save_thread_map(path, THREADS)
+    assert load_thread_map(path).thread_ids() == ["a", "a", "a", "b", "b", "c"]
+    assert load_thread_map(str(tmp_path / "absent.npz")) is None
@@ -0,0 +1,50 @@
+import faiss
+import numpy as np
+
+from index_store import build_index, live_selector, load_tombstones, save_tombstones, search_params
+
+CONFIG = {"factory": "HNSW16,Flat", "metric": "inner_product", "efConstruction": 40, "efSearch": 64}
+
+
+def _vectors(n, seed, dim=16):
+    vectors = np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def _search(index, queries, tombstones, k=5):
+    selector, _bitmap = live_selector(tombstones)
+    _, I = index.search(queries, k, params=search_params(index, selector))
+    return I
+
+
+def test_appended_vectors_are_found_and_tombstoned_ones_are_not(tmp_path):
+    base, appended = _vectors(200, seed=1), _vectors(50, seed=2)
+    index = build_index(base, CONFIG)
+    index.add(appended)
+    path = str(tmp_path / "index.tombstones.npy")
+    assert not load_tombstones(path, index.ntotal).any()
+    assert live_selector(load_tombstones(path, index.ntotal)) == (None, None)
+
+    queries = np.concatenate([base[:10], appended[:10]])
+    positions = np.concatenate([np.arange(10), 200 + np.arange(10)])
+    assert (_search(index, queries, np.zeros(index.ntotal, dtype=np.uint8))[:, 0] == positions).all()
+
+    # Re-embedding a message tombstones its old position and appends the new vector
+    tombstones = np.zeros(index.ntotal, dtype=np.uint8)
+    tombstones[positions] = 1
+    index.add(queries)
+    tombstones = np.concatenate([tombstones, np.zeros(len(queries), dtype=np.uint8)])
+    save_tombstones(path, tombstones)
+    tombstones = load_tombstones(path, index.ntotal)
+    assert tombstones.dtype == np.uint8 and len(tombstones) == index.ntotal
+
+    I = _search(index, queries, tombstones)
+    assert not np.isin(I, positions).any()
+    assert (I[:, 0] == 250 + np.arange(20)).all()
+
+
+def test_fully_tombstoned_index_returns_no_hits():
+    index = build_index(_vectors(30, seed=3), CONFIG)
+    I = _search(index, _vectors(2, seed=4), np.ones(index.ntotal, dtype=np.uint8))
+    assert (I == -1).all()
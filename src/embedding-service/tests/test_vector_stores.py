@@ -0,0 +1,48 @@
+from argparse import Namespace
+
+import numpy as np
+import pytest
+
+import verify_vector_stores
+from id_map import IdMap
+from vector_store import ExactStore, FaissStore, PgvectorStore, VectorStore
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    args = Namespace(synthetic=3000, spaces=6, dim=32, k=5, queries=50, noise=0.05,
+                     min_recall=0.95, score_tolerance=1e-3, backends=["exact", "faiss"])
+    message_ids, vectors, metadata = verify_vector_stores._load_corpus(args, None)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), args.queries, replace=False)]
+    queries = queries + args.noise * rng.standard_normal(queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    stores = verify_vector_stores._stores(args, None, message_ids, vectors, metadata)
+    return args, message_ids, vectors, metadata, queries, stores
+
+
+@pytest.mark.parametrize("backend", ["exact", "faiss"])
+def test_store_conforms(corpus, backend):
+    args, message_ids, vectors, metadata, queries, stores = corpus
+    assert verify_vector_stores._check(stores[backend], args, message_ids, vectors, metadata, queries) == []
+
+
+def test_exact_store_skips_dead_positions(corpus):
+    _, message_ids, vectors, metadata, queries, _ = corpus
+    live = np.ones(len(vectors), dtype=bool)
+    live[::2] = False
+    store = ExactStore(vectors, IdMap.from_ids(message_ids), metadata, live)
+    dead = {message_ids[i] for i in np.flatnonzero(~live)}
+    for ids, _ in store.search(queries, 10):
+        assert len(ids) == 10 and not dead & set(ids)
+
+
+def test_backends_implement_the_whole_interface():
+    class Partial(VectorStore):
+        def __len__(self):
+            return 0
+
+    with pytest.raises(TypeError):
+        Partial()
+    for backend in (ExactStore, FaissStore, PgvectorStore):
+        assert not backend.__abstractmethods__
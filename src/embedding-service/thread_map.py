@@ -0,0 +1,102 @@
+"""
+Message → thread map for the whole-thread index (INDEX_MODE=thread), where parent
+and reply messages are all embedded and a query's message hits are aggregated into
+thread scores.
+
+Stored as one .npz next to the thread index, aligned with index positions:
+    threads   sorted unique parent message_ids (S<n>)
+    codes     int32 per position, index into threads
+
+It is small and fully memory-resident, so a whole FAISS result matrix is grouped
+by thread with a few NumPy calls and no per-hit DB lookups. The map is rewritten by
+update_faiss_index.py --mode thread whenever a message moves to another thread
+(e.g. a thread merge), without touching the FAISS index itself.
+"""
+import os
+
+import numpy as np
+
+AGGREGATIONS = ("max", "mean", "topk_sum")
+
+
+class ThreadMap:
+    def __init__(self, threads: np.ndarray, codes: np.ndarray):
+        self.threads = threads
+        self.codes = codes
+
+    def __len__(self):
+        return len(self.codes)
+
+    @classmethod
+    def from_ids(cls, thread_ids: list[str]) -> "ThreadMap":
+        """Map from the thread (parent message_id) of each index position."""
+        encoded = [thread_id.encode("utf-8") for thread_id in thread_ids]
+        width = max((len(e) for e in encoded), default=1)
+        threads, codes = np.unique(np.array(encoded, dtype=f"S{width}"), return_inverse=True)
+        return cls(threads, codes.astype(np.int32))
+
+    def thread_ids(self) -> list[str]:
+        return np.char.decode(self.threads[self.codes], "utf-8").tolist()
+
+    def aggregate(self, D: np.ndarray, I: np.ndarray, k: int, how: str = "max", top_n: int = 3):
+        """
+        Group message hits (D similarities, I positions; -1 = no hit) by thread and
+        score each thread by the max, mean or sum of its top_n hit scores.
+        Returns [(thread_ids, scores)] per query row, best k threads first.
+        """
+        if how not in AGGREGATIONS:
+            raise ValueError(f"Unknown thread aggregation {how!r}; expected one of {AGGREGATIONS}")
+        rows, cols = np.nonzero(I >= 0)
+        if not len(rows):
+            return [([], []) for _ in range(len(I))]
+        n_threads = len(self.threads)
+        keys = rows.astype(np.int64) * n_threads + self.codes[I[rows, cols]]
+        scores = D[rows, cols].astype(np.float32)
+
+        # Sort hits by (row, thread), best score first within each group
+        order = np.lexsort((-scores, keys))
+        keys, scores = keys[order], scores[order]
+        first = np.r_[True, keys[1:] != keys[:-1]]
+        starts = np.flatnonzero(first)
+        group = np.cumsum(first) - 1
+        if how == "max":
+            thread_scores = scores[starts]
+        elif how == "mean":
+            thread_scores = np.add.reduceat(scores, starts) / np.diff(np.r_[starts, len(keys)])
+        else:
+            in_top = (np.arange(len(keys)) - starts[group]) < top_n
+            thread_scores = np.bincount(group, weights=np.where(in_top, scores, 0), minlength=len(starts))
+
+        # Best k threads per row
+        group_rows, group_codes = np.divmod(keys[starts], n_threads)
+        ranked = np.lexsort((-thread_scores, group_rows))
+        bounds = np.searchsorted(group_rows[ranked], np.arange(len(I) + 1))
+        results = []
+        for row in range(len(I)):
+            best = ranked[bounds[row]:min(bounds[row + 1], bounds[row] + k)]
+            results.append((np.char.decode(self.threads[group_codes[best]], "utf-8").tolist(),
+                            thread_scores[best].astype(float).tolist()))
+        return results
+
+
+def fetch_thread_ids(conn, message_ids: list[str]) -> list[str]:
+    """Thread (parent message_id) of each message; messages no longer present map to themselves."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT message_id, COALESCE(parent_id, message_id) FROM messages WHERE message_id = ANY(%s)",
+                    (list(message_ids),))
+        threads = dict(cur.fetchall())
+    return [threads.get(msg_id, msg_id) for msg_id in message_ids]
+
+
+def save_thread_map(path: str, thread_map: ThreadMap):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, threads=thread_map.threads, codes=thread_map.codes)
+    os.replace(tmp_path, path)
+
+
+def load_thread_map(path: str) -> ThreadMap | None:
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return ThreadMap(data["threads"], data["codes"])
@@ -0,0 +1,79 @@
+"""
+Bring the precomputed answer store (answer_store.py) up to date with thread_labels.
+
+Every label write in the labeler UI, and every edit or delete of a message's text,
+logs its thread in thread_label_changes (see the thread_label_changes and
+message_text_answer_changes migrations). This script re-materializes only those threads,
+copies every other record over unchanged, swaps the files in and prunes the applied
+log rows. It is cheap enough to run every few seconds (--watch); until it has run,
+the query assistant notices the labels generation moved on and answers from SQL
+instead, and swaps in the new store once it has caught up (engine.reload_answers),
+whether or not INDEX_WATCH_INTERVAL_SECONDS is set.
+
+A full rebuild (--full, or no store yet) re-reads every answered thread, e.g. after
+threads were merged or the labels table was truncated.
+
+Usage:
+    python update_answer_store.py
+    python update_answer_store.py --full
+    python update_answer_store.py --watch 10      # apply changes every 10s
+"""
+import argparse
+import time
+
+import psycopg2
+from config import DB_CONFIG, ANSWER_STORE_PATH, FAISS_INDEX_PATH
+from answer_store import (
+    AnswerStore, fetch_answer_records, load_answer_store, read_labels_generation, save_answer_store, store_files
+)
+from index_store import update_manifest
+
+
+def run(full: bool = False):
+    start = time.perf_counter()
+    conn = psycopg2.connect(**DB_CONFIG)
+    # Generation first: labels written after this point make the store look stale, never newer
+    labels_generation = read_labels_generation(conn)
+    with conn.cursor() as cur:
+        cur.execute("SELECT COALESCE(MAX(id), 0) FROM thread_label_changes")
+        last_change_id = cur.fetchone()[0]
+
+    store = None if full else load_answer_store(ANSWER_STORE_PATH, mmap=False)
+    if store is None:
+        print("📚 Building answer store from all labelled threads")
+        store = AnswerStore.build(fetch_answer_records(conn), labels_generation, last_change_id)
+    else:
+        with conn.cursor() as cur:
+            cur.execute("SELECT DISTINCT thread_id FROM thread_label_changes WHERE id > %s AND id <= %s",
+                        (store.last_change_id, last_change_id))
+            changed = [row[0] for row in cur.fetchall()]
+        if not changed and store.labels_generation == labels_generation:
+            conn.close()
+            print("✅ Answer store already up to date.")
+            return
+        # Threads that lost their last answer map to None and are dropped
+        records = dict.fromkeys(changed)
+        records.update(fetch_answer_records(conn, changed))
+        store = store.updated(records, labels_generation, last_change_id)
+        print(f"🔁 {len(changed)} threads re-materialized")
+
+    save_answer_store(ANSWER_STORE_PATH, store)
+    # The parent index's manifest lists the answer store; re-stamp it so the new files verify
+    update_manifest(FAISS_INDEX_PATH, list(store_files(ANSWER_STORE_PATH)))
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM thread_label_changes WHERE id <= %s", (last_change_id,))
+    conn.commit()
+    conn.close()
+    print(f"✅ Answer store saved in {time.perf_counter() - start:.2f}s: {len(store)} answered threads, "
+          f"labels generation {labels_generation}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply logged label changes to the precomputed answer store")
+    parser.add_argument("--full", action="store_true", help="Rebuild from every labelled thread")
+    parser.add_argument("--watch", type=float, default=0, help="Keep applying changes every N seconds")
+    args = parser.parse_args()
+    run(args.full)
+    while args.watch > 0:
+        time.sleep(args.watch)
+        run()
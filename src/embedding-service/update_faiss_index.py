@@ -0,0 +1,269 @@
+"""
+Incrementally bring the persisted FAISS index in line with the embeddings table,
+instead of rebuilding it with setup_faiss_index_and_idmap.py.
+
+- Parent messages embedded since the last run are appended to the HNSW graph.
+  Existing positions (and therefore id map entries) never move, so a hot-reloading
+  query assistant keeps resolving results the same way.
+- Threads that were deleted, merged into another thread (no longer a parent) or
+  re-embedded are tombstoned: their positions stay in the graph but are masked out
+  at search time. A re-embedded thread gets a fresh position with the new vector.
+- Once tombstones exceed FAISS_COMPACT_TOMBSTONE_RATIO of the index, it is compacted:
+  a clean index of the type in index_config.json is built from the live vectors,
+  read back out of the index when its storage is exact, or from the re-rank vectors
+  file of a quantized index (no DB re-fetch needed).
+- Quantized indexes get the appended vectors added to their re-rank vectors file.
+- The filter metadata (space, created) follows every append and compaction; an
+  index built before it existed gets it backfilled on the next run.
+- With --mode thread the whole-thread index (setup_thread_index.py) is updated the
+  same way over every embedded message, and its message → thread map is refreshed
+  so messages moved by a thread merge are aggregated under their new thread.
+- In parent mode the BM25 lexical index re-tokenizes only threads with messages created since the
+  last run (plus threads that absorbed a merged thread); their old documents are
+  tombstoned and compacted away at the same ratio.
+
+Usage:
+    python update_faiss_index.py
+    python update_faiss_index.py --compact        # force a compaction
+    python update_faiss_index.py --mode thread    # the whole-thread index
+"""
+import argparse
+import time
+from datetime import datetime
+
+import faiss
+import numpy as np
+import psycopg2
+from config import (
+    DB_CONFIG, EMBEDDING_MODEL_NAME, FAISS_INDEX_PATH, FAISS_ID_MAP_PATH, FAISS_TOMBSTONES_PATH,
+    FAISS_INDEX_STATE_PATH, FAISS_VECTORS_PATH, FAISS_METADATA_PATH, FAISS_COMPACT_TOMBSTONE_RATIO,
+    INDEX_CONFIG_PATH, LEXICAL_INDEX_PATH, THREAD_INDEX_PATH, THREAD_ID_MAP_PATH, THREAD_TOMBSTONES_PATH,
+    THREAD_INDEX_STATE_PATH, THREAD_VECTORS_PATH, THREAD_METADATA_PATH, THREAD_MAP_PATH
+)
+from embedding_io import load_embeddings
+from id_map import load_id_map, save_id_map
+from index_metadata import fetch_metadata, load_metadata, save_metadata
+from lexical_index import LexicalIndex, fetch_threads, load_lexical_index, save_lexical_index
+from thread_map import ThreadMap, fetch_thread_ids, load_thread_map, save_thread_map
+from index_store import (
+    load_tombstones, save_tombstones, read_state, write_state, write_index_atomic, write_manifest, update_manifest,
+    load_index_config, build_index, has_exact_storage, load_exact_vectors, sync_exact_vectors
+)
+
+
+# Files making up each index mode's FAISS index
+_FILES = {
+    "parent": dict(index=FAISS_INDEX_PATH, id_map=FAISS_ID_MAP_PATH, tombstones=FAISS_TOMBSTONES_PATH,
+                   state=FAISS_INDEX_STATE_PATH, vectors=FAISS_VECTORS_PATH, metadata=FAISS_METADATA_PATH,
+                   threads=None),
+    "thread": dict(index=THREAD_INDEX_PATH, id_map=THREAD_ID_MAP_PATH, tombstones=THREAD_TOMBSTONES_PATH,
+                   state=THREAD_INDEX_STATE_PATH, vectors=THREAD_VECTORS_PATH, metadata=THREAD_METADATA_PATH,
+                   threads=THREAD_MAP_PATH),
+}
+
+
+def _indexed_embeddings(conn, mode: str):
+    """message_id → embedded_at for every message the mode indexes (parents, or all messages)."""
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT m.message_id, e.embedded_at
+            FROM messages m
+            JOIN embeddings e ON m.message_id = e.message_id AND e.model_id = %s
+            {"WHERE m.parent_id IS NULL" if mode == "parent" else ""}
+        """, (EMBEDDING_MODEL_NAME,))
+        return dict(cur.fetchall())
+
+
+def _metadata_ids(conn, mode: str, message_ids: list[str]) -> list[str]:
+    """Messages whose space/created filter each position: itself, or its thread's parent."""
+    return message_ids if mode == "parent" else fetch_thread_ids(conn, message_ids)
+
+
+def _compact(conn, index, exact_vectors, message_ids: list[str], tombstones: np.ndarray, index_config: dict):
+    """
+    Build a clean index of the configured type from the live vectors. Flat-storage
+    indexes (Flat, HNSW-Flat) give back the exact vectors, quantized ones have them in
+    their re-rank file; anything else is re-fetched. Returns the live vectors as well.
+    """
+    live = np.flatnonzero(tombstones == 0)
+    live_ids = [message_ids[i] for i in live]
+    if has_exact_storage(index):
+        vectors = index.reconstruct_n(0, index.ntotal)[live]
+    elif exact_vectors is not None:
+        vectors = np.asarray(exact_vectors[live])
+    else:
+        fetched_ids, vectors = load_embeddings(conn, """
+            SELECT e.message_id, e.vector FROM embeddings e
+            WHERE e.model_id = %s AND e.message_id = ANY(%s)
+        """, (EMBEDDING_MODEL_NAME, live_ids), dim=index.d)
+        order = {msg_id: row for row, msg_id in enumerate(fetched_ids)}
+        vectors = vectors[[order[msg_id] for msg_id in live_ids]]
+        faiss.normalize_L2(vectors)
+    vectors = np.ascontiguousarray(vectors)
+    compacted = build_index(vectors, index_config)
+    return compacted, vectors, live_ids, np.zeros(len(live), dtype=np.uint8)
+
+
+def _update_lexical(conn, state: dict, force_compact: bool) -> bool:
+    """Re-index changed threads in the lexical index. Updates state's watermark; True if anything changed."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT MAX(created) FROM messages")
+        last_created = cur.fetchone()[0]
+    watermark = state.get("lexical_last_created")
+    lexical = load_lexical_index(LEXICAL_INDEX_PATH)
+
+    if lexical is None or watermark is None:
+        print("🔤 Building lexical index")
+        lexical = LexicalIndex.build(*fetch_threads(conn))
+    else:
+        with conn.cursor() as cur:
+            cur.execute("SELECT message_id FROM messages WHERE parent_id IS NULL")
+            parents = {row[0] for row in cur.fetchall()}
+            live_ids = set(np.char.decode(lexical.doc_ids[lexical.live], "utf-8").tolist())
+            removed = live_ids - parents
+            # Threads with new messages, and threads that absorbed a thread merged into them
+            cur.execute("""
+                SELECT DISTINCT COALESCE(parent_id, message_id) FROM messages
+                WHERE created > %s OR (message_id = ANY(%s) AND parent_id IS NOT NULL)
+            """, (datetime.fromisoformat(watermark), list(removed)))
+            changed = [msg_id for (msg_id,) in cur.fetchall() if msg_id in parents]
+        if not (changed or removed or force_compact):
+            return False
+        lexical = lexical.updated(*fetch_threads(conn, changed), removed=removed)
+        print(f"🔤 Lexical: {len(changed)} threads re-indexed, {len(removed)} removed")
+        ratio = 1 - lexical.live_count / len(lexical) if len(lexical) else 0.0
+        if force_compact or ratio > FAISS_COMPACT_TOMBSTONE_RATIO:
+            print(f"🧹 Compacting lexical index: {len(lexical) - lexical.live_count} tombstones ({ratio:.1%})")
+            lexical = lexical.compact()
+
+    save_lexical_index(LEXICAL_INDEX_PATH, lexical)
+    state["lexical_last_created"] = last_created.isoformat() if last_created else watermark
+    return True
+
+
+def run(force_compact: bool = False, mode: str = "parent"):
+    start = time.perf_counter()
+    files = _FILES[mode]
+    rebuild = "setup_faiss_index_and_idmap.py" if mode == "parent" else "setup_thread_index.py"
+    index = faiss.read_index(files["index"])
+    id_map = load_id_map(files["id_map"], mmap=False)
+    message_ids = [id_map[i] for i in range(len(id_map))]
+    tombstones = load_tombstones(files["tombstones"], index.ntotal).copy()
+    state = read_state(files["state"])
+    index_config = load_index_config(INDEX_CONFIG_PATH)
+    exact_vectors = load_exact_vectors(files["vectors"])
+    metadata = load_metadata(files["metadata"])
+
+    if index.ntotal != len(message_ids) or len(tombstones) != index.ntotal:
+        raise SystemExit(f"❌ Index, id map and tombstones disagree; rebuild with {rebuild}")
+    if exact_vectors is not None and len(exact_vectors) != index.ntotal:
+        raise SystemExit(f"❌ {files['vectors']} is out of date; rebuild with {rebuild}")
+    if metadata is not None and len(metadata) != index.ntotal:
+        raise SystemExit(f"❌ {files['metadata']} is out of date; rebuild with {rebuild}")
+    if state.get("model_id", EMBEDDING_MODEL_NAME) != EMBEDDING_MODEL_NAME:
+        raise SystemExit(f"❌ Index was built with {state['model_id']}; rebuild it for {EMBEDDING_MODEL_NAME}")
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    indexed = _indexed_embeddings(conn, mode)
+    backfill_metadata = metadata is None
+    if backfill_metadata:
+        print(f"🏷️ Backfilling filter metadata for {len(message_ids)} positions")
+        metadata = fetch_metadata(conn, _metadata_ids(conn, mode, message_ids))
+    last_embedded_at = datetime.fromisoformat(state["last_embedded_at"]) if state.get("last_embedded_at") else None
+
+    # Live position of each indexed message
+    position = {msg_id: i for i, msg_id in enumerate(message_ids) if not tombstones[i]}
+
+    removed = [msg_id for msg_id in position if msg_id not in indexed]
+    reembedded = [msg_id for msg_id in position
+                  if msg_id in indexed and last_embedded_at and indexed[msg_id] > last_embedded_at]
+    for msg_id in removed + reembedded:
+        tombstones[position.pop(msg_id)] = 1
+    to_add = [msg_id for msg_id in indexed if msg_id not in position]
+
+    if to_add:
+        new_ids, vectors = load_embeddings(conn, """
+            SELECT m.message_id, e.vector
+            FROM messages m
+            JOIN embeddings e ON m.message_id = e.message_id AND e.model_id = %s
+            WHERE m.message_id = ANY(%s)
+            ORDER BY m.created
+        """, (EMBEDDING_MODEL_NAME, to_add), dim=index.d)
+        faiss.normalize_L2(vectors)
+        index.add(vectors)
+        if exact_vectors is not None:
+            exact_vectors = np.concatenate([exact_vectors, vectors])
+        metadata = metadata.extend(fetch_metadata(conn, _metadata_ids(conn, mode, new_ids)))
+        message_ids.extend(new_ids)
+        tombstones = np.concatenate([tombstones, np.zeros(len(new_ids), dtype=np.uint8)])
+
+    print(f"➕ {len(to_add)} appended, 🪦 {len(removed)} removed, 🔁 {len(reembedded)} re-embedded")
+
+    ratio = float(tombstones.mean()) if len(tombstones) else 0.0
+    compacted = force_compact or ratio > FAISS_COMPACT_TOMBSTONE_RATIO
+    if compacted:
+        print(f"🧹 Compacting: {int(tombstones.sum())} tombstones ({ratio:.1%} of {index.ntotal})")
+        metadata = metadata.take(np.flatnonzero(tombstones == 0))
+        index, exact_vectors, message_ids, tombstones = _compact(
+            conn, index, exact_vectors, message_ids, tombstones, index_config
+        )
+
+    # Thread mode: regroup messages whose thread changed (merges); filters follow the thread
+    threads_changed = False
+    if files["threads"]:
+        thread_ids = fetch_thread_ids(conn, message_ids)
+        current = load_thread_map(files["threads"])
+        threads_changed = current is None or len(current) != len(thread_ids) or current.thread_ids() != thread_ids
+        if threads_changed:
+            print(f"🧵 Thread map refreshed for {len(thread_ids)} messages")
+            thread_map = ThreadMap.from_ids(thread_ids)
+            metadata = fetch_metadata(conn, thread_ids)
+    # The lexical index and its watermark belong to the parent index's state
+    lexical_changed = mode == "parent" and _update_lexical(conn, state, force_compact)
+    conn.close()
+
+    if not (to_add or removed or reembedded or compacted or backfill_metadata or threads_changed):
+        if lexical_changed:
+            update_manifest(files["index"], [LEXICAL_INDEX_PATH])
+            write_state(files["state"], state)
+        print("✅ Index already up to date.")
+        return
+
+    # Side files first, then the index, then a manifest naming the new build. A hot reload
+    # in between sees files that don't match the manifest and is rejected and retried,
+    # even when a compaction plus appends left every file with its old length
+    save_id_map(files["id_map"], message_ids)
+    save_tombstones(files["tombstones"], tombstones)
+    save_metadata(files["metadata"], metadata)
+    if threads_changed:
+        save_thread_map(files["threads"], thread_map)
+    if exact_vectors is not None or compacted:
+        sync_exact_vectors(files["vectors"], index, exact_vectors)
+    write_index_atomic(index, files["index"])
+    # Re-stamp what this run wrote; the answer store's entries (update_answer_store.py) are kept
+    manifest_files = [files["id_map"], files["tombstones"], files["vectors"], files["metadata"], files["threads"],
+                      LEXICAL_INDEX_PATH if lexical_changed else None]
+    build_id = (update_manifest(files["index"], [files["index"], *manifest_files])
+                or write_manifest(files["index"], manifest_files))
+    state.update({
+        "model_id": EMBEDDING_MODEL_NAME,
+        "index_config": index_config if compacted else state.get("index_config"),
+        "last_embedded_at": max(indexed.values()).isoformat() if indexed else state.get("last_embedded_at"),
+        "ntotal": index.ntotal,
+        "tombstones": int(tombstones.sum()),
+        "build_id": build_id,
+    })
+    if compacted:
+        state["compacted_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    write_state(files["state"], state)
+    print(f"✅ Index updated in {time.perf_counter() - start:.2f}s: {index.ntotal} vectors, "
+          f"{int(tombstones.sum())} tombstoned (build {build_id})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Append/tombstone threads in the FAISS index")
+    parser.add_argument("--compact", action="store_true", help="Rebuild without tombstones regardless of ratio")
+    parser.add_argument("--mode", choices=sorted(_FILES), default="parent",
+                        help="parent: thread roots only; thread: every message (setup_thread_index.py)")
+    args = parser.parse_args()
+    run(args.compact, args.mode)
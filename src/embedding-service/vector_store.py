@@ -0,0 +1,260 @@
+"""
+Interchangeable nearest-neighbour backends behind one interface, selected with
+SEARCH_BACKEND:
+
+    faiss     the FAISS index file (HNSW per index_config.json), with tombstones,
+              filter bitmaps and exact re-ranking of quantized storage
+    exact     the same vectors as one normalized in-memory matrix; a query is one
+              BLAS matmul plus argpartition. Exact, and faster than walking a graph
+              for corpora of a few thousand threads (e.g. a single space)
+    pgvector  the HNSW index on embeddings.vector inside Postgres (pgvector_search.py)
+
+Every store takes normalized float32 queries, scores by inner product (= cosine
+similarity) and returns the best first:
+    store.search(queries, k, ef_search=None, filters=NO_FILTERS) -> [(message_ids, scores)] per query
+filters is (space_id, since, until). ef_search is ignored by exact stores.
+
+faiss and exact stores serve the same index files, so they share index positions
+(id map, tombstones, filter metadata, thread map) and also offer
+    store.search_positions(queries, k, ef_search=None, allowed=None) -> (D, I)
+with FAISS conventions (-1 = no result), which the query assistant uses for filter
+masks and whole-thread aggregation. The pgvector store instead offers
+    store.search_threads(queries, k, ef_search=None, filters=NO_FILTERS)
+returning each hit's replies and labels from the same statement (and an async
+variant the query assistant runs on its connection pool).
+
+verify_vector_stores.py runs every backend through the same conformance checks and
+benchmark; tests/test_vector_stores.py runs them for faiss and exact on synthetic data.
+"""
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from id_map import IdMap
+from index_store import bitmap_selector, search_params, has_exact_storage, rerank, exact_search
+from pgvector_search import (
+    SETTINGS_SQL, ITERATIVE_SCAN_SQL, nearest_sql, search_sql, group_threads, search_params as pgvector_params
+)
+
+BACKENDS = ("faiss", "exact", "pgvector")
+NO_FILTERS = (None, None, None)
+
+
+class VectorStore(ABC):
+    name = ""
+
+    @property
+    def default_ef_search(self) -> int | None:
+        """efSearch used when a search passes none (None = not an HNSW store)."""
+        return None
+
+    @abstractmethod
+    def __len__(self):
+        ...
+
+    @abstractmethod
+    def search(self, queries: np.ndarray, k: int, ef_search: int | None = None, filters: tuple = NO_FILTERS):
+        """[(message_ids, scores)] per query, best first."""
+
+
+class _PositionStore(VectorStore):
+    """A store over index positions, resolved to message_ids through the index's id map."""
+
+    def __init__(self, id_map: IdMap, metadata=None):
+        self.id_map = id_map
+        self.metadata = metadata
+
+    def __len__(self):
+        return len(self.id_map)
+
+    @abstractmethod
+    def search_positions(self, queries: np.ndarray, k: int, ef_search: int | None = None, allowed=None):
+        """(D, I) over index positions; allowed is a bool mask of searchable positions."""
+
+    def search(self, queries: np.ndarray, k: int, ef_search: int | None = None, filters: tuple = NO_FILTERS):
+        allowed = None
+        if any(value is not None for value in filters):
+            if self.metadata is None:
+                raise ValueError(f"{self.name} store has no filter metadata")
+            allowed = self.metadata.mask(*filters)
+        D, I = self.search_positions(queries, k, ef_search, allowed)
+        results = []
+        for scores, message_ids in zip(D, self.id_map.resolve(I)):
+            hits = [(msg_id, float(score)) for msg_id, score in zip(message_ids, scores) if msg_id is not None]
+            results.append(([msg_id for msg_id, _ in hits], [score for _, score in hits]))
+        return results
+
+
+class FaissStore(_PositionStore):
+    """
+    A FAISS index. selector (with the bitmap backing it) masks tombstoned positions and
+    live is the matching bool mask (None = all live). With exact_vectors, k * rerank_factor
+    candidates are re-scored. Filtered sets of up to filter_exact_max positions are scanned
+    exactly instead of searched in the graph.
+    """
+    name = "faiss"
+
+    def __init__(self, index, id_map: IdMap, metadata=None, selector=None, bitmap=None, live=None,
+                 exact_vectors=None, rerank_factor: int = 0, filter_exact_max: int = 0):
+        super().__init__(id_map, metadata)
+        self.index = index
+        self.selector = selector
+        self._bitmap = bitmap  # must outlive selector
+        self.live = live
+        self.exact_vectors = exact_vectors
+        self.rerank_factor = rerank_factor
+        self.filter_exact_max = filter_exact_max
+
+    @property
+    def default_ef_search(self) -> int | None:
+        return self.index.hnsw.efSearch if hasattr(self.index, "hnsw") else None
+
+    def search_positions(self, queries: np.ndarray, k: int, ef_search: int | None = None, allowed=None):
+        selector = self.selector
+        if allowed is not None:
+            if self.live is not None:
+                allowed = allowed & self.live
+            positions = np.flatnonzero(allowed)
+            if len(positions) <= self.filter_exact_max and self._can_scan:
+                D, I = exact_search(self._rows(positions), queries, k, self.index.metric_type)
+                return D, np.append(positions, -1)[I]  # row -1 (no result) maps to position -1
+            selector, bitmap = bitmap_selector(allowed)  # bitmap must outlive the search
+        params = search_params(self.index, selector, ef_search)
+        if self.exact_vectors is None:
+            return self.index.search(queries, k, params=params)
+        _, candidates = self.index.search(queries, k * self.rerank_factor, params=params)
+        return rerank(self.exact_vectors, queries, candidates, k, self.index.metric_type)
+
+    @property
+    def _can_scan(self) -> bool:
+        return self.exact_vectors is not None or has_exact_storage(self.index)
+
+    def _rows(self, positions):
+        if self.exact_vectors is not None:
+            return np.asarray(self.exact_vectors[positions], dtype=np.float32)
+        return self.index.reconstruct_batch(positions)
+
+
+class ExactStore(_PositionStore):
+    """
+    Brute-force inner product over an in-memory matrix of the live vectors, normalized
+    on load. Only live rows are kept, so tombstones cost nothing at query time, and with
+    metadata the rows are grouped by space, so a space filter searches a contiguous
+    slice of the matrix without copying it.
+    """
+    name = "exact"
+
+    def __init__(self, vectors: np.ndarray, id_map: IdMap, metadata=None, live=None):
+        super().__init__(id_map, metadata)
+        positions = np.arange(len(vectors)) if live is None else np.flatnonzero(live)
+        if metadata is not None:
+            positions = positions[np.argsort(metadata.space_codes[positions], kind="stable")]
+        self.positions = positions  # index position of each row
+        rows = np.array(vectors[positions], dtype=np.float32)
+        norms = np.linalg.norm(rows, axis=1, keepdims=True)
+        self.vectors = rows / np.where(norms > 0, norms, 1)
+
+    @classmethod
+    def from_vectors(cls, message_ids: list[str], vectors: np.ndarray) -> "ExactStore":
+        """Store over vectors keyed by message_ids, with no index files behind it."""
+        return cls(vectors, IdMap.from_ids(message_ids))
+
+    def search_positions(self, queries: np.ndarray, k: int, ef_search: int | None = None, allowed=None):
+        rows, positions = self.vectors, self.positions
+        if allowed is not None:
+            keep = np.flatnonzero(allowed[positions])
+            if len(keep) and keep[-1] - keep[0] + 1 == len(keep):
+                rows, positions = rows[keep[0]:keep[-1] + 1], positions[keep[0]:keep[-1] + 1]  # views
+            else:
+                rows, positions = rows[keep], positions[keep]
+        D, I = exact_search(rows, np.asarray(queries, dtype=np.float32), k)
+        return D, np.append(positions, -1)[I]  # row -1 (no result) maps to position -1
+
+
+class PgvectorStore(VectorStore):
+    """
+    Parent-message embeddings of model_id in Postgres, searched through the pgvector
+    HNSW index. conn is a psycopg2 connection for the synchronous methods; every search
+    ends its transaction, so the transaction-local search settings do not leak.
+
+    search_threads also returns each hit's replies and reply labels from the same
+    statement. The query assistant runs it on its async pool with search_threads_async,
+    so served and verified searches issue the same statements.
+    """
+    name = "pgvector"
+
+    def __init__(self, conn, model_id: str, ef_search: int = 100, iterative_scan: bool = True):
+        self.conn = conn
+        self.model_id = model_id
+        self.ef_search = ef_search
+        self.iterative_scan = iterative_scan
+
+    @property
+    def default_ef_search(self) -> int | None:
+        return self.ef_search
+
+    def __len__(self):
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT COUNT(*) FROM embeddings e JOIN messages m ON m.message_id = e.message_id
+                WHERE e.model_id = %s AND m.parent_id IS NULL
+            """, (self.model_id,))
+            count = cur.fetchone()[0]
+        self.conn.rollback()
+        return count
+
+    def _statements(self, query_vec, k: int, ef_search: int | None, filters: tuple, threads: bool):
+        """(sql, params) to run in one transaction for one query."""
+        # HNSW returns fewer than k rows if ef_search < k
+        statements = [(SETTINGS_SQL, {"ef_search": str(max(k, ef_search or self.ef_search))})]
+        if self.iterative_scan:
+            statements.append((ITERATIVE_SCAN_SQL, None))
+        sql = search_sql if threads else nearest_sql
+        statements.append((sql(self.model_id, *filters), pgvector_params(query_vec, k, *filters)))
+        return statements
+
+    @staticmethod
+    def _hits(rows, threads: bool):
+        if threads:
+            return group_threads(rows)
+        return [msg_id for msg_id, _ in rows], [float(score) for _, score in rows]
+
+    def _run(self, queries: np.ndarray, k: int, ef_search: int | None, filters: tuple, threads: bool):
+        results = []
+        try:
+            with self.conn.cursor() as cur:
+                for query_vec in queries:
+                    for sql, params in self._statements(query_vec, k, ef_search, filters, threads):
+                        cur.execute(sql, params)
+                    results.append(self._hits(cur.fetchall(), threads))
+        finally:
+            self.conn.rollback()
+        return results
+
+    def search(self, queries: np.ndarray, k: int, ef_search: int | None = None, filters: tuple = NO_FILTERS):
+        return self._run(queries, k, ef_search, filters, threads=False)
+
+    def search_threads(self, queries: np.ndarray, k: int, ef_search: int | None = None,
+                       filters: tuple = NO_FILTERS):
+        """[(parent_ids, scores, threads)] per query, threads as pgvector_search.group_threads."""
+        return self._run(queries, k, ef_search, filters, threads=True)
+
+    async def search_threads_async(self, cursor, queries: np.ndarray, k: int, ef_search: int | None = None,
+                                   filters: tuple = NO_FILTERS):
+        """search_threads on a psycopg 3 async cursor; the caller's transaction carries the settings."""
+        results = []
+        for query_vec in queries:
+            for sql, params in self._statements(query_vec, k, ef_search, filters, threads=True):
+                await cursor.execute(sql, params)
+            results.append(self._hits(await cursor.fetchall(), threads=True))
+        return results
+
+
+def index_vectors(index, exact_vectors=None) -> np.ndarray:
+    """All vectors of an index file for an ExactStore: its re-rank vectors, or reconstructed flat storage."""
+    if exact_vectors is not None:
+        return np.asarray(exact_vectors, dtype=np.float32)
+    if not has_exact_storage(index):
+        raise ValueError("Index stores quantized vectors and has no re-rank vectors file; "
+                         "the exact backend needs the original vectors")
+    return index.reconstruct_n(0, index.ntotal)
@@ -2,8 +2,9 @@ import faiss
 import numpy as np
 import psycopg2
 import re
-import ast
-from config import DB_CONFIG
+from config import DB_CONFIG, EMBEDDING_MODEL_NAME
+from embedding_io import load_embeddings
+from thread_map import ThreadMap, fetch_thread_ids
 
 # Connect to PostgreSQL
 conn = psycopg2.connect(**DB_CONFIG)
@@ -16,10 +17,10 @@ cur = conn.cursor()
 cur.execute("""
     SELECT m.message_id
     FROM messages m
-    JOIN embeddings e ON m.message_id = e.message_id
+    JOIN embeddings e ON m.message_id = e.message_id AND e.model_id = %s
     WHERE m.parent_id IS NULL
     ORDER BY m.created
-""")
+""", (EMBEDDING_MODEL_NAME,))
 
 all_ids = [row[0] for row in cur.fetchall()]
 print(f"Built mapping for {len(all_ids)} embeddings.")
@@ -43,17 +44,14 @@ if not matching_message:
 query_message_id, query_text = matching_message
 print(f"✅ Found message ID: {query_message_id}")
 
-# Retrieve the corresponding embedding from the database
-cur.execute("SELECT vector FROM embeddings WHERE message_id = %s", (query_message_id,))
-vector_row = cur.fetchone()
-if not vector_row:
+# Retrieve the corresponding embedding from the database as a float32 row
+_, query_vector = load_embeddings(conn, """
+    SELECT message_id, vector FROM embeddings WHERE message_id = %s AND model_id = %s
+""", (query_message_id, EMBEDDING_MODEL_NAME))
+if not len(query_vector):
     print("No embedding found for this message.")
     exit(1)
 
-# Convert stored vector to a NumPy array.
-# (The vector is stored as a string; use ast.literal_eval to get the Python list, then make a NumPy array.)
-query_vector = np.array(ast.literal_eval(vector_row[0]), dtype=np.float32).reshape(1, -1)
-
 # Ensure normalization for cosine similarity (using inner product metric)
 faiss.normalize_L2(query_vector)
 
@@ -82,23 +80,12 @@ for idx, score in zip(indices[0], distances[0]):
     filtered_results.append((retrieved_message_id, float(score)))
 
 # For thread-level ranking: group results by thread.
-# If a message is a child (has a non-null parent_id), we treat the parent as the thread identifier.
-thread_scores = {}  # mapping: thread_id -> list of scores
-for matched_id, score in filtered_results:
-    cur.execute("SELECT parent_id FROM messages WHERE message_id = %s", (matched_id,))
-    result = cur.fetchone()
-    # If parent_id exists, use it; otherwise, this message is the thread root.
-    thread_id = result[0] if result and result[0] is not None else matched_id
-    thread_scores.setdefault(thread_id, []).append(score)
-
-# Compute an aggregated thread score (average of scores)
-thread_ranking = []
-for thread_id, scores in thread_scores.items():
-    agg_score = sum(scores) / len(scores)
-    thread_ranking.append((thread_id, agg_score))
-
-# Sort threads by aggregated score in descending order
-thread_ranking.sort(key=lambda x: x[1], reverse=True)
+# Replies map to their parent (one lookup for all hits) and scores are averaged per thread in NumPy.
+hit_ids = [matched_id for matched_id, _ in filtered_results]
+thread_map = ThreadMap.from_ids(fetch_thread_ids(conn, hit_ids))
+hit_scores = np.array([[score for _, score in filtered_results]], dtype=np.float32)
+thread_ids, agg_scores = thread_map.aggregate(hit_scores, np.arange(len(hit_ids))[None, :], len(hit_ids), how="mean")[0]
+thread_ranking = list(zip(thread_ids, agg_scores))
 
 # Display the top N threads, including the parent message and all its child messages
 TOP_N = 3
@@ -0,0 +1,34 @@
+"""
+Offline check that the files of a FAISS index are the ones its build wrote: every
+file listed in <index>.manifest.json is read back and compared by size, mtime and
+content digest. The query assistant only compares size and mtime on (re)load, so
+run this after copying an index between hosts or when a reload is rejected.
+
+Usage:
+    python verify_index_manifest.py
+    python verify_index_manifest.py --index faiss_index_threads.bin
+"""
+import argparse
+import os
+import sys
+
+from config import FAISS_INDEX_PATH
+from index_store import manifest_path, read_state, verify_manifest
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verify index files against their build manifest")
+    parser.add_argument("--index", default=FAISS_INDEX_PATH, help="Index file next to the manifest")
+    args = parser.parse_args()
+
+    manifest = read_state(manifest_path(args.index))
+    if not manifest:
+        print(f"❌ {manifest_path(args.index)} not found; rebuild the index to write one")
+        sys.exit(1)
+    directory = os.path.dirname(os.path.abspath(args.index))
+    paths = [os.path.join(directory, name) for name in manifest["files"]]
+    try:
+        build_id = verify_manifest(args.index, paths, full=True)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print(f"✅ {len(paths)} files match index build {build_id}")
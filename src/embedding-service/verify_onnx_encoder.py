@@ -0,0 +1,114 @@
+"""
+Check an exported ONNX encoder against the sentence-transformers reference on our corpus.
+
+For a sample of message texts it reports, per backend (ONNX float32 and int8):
+- batch throughput (texts/sec) and single-query latency p50/p95, with speedup over
+  the reference;
+- cosine drift: cosine similarity between each text's vector and its reference
+  vector (mean, 1st percentile, min);
+- neighbour agreement: overlap of each text's top-k neighbours within the sample
+  with the reference top-k, i.e. how much retrieval would change.
+
+Exits non-zero if the int8 encoder's 1st-percentile cosine is below --min-cosine.
+
+Usage:
+    python verify_onnx_encoder.py --sample 2000
+    python verify_onnx_encoder.py --texts-file queries.txt --threads 4
+"""
+import argparse
+import time
+
+import numpy as np
+import psycopg2
+from config import DB_CONFIG, EMBEDDING_MODEL_NAME
+from encoder import load_encoder
+
+
+def _load_texts(args) -> list[str]:
+    if args.texts_file:
+        with open(args.texts_file) as f:
+            return [line.strip() for line in f if line.strip()][:args.sample]
+    conn = psycopg2.connect(**DB_CONFIG)
+    with conn.cursor() as cur:
+        cur.execute("SELECT text FROM messages WHERE text <> '' ORDER BY random() LIMIT %s", (args.sample,))
+        texts = [row[0] for row in cur.fetchall()]
+    conn.close()
+    return texts
+
+
+def _throughput(encoder, texts: list[str], batch_size: int) -> tuple[np.ndarray, float]:
+    encoder.encode(texts[:batch_size], batch_size=batch_size)  # warm up
+    start = time.perf_counter()
+    vectors = encoder.encode(texts, batch_size=batch_size, normalize=True)
+    return vectors, len(texts) / (time.perf_counter() - start)
+
+
+def _latencies_ms(encoder, texts: list[str]) -> np.ndarray:
+    timings = np.empty(len(texts))
+    for i, text in enumerate(texts):
+        start = time.perf_counter()
+        encoder.encode([text], normalize=True)
+        timings[i] = (time.perf_counter() - start) * 1000
+    return timings
+
+
+def _neighbour_agreement(vectors: np.ndarray, reference: np.ndarray, k: int) -> float:
+    def top_k(matrix):
+        scores = matrix @ matrix.T
+        np.fill_diagonal(scores, -np.inf)
+        return np.argsort(-scores, axis=1)[:, :k]
+
+    ours, theirs = top_k(vectors), top_k(reference)
+    return float(np.mean([len(set(a) & set(b)) / k for a, b in zip(ours, theirs)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ONNX encoder speedup and drift vs sentence-transformers")
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    parser.add_argument("--onnx-dir", default=None, help="Exported model (default: onnx/<model>)")
+    parser.add_argument("--sample", type=int, default=1000, help="Texts to encode")
+    parser.add_argument("--texts-file", default=None, help="One text per line instead of sampling messages")
+    parser.add_argument("--queries", type=int, default=100, help="Texts timed one at a time (query path)")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=0, help="Intra-op threads for every backend (0 = default)")
+    parser.add_argument("--k", type=int, default=5, help="Neighbours compared for agreement")
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="Required 1st-percentile cosine for int8")
+    args = parser.parse_args()
+
+    texts = _load_texts(args)
+    if len(texts) <= args.k:
+        raise SystemExit("❌ Not enough texts to compare")
+    print(f"{len(texts)} texts | batch size {args.batch_size} | model {args.model}")
+
+    encoders = {
+        "sentence-transformers": load_encoder(args.model, "sentence-transformers", args.threads),
+        "onnx float32": load_encoder(args.model, "onnx", args.threads, quantized=False, onnx_dir=args.onnx_dir),
+        "onnx int8": load_encoder(args.model, "onnx", args.threads, quantized=True, onnx_dir=args.onnx_dir),
+    }
+    query_texts = texts[:args.queries]
+    results = {}
+    for name, encoder in encoders.items():
+        vectors, rate = _throughput(encoder, texts, args.batch_size)
+        latencies = _latencies_ms(encoder, query_texts)
+        results[name] = (vectors, rate, np.percentile(latencies, 50), np.percentile(latencies, 95))
+
+    reference, reference_rate, reference_p50, _ = results["sentence-transformers"]
+    print(f"{'backend':>22} {'texts/s':>9} {'speedup':>8} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'cos mean':>9} {'cos p1':>8} {'cos min':>8} {'top-' + str(args.k):>7}")
+    int8_p1 = None
+    for name, (vectors, rate, p50, p95) in results.items():
+        cosine = np.sum(vectors * reference, axis=1)  # both normalized
+        agreement = _neighbour_agreement(vectors, reference, args.k)
+        print(f"{name:>22} {rate:>9.1f} {rate / reference_rate:>7.2f}x {p50:>8.2f} {p95:>8.2f} "
+              f"{cosine.mean():>9.5f} {np.percentile(cosine, 1):>8.5f} {cosine.min():>8.5f} {agreement:>7.3f}")
+        if name == "onnx int8":
+            int8_p1 = float(np.percentile(cosine, 1))
+    print(f"Single-query speedup (p50): {reference_p50 / results['onnx int8'][2]:.2f}x for int8")
+
+    if int8_p1 < args.min_cosine:
+        raise SystemExit(f"❌ int8 drift too large: 1st-percentile cosine {int8_p1:.5f} < {args.min_cosine}")
+    print(f"✅ int8 encoder within drift budget (1st-percentile cosine {int8_p1:.5f} >= {args.min_cosine})")
+
+
+if __name__ == "__main__":
+    main()
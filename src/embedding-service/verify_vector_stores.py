@@ -0,0 +1,214 @@
+"""
+Conformance checks and benchmark shared by every vector store backend (vector_store.py),
+so a backend can be swapped with SEARCH_BACKEND without changing what the query
+assistant returns.
+
+Every backend answers the same queries over the same corpus and must:
+    - return at most k hits per query, with distinct message_ids, best first
+    - score each hit with the cosine similarity of its vector (within --score-tolerance)
+    - honour a space filter: only hits from that space, and (close to) all of them
+      when k exceeds the space's size
+    - reach --min-recall@k against float64 brute force (exact must reach 1.0)
+    - (pgvector) rank the same threads with search_threads, which the query assistant serves
+Then single-query p50/p95 latency is measured over the whole corpus and within its
+largest space, the per-space corpora the exact backend is meant for.
+
+Corpus: parent embeddings and their spaces from the DB (all backends), or --synthetic N
+clustered vectors spread over --spaces spaces (faiss and exact; pgvector searches the
+rows in Postgres). The faiss store is built in memory from index_config.json.
+
+Usage:
+    python verify_vector_stores.py
+    python verify_vector_stores.py --synthetic 20000 --spaces 8
+    python verify_vector_stores.py --backends exact faiss --k 10
+"""
+import argparse
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+from config import (
+    DB_CONFIG, EMBEDDING_MODEL_NAME, INDEX_CONFIG_PATH, SEARCH_FILTER_EXACT_MAX, PGVECTOR_EF_SEARCH,
+    PGVECTOR_ITERATIVE_SCAN
+)
+from id_map import IdMap
+from index_metadata import IndexMetadata
+from index_store import build_index, load_index_config
+from vector_store import BACKENDS, ExactStore, FaissStore, PgvectorStore
+
+
+def _load_corpus(args, conn):
+    """(message_ids, normalized vectors, IndexMetadata)."""
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        # Clustered data, closer to sentence embeddings than uniform noise
+        centers = rng.standard_normal((max(args.synthetic // 100, 8), args.dim)).astype(np.float32)
+        vectors = centers[rng.integers(0, len(centers), args.synthetic)]
+        vectors += 0.3 * rng.standard_normal(vectors.shape).astype(np.float32)
+        message_ids = [f"synthetic-{i}" for i in range(args.synthetic)]
+        space_ids = [f"space-{s}" for s in rng.integers(0, args.spaces, args.synthetic)]
+        metadata = IndexMetadata.from_rows(space_ids, [datetime(2024, 1, 1)] * args.synthetic)
+    else:
+        from embedding_io import load_embeddings
+        from index_metadata import fetch_metadata
+        message_ids, vectors = load_embeddings(conn, """
+            SELECT m.message_id, e.vector
+            FROM messages m
+            JOIN embeddings e ON m.message_id = e.message_id AND e.model_id = %s
+            WHERE m.parent_id IS NULL
+        """, (EMBEDDING_MODEL_NAME,))
+        metadata = fetch_metadata(conn, message_ids)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    return list(message_ids), vectors, metadata
+
+
+def _stores(args, conn, message_ids, vectors, metadata) -> dict:
+    id_map = IdMap.from_ids(message_ids)
+    stores = {}
+    for backend in args.backends:
+        if backend == "exact":
+            stores[backend] = ExactStore(vectors, id_map, metadata)
+        elif backend == "faiss":
+            start = time.perf_counter()
+            index = build_index(vectors, load_index_config(INDEX_CONFIG_PATH))
+            print(f"🏗️ faiss store built in {time.perf_counter() - start:.2f}s")
+            stores[backend] = FaissStore(index, id_map, metadata, filter_exact_max=SEARCH_FILTER_EXACT_MAX)
+        elif conn is None:
+            print("⏭️ pgvector: skipped for a synthetic corpus (it searches the rows in Postgres)")
+        else:
+            stores[backend] = PgvectorStore(conn, EMBEDDING_MODEL_NAME, PGVECTOR_EF_SEARCH, PGVECTOR_ITERATIVE_SCAN)
+    return stores
+
+
+def _brute_force(vectors: np.ndarray, queries: np.ndarray, k: int):
+    """Exact top k positions per query in float64."""
+    scores = queries.astype(np.float64) @ vectors.astype(np.float64).T
+    return np.argsort(-scores, axis=1, kind="stable")[:, :k]
+
+
+def _check(store, args, message_ids, vectors, metadata, queries) -> list[str]:
+    """Conformance failures of store (empty = conforms)."""
+    failures = []
+    k = args.k
+    position = {msg_id: i for i, msg_id in enumerate(message_ids)}
+    results = store.search(queries, k)
+
+    # Shape, uniqueness, order and scores
+    if len(results) != len(queries):
+        return [f"{len(results)} result lists for {len(queries)} queries"]
+    for q, (ids, scores) in enumerate(results):
+        if len(ids) != len(scores) or len(ids) > k or len(set(ids)) != len(ids):
+            failures.append(f"query {q}: {len(ids)} ids / {len(scores)} scores, k={k}, duplicates")
+        elif any(a < b - args.score_tolerance for a, b in zip(scores, scores[1:])):
+            failures.append(f"query {q}: scores not in descending order")
+        elif any(msg_id not in position for msg_id in ids):
+            failures.append(f"query {q}: unknown message_id returned")
+        else:
+            expected = vectors[[position[msg_id] for msg_id in ids]] @ queries[q]
+            if len(ids) and np.abs(expected - np.asarray(scores)).max() > args.score_tolerance:
+                failures.append(f"query {q}: scores differ from cosine similarity by "
+                                f"{np.abs(expected - np.asarray(scores)).max():.4f}")
+        if len(failures) >= 5:
+            break
+
+    # Recall against brute force
+    truth = _brute_force(vectors, queries, k)
+    hits = sum(len({position.get(msg_id) for msg_id in ids} & set(row)) for (ids, _), row in zip(results, truth))
+    recall = hits / truth.size
+    min_recall = 1.0 if store.name == "exact" else args.min_recall
+    print(f"   recall@{k}={recall:.4f}")
+    if recall < min_recall:
+        failures.append(f"recall@{k} {recall:.4f} < {min_recall}")
+
+    # Space filter: only hits from the space, and all of a small space when k exceeds it
+    counts = np.bincount(metadata.space_codes, minlength=len(metadata.spaces))
+    smallest = int(np.argmin(np.where(counts > 0, counts, np.iinfo(counts.dtype).max)))
+    space_id = str(metadata.spaces[smallest])
+    in_space = metadata.space_codes == smallest
+    space_k = min(int(counts[smallest]), 100) + 5
+    for q, (ids, _) in enumerate(store.search(queries[:10], space_k, filters=(space_id, None, None))):
+        outside = [msg_id for msg_id in ids if msg_id not in position or not in_space[position[msg_id]]]
+        if outside:
+            failures.append(f"filter space_id={space_id}: query {q} returned {len(outside)} hits from other spaces")
+            break
+        expected = min(space_k, int(counts[smallest]))
+        if len(ids) < min_recall * expected:
+            failures.append(f"filter space_id={space_id}: query {q} returned {len(ids)} of {expected} space vectors")
+            break
+
+    # pgvector serves search_threads (hits joined with their replies); it must rank like search
+    if hasattr(store, "search_threads"):
+        for q, (parent_ids, scores, _) in enumerate(store.search_threads(queries[:10], k)):
+            if parent_ids != results[q][0]:
+                failures.append(f"query {q}: search_threads returned {parent_ids}, search {results[q][0]}")
+                break
+    return failures
+
+
+def _latency(store, queries: np.ndarray, k: int, filters=(None, None, None)):
+    timings = np.empty(len(queries))
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        store.search(queries[i:i + 1], k, filters=filters)
+        timings[i] = (time.perf_counter() - start) * 1000
+    return float(np.percentile(timings, 50)), float(np.percentile(timings, 95))
+
+
+def run(args) -> bool:
+    conn = None
+    if not args.synthetic:
+        import psycopg2
+        conn = psycopg2.connect(**DB_CONFIG)
+    message_ids, vectors, metadata = _load_corpus(args, conn)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)]
+    queries = queries + args.noise * rng.standard_normal(queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    largest = str(metadata.spaces[np.argmax(np.bincount(metadata.space_codes))])
+    largest_size = int((metadata.space_codes == np.argmax(np.bincount(metadata.space_codes))).sum())
+    print(f"📐 corpus={len(vectors)} dim={vectors.shape[1]} spaces={len(metadata.spaces)} "
+          f"queries={len(queries)} k={args.k}")
+
+    conforms = True
+    rows = []
+    for name, store in _stores(args, conn, message_ids, vectors, metadata).items():
+        print(f"🔎 {name}")
+        failures = _check(store, args, message_ids, vectors, metadata, queries)
+        for failure in failures:
+            print(f"   ❌ {failure}")
+        if not failures:
+            print("   ✅ conforms")
+        conforms &= not failures
+        p50, p95 = _latency(store, queries, args.k)
+        space_p50, space_p95 = _latency(store, queries, args.k, (largest, None, None))
+        rows.append((name, p50, p95, space_p50, space_p95))
+
+    print(f"\n⏱️ Single-query latency, whole corpus and within space {largest} ({largest_size} vectors)")
+    print(f"{'store':<10} {'p50 ms':>8} {'p95 ms':>8} {'space p50':>10} {'space p95':>10}")
+    for name, p50, p95, space_p50, space_p95 in rows:
+        print(f"{name:<10} {p50:>8.3f} {p95:>8.3f} {space_p50:>10.3f} {space_p95:>10.3f}")
+    if conn is not None:
+        conn.close()
+    return conforms
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vector store conformance checks and benchmark")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--k", type=int, default=5, help="Neighbours per query (query_service uses 5)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.05, help="Gaussian noise added to sampled query vectors")
+    parser.add_argument("--synthetic", type=int, default=0, help="Generate N vectors instead of reading the DB")
+    parser.add_argument("--spaces", type=int, default=8, help="Spaces the --synthetic vectors are spread over")
+    parser.add_argument("--dim", type=int, default=768, help="Dimension for --synthetic")
+    parser.add_argument("--min-recall", type=float, default=0.95, help="Required recall@k of approximate stores")
+    parser.add_argument("--score-tolerance", type=float, default=1e-3)
+    args = parser.parse_args()
+
+    if run(args):
+        print("✅ All vector stores conform")
+    else:
+        print("❌ Some vector stores do not conform")
+        sys.exit(1)
@@ -1,6 +1,10 @@
+import os
+import sys
+
 from sentence_transformers import SentenceTransformer
-import faiss
-import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../embedding-service')))
+from vector_store import ExactStore
 
 # Load pre-trained sentence transformer model
 model = SentenceTransformer('all-MiniLM-L6-v2')
@@ -35,25 +39,25 @@ past_discussions = {
 # Prepare embeddings for problem statements + thread discussions
 past_statements = list(past_discussions.keys())
 past_solutions = {problem: details["accepted_solution"] for problem, details in past_discussions.items()}
-past_embeddings = model.encode(past_statements)
+past_embeddings = model.encode(past_statements, normalize_embeddings=True)
 
-# Index embeddings in FAISS for efficient search
-dimension = past_embeddings.shape[1]
-index = faiss.IndexFlatL2(dimension)
-index.add(np.array(past_embeddings))
+# Exact search over the normalized embeddings, the same store the query assistant
+# uses with SEARCH_BACKEND=exact
+store = ExactStore.from_vectors(past_statements, past_embeddings)
 
-# Similarity threshold for matching (lower means stricter matching)
-SIMILARITY_THRESHOLD = 0.5
+# Cosine similarity threshold for matching (higher means stricter matching); 0.75 is
+# the squared L2 distance of 0.5 this demo used before, on normalized vectors
+SIMILARITY_THRESHOLD = 0.75
 
 # Function to analyze and find solutions for new problem threads
 def analyze_problem_thread(problem, thread_responses):
-    new_embedding = model.encode([problem])
-    D, I = index.search(np.array(new_embedding), 1)  # Get top 1 match
+    new_embedding = model.encode([problem], normalize_embeddings=True)
+    [(matches, scores)] = store.search(new_embedding, 1)  # Get top 1 match
 
     print(f"\nProblem: {problem}")
     
-    if D[0][0] < SIMILARITY_THRESHOLD:
-        matched_problem = past_statements[I[0][0]]
+    if matches and scores[0] > SIMILARITY_THRESHOLD:
+        matched_problem = matches[0]
         print(f"→ Similar Issue Found: {matched_problem}")
         print(f"→ Suggested Solution: {past_solutions[matched_problem]}")
         print(f"→ Previous Discussion Thread: {past_discussions[matched_problem]['responses']}\n")
@@ -0,0 +1,225 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from cache import TTLCache
+
+
+class MemoryAnswerBackend:
+    """In-process LRU/TTL store. Lost on restart."""
+    blocking = False
+
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self._cache = TTLCache(maxsize, ttl_seconds)
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, value):
+        self._cache.set(key, value)
+
+    def stats(self) -> dict:
+        return {"backend": "memory", **self._cache.stats()}
+
+
+class SqliteAnswerBackend:
+    """
+    On-disk store in a single SQLite file so answers survive restarts.
+    Entries expire after ttl_seconds; beyond maxsize the least recently used are evicted.
+    """
+    blocking = True
+
+    def __init__(self, path: str, maxsize: int, ttl_seconds: float):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created_at = row
+            if created_at + self.ttl_seconds <= now:
+                self._conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE answers SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (key, value, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            self._evict(now)
+
+    def _evict(self, now):
+        expired = self._conn.execute(
+            "DELETE FROM answers WHERE created_at <= ?", (now - self.ttl_seconds,)
+        ).rowcount
+        count = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        overflow = count - self.maxsize
+        if overflow > 0:
+            self._conn.execute("""
+                DELETE FROM answers WHERE key IN (
+                    SELECT key FROM answers ORDER BY last_used LIMIT ?
+                )
+            """, (overflow,))
+        self.evictions += max(expired, 0) + max(overflow, 0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "size": size,
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class AnswerCache:
+    """
+    Caches LLM replies keyed on the full prompt body and coalesces concurrent
+    identical requests (singleflight) so they share one upstream call.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.coalesced = 0
+        self.upstream_calls = 0
+        self._inflight: dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def key_for(prompt_body: dict) -> str:
+        payload = json.dumps(prompt_body, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def _backend_call(self, method, *args):
+        if self.backend.blocking:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    async def get_or_call(self, prompt_body: dict, call, cacheable=lambda value: value is not None):
+        """
+        Return the cached reply for prompt_body, or await call(prompt_body) once for all
+        concurrent callers with the same prompt. Only replies accepted by cacheable are stored.
+        """
+        key = self.key_for(prompt_body)
+        cached = await self._backend_call(self.backend.get, key)
+        if cached is not None:
+            print("⚡ Gemini answer cache hit")
+            return cached
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            print("🔗 Joining in-flight Gemini request for identical prompt")
+        else:
+            task = asyncio.ensure_future(self._fill(key, prompt_body, call, cacheable))
+            self._inflight[key] = task
+        # shield: one caller disconnecting must not cancel the call the others are waiting on
+        return await asyncio.shield(task)
+
+    async def lookup_or_lead(self, prompt_body: dict):
+        """
+        (reply, None) with the cached reply for prompt_body or the result of an identical
+        call already in flight, or (None, future) when there is neither: the caller is then
+        the one upstream call for this prompt (the streaming endpoint, which calls upstream
+        itself) and must settle the future with release(), which every caller that joins
+        meanwhile waits on. If the call it joined came back empty, it leads a new one.
+        """
+        key = self.key_for(prompt_body)
+        while True:
+            cached = await self._backend_call(self.backend.get, key)
+            if cached is not None:
+                print("⚡ Gemini answer cache hit")
+                return cached, None
+            task = self._inflight.get(key)
+            if task is None:
+                break
+            self.coalesced += 1
+            print("🔗 Joining in-flight Gemini request for identical prompt")
+            value = await asyncio.shield(task)
+            if value is not None:
+                return value, None
+        self.upstream_calls += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        return None, future
+
+    def release(self, prompt_body: dict, future: asyncio.Future, value):
+        """Hand the leader's reply (None if it failed or went away) to the callers waiting on future."""
+        key = self.key_for(prompt_body)
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if not future.done():
+            future.set_result(value)
+
+    async def store(self, prompt_body: dict, value):
+        await self._backend_call(self.backend.set, self.key_for(prompt_body), value)
+
+    async def _fill(self, key, prompt_body, call, cacheable):
+        try:
+            self.upstream_calls += 1
+            value = await call(prompt_body)
+            if cacheable(value):
+                await self._backend_call(self.backend.set, key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            **self.backend.stats(),
+            "upstream_calls": self.upstream_calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+        }
+
+
+def build_answer_cache(backend: str, path: str, maxsize: int, ttl_seconds: float):
+    """Factory for GEMINI_CACHE_BACKEND: 'memory', 'disk' or 'none'."""
+    if backend == "none":
+        return None
+    if backend == "disk":
+        return AnswerCache(SqliteAnswerBackend(path, maxsize, ttl_seconds))
+    if backend == "memory":
+        return AnswerCache(MemoryAnswerBackend(maxsize, ttl_seconds))
+    raise ValueError(f"Unknown GEMINI_CACHE_BACKEND: {backend!r} (expected memory, disk or none)")
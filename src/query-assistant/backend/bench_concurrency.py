@@ -0,0 +1,180 @@
+"""
+Concurrency benchmark for the query assistant.
+
+Starts a local Gemini stub (fixed latency) and the query assistant app on
+uvicorn, then fires POST / requests at increasing numbers of in-flight
+requests and prints throughput and latency per level. With a non-blocking
+request path, throughput should grow roughly linearly with concurrency until
+the CPU-bound encode/search step or the DB becomes the bottleneck.
+
+With --stream the benchmark posts to /stream instead and also reports the
+time until the first SSE event (the matched thread) arrives.
+
+Usage:
+    python bench_concurrency.py --levels 1 2 4 8 16 32 --requests 64
+    python bench_concurrency.py --stub-retrieval   # no DB / FAISS needed
+    python bench_concurrency.py --stub-retrieval --stream
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import threading
+import time
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+STUB_HOST = "127.0.0.1"
+# Every successful response carries the stubbed Gemini answer; error pages do not
+STUB_ANSWER = "Stubbed answer"
+
+STUB_RESULT = {
+    "thread_id": "bench-thread",
+    "thread_question": "How do I rotate the service certificate?",
+    "answer": "Run the rotate-cert job from the admin console and restart the pod.",
+    "follow_ups": [],
+    "faiss_score": 0.87
+}
+
+
+def _build_gemini_stub(latency: float) -> FastAPI:
+    stub = FastAPI()
+    reply = json.dumps({"response": STUB_ANSWER, "confidence_score": 0.9, "reasoning": "stub"})
+
+    @stub.post("/{model_action:path}")
+    async def generate(model_action: str):
+        if model_action.endswith(":streamGenerateContent"):
+            return StreamingResponse(stream_reply(), media_type="text/event-stream")
+        await asyncio.sleep(latency)
+        return {"candidates": [{"content": {"parts": [{"text": reply}]}}]}
+
+    async def stream_reply():
+        # Same total latency as the unary call, spread over a few chunks
+        pieces = [reply[i:i + 16] for i in range(0, len(reply), 16)]
+        for piece in pieces:
+            await asyncio.sleep(latency / len(pieces))
+            chunk = {"candidates": [{"content": {"parts": [{"text": piece}]}}]}
+            yield f"data: {json.dumps(chunk)}\r\n\r\n"
+
+    return stub
+
+
+def _start_server(app, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host=STUB_HOST, port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+class BenchmarkError(RuntimeError):
+    pass
+
+
+def _require_answer(body: str, i: int):
+    """Fail the run instead of timing the error path (backend error or Gemini failure pages)."""
+    if STUB_ANSWER not in body:
+        raise BenchmarkError(f"Request {i} did not get the stubbed Gemini answer; response starts with:\n{body[:500]}")
+
+
+async def _run_level(url: str, concurrency: int, total: int, query: str, stream: bool):
+    latencies = []
+    first_event = []
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        async def one(i):
+            # Distinct query per request so the answer caches don't hide upstream latency
+            data = {"query": f"{query} #{concurrency}-{i}"}
+            async with semaphore:
+                start = time.perf_counter()
+                if stream:
+                    first = None
+                    lines = []
+                    async with client.stream("POST", url, data=data) as response:
+                        response.raise_for_status()
+                        async for line in response.aiter_lines():
+                            if first is None and line.startswith("event:"):
+                                first = time.perf_counter() - start
+                            lines.append(line)
+                    elapsed = time.perf_counter() - start
+                    body = "\n".join(lines)
+                    if "event: thread" not in body:
+                        raise BenchmarkError(f"Request {i} got no thread event; stream starts with:\n{body[:500]}")
+                    first_event.append(first)
+                else:
+                    response = await client.post(url, data=data)
+                    elapsed = time.perf_counter() - start
+                    response.raise_for_status()
+                    body = response.text
+                _require_answer(body, i)
+                latencies.append(elapsed)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+    ttfe = statistics.median(first_event) if first_event else None
+    return total / elapsed, statistics.median(latencies), p95, ttfe
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query assistant concurrency benchmark")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32],
+                        help="In-flight request counts to measure")
+    parser.add_argument("--requests", type=int, default=64, help="Requests per level")
+    parser.add_argument("--gemini-latency", type=float, default=0.5, help="Stub Gemini latency in seconds")
+    parser.add_argument("--query", type=str, default="certificate rotation fails on staging cluster")
+    parser.add_argument("--stub-port", type=int, default=8911)
+    parser.add_argument("--app-port", type=int, default=8912)
+    parser.add_argument("--stub-retrieval", action="store_true",
+                        help="Skip FAISS/DB and return a fixed thread, to isolate the LLM path")
+    parser.add_argument("--stream", action="store_true",
+                        help="Benchmark the /stream SSE endpoint and report time to first event")
+    args = parser.parse_args()
+
+    # main.py reads its Gemini settings at import time
+    os.environ.setdefault("GEMINI_API_KEY", "bench")
+    os.environ["GEMINI_MODEL_URL"] = f"http://{STUB_HOST}:{args.stub_port}/v1beta/models/stub"
+    import main as query_app
+
+    if args.stub_retrieval:
+        async def _fixed_thread(*args, **kwargs):
+            return dict(STUB_RESULT)
+        query_app.get_thread_response_async = _fixed_thread
+
+    stub_server = _start_server(_build_gemini_stub(args.gemini_latency), args.stub_port)
+    app_server = _start_server(query_app.app, args.app_port)
+    url = f"http://{STUB_HOST}:{args.app_port}/" + ("stream" if args.stream else "")
+
+    if not args.stub_retrieval:
+        # The engine loads in the background; don't measure model loading
+        while httpx.get(f"http://{STUB_HOST}:{args.app_port}/readyz").status_code != 200:
+            time.sleep(0.5)
+
+    print(f"Gemini stub latency: {args.gemini_latency:.2f}s | requests per level: {args.requests}")
+    header = f"{'in-flight':>10} {'req/s':>10} {'p50 (s)':>10} {'p95 (s)':>10}"
+    print(header + (f" {'first event p50 (s)':>20}" if args.stream else ""))
+    try:
+        for level in args.levels:
+            rps, p50, p95, ttfe = asyncio.run(_run_level(url, level, args.requests, args.query, args.stream))
+            row = f"{level:>10} {rps:>10.2f} {p50:>10.3f} {p95:>10.3f}"
+            print(row + (f" {ttfe:>20.3f}" if args.stream else ""))
+    except BenchmarkError as e:
+        print(f"❌ Benchmark aborted: {e}")
+        raise SystemExit(1)
+    finally:
+        app_server.should_exit = True
+        stub_server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
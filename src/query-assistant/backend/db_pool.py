@@ -0,0 +1,101 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+import sys
+import os
+
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../embedding-service')))
+from config import DB_CONFIG, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT
+
+# Single pool per process, shared by the web app and cli_query.py through query_service
+_pool: AsyncConnectionPool | None = None
+_pool_lock = asyncio.Lock()
+
+_metrics = {
+    "checkouts": 0,
+    "timeouts": 0,
+    "wait_ms_total": 0.0,
+    "wait_ms_max": 0.0,
+}
+
+
+def _new_pool() -> AsyncConnectionPool:
+    return AsyncConnectionPool(
+        kwargs=DB_CONFIG,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        timeout=DB_POOL_TIMEOUT,
+        # Health check every connection on checkout; broken ones are replaced
+        check=AsyncConnectionPool.check_connection,
+        name="query-assistant",
+        open=False
+    )
+
+
+async def open_pool(wait: bool = True) -> AsyncConnectionPool:
+    """
+    Create and open the pool. With wait=True this blocks until min_size connections
+    are established, so the first user request does not pay for TCP setup and auth.
+    If the DB is unreachable the pool is still opened and keeps reconnecting in the background.
+    """
+    global _pool
+    async with _pool_lock:
+        if _pool is None:
+            pool = _new_pool()
+            try:
+                await pool.open(wait=wait, timeout=DB_POOL_TIMEOUT)
+            except PoolTimeout as e:
+                print(f"⚠️ DB pool warm-up failed: {e}. Connections will be opened on demand.")
+                pool = _new_pool()
+                await pool.open(wait=False)
+            _pool = pool
+            print(f"🏊 DB pool opened (min={DB_POOL_MIN_SIZE}, max={DB_POOL_MAX_SIZE})")
+    return _pool
+
+
+async def close_pool():
+    global _pool
+    async with _pool_lock:
+        if _pool is not None:
+            await _pool.close()
+            _pool = None
+            print("🔒 DB pool closed.")
+
+
+@asynccontextmanager
+async def connection():
+    """Check out a pooled connection; the transaction is committed or rolled back on exit."""
+    pool = _pool or await open_pool()
+    start = time.perf_counter()
+    try:
+        async with pool.connection() as conn:
+            wait_ms = (time.perf_counter() - start) * 1000
+            _metrics["checkouts"] += 1
+            _metrics["wait_ms_total"] += wait_ms
+            _metrics["wait_ms_max"] = max(_metrics["wait_ms_max"], wait_ms)
+            yield conn
+    except PoolTimeout:
+        _metrics["timeouts"] += 1
+        raise
+
+
+def pool_metrics() -> dict:
+    """Checkout wait times, connections in use and timeouts, plus psycopg_pool's own counters."""
+    checkouts = _metrics["checkouts"]
+    metrics = {
+        "open": _pool is not None,
+        "checkouts": checkouts,
+        "timeouts": _metrics["timeouts"],
+        "wait_ms_avg": round(_metrics["wait_ms_total"] / checkouts, 3) if checkouts else 0.0,
+        "wait_ms_max": round(_metrics["wait_ms_max"], 3),
+    }
+    if _pool is not None:
+        stats = _pool.get_stats()
+        metrics["size"] = stats.get("pool_size", 0)
+        metrics["available"] = stats.get("pool_available", 0)
+        metrics["in_use"] = metrics["size"] - metrics["available"]
+        metrics["waiting"] = stats.get("requests_waiting", 0)
+        metrics["pool_stats"] = stats
+    return metrics
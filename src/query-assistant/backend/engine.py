@@ -0,0 +1,450 @@
+import os
+import sys
+import threading
+import time
+import traceback
+from dataclasses import dataclass, replace
+
+import faiss
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../embedding-service')))
+from encoder import load_encoder
+from id_map import IdMap, load_id_map
+from index_metadata import IndexMetadata, load_metadata
+from lexical_index import LexicalIndex, load_lexical_index
+from thread_map import ThreadMap, load_thread_map
+from answer_store import AnswerStore, load_answer_store, store_files
+from index_store import (
+    load_tombstones, live_selector, has_exact_storage, load_exact_vectors, manifest_path, verify_manifest
+)
+from vector_store import FaissStore, ExactStore, index_vectors
+
+
+class EngineNotReady(RuntimeError):
+    pass
+
+
+class IndexValidationError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class IndexSnapshot:
+    """An index and the id map built with it. Requests hold one snapshot for their whole search."""
+    index: object
+    id_map: IdMap
+    generation: int
+    loaded_at: float
+    files_mtime: tuple
+    # Serves the searches over the index positions: the FAISS index itself or an exact
+    # in-memory matrix of its vectors (see vector_store.py)
+    store: FaissStore | ExactStore
+    tombstones: int = 0
+    # Filtered search: space/created per position
+    metadata: IndexMetadata | None = None
+    # BM25 index over thread text for hybrid search (None when not built)
+    lexical: LexicalIndex | None = None
+    # Whole-thread index: thread of each position, hits are aggregated per thread
+    threads: ThreadMap | None = None
+    # Precomputed answers per thread (None when not built)
+    answers: AnswerStore | None = None
+    # Build that wrote the index files (index_store manifest; None for older builds)
+    build_id: str | None = None
+
+    @property
+    def default_ef_search(self) -> int | None:
+        """efSearch stored in the index file (None for non-HNSW indexes and exact search)."""
+        return self.store.default_ef_search
+
+    def filter_mask(self, space_id: str | None = None, since=None, until=None):
+        """Positions admitted by the filters (bool array), or None when no filter is given."""
+        if space_id is None and since is None and until is None:
+            return None
+        if self.metadata is None:
+            raise IndexValidationError("Index has no filter metadata; run update_faiss_index.py to add it")
+        return self.metadata.mask(space_id, since, until)
+
+    def search(self, vectors, k: int, ef_search: int | None = None, allowed=None):
+        """
+        Search this snapshot's positions, skipping tombstones; (D, I) like faiss. ef_search=None
+        uses the index's own value. allowed (from filter_mask) restricts the search to those positions.
+        """
+        return self.store.search_positions(vectors, k, ef_search, allowed)
+
+
+class QueryEngine:
+    """
+    Owns the heavy retrieval resources (query encoder, FAISS index, id map)
+    so nothing is loaded at import time. States: starting → loading → ready | failed.
+
+    The index and id map live in an immutable IndexSnapshot. reload() builds a new
+    snapshot off to the side, validates it and swaps the reference, so in-flight
+    requests finish on the old index and new ones see the new generation.
+
+    store="exact" searches the index's vectors as an in-memory matrix instead of
+    through FAISS (see vector_store.py).
+
+    With index_path=None only the encoder is loaded (search runs elsewhere, e.g. in
+    pgvector) and snapshot stays None.
+    """
+
+    def __init__(self, model_name: str, index_path: str | None, id_map_path: str | None, mmap: bool = False,
+                 tombstones_path: str | None = None, vectors_path: str | None = None, rerank_factor: int = 0,
+                 encoder_backend: str = "sentence-transformers", metadata_path: str | None = None,
+                 filter_exact_max: int = 0, lexical_path: str | None = None, thread_map_path: str | None = None,
+                 answers_path: str | None = None, store: str = "faiss"):
+        self.model_name = model_name
+        self.encoder_backend = encoder_backend
+        self.index_path = index_path
+        self.id_map_path = id_map_path
+        self.tombstones_path = tombstones_path
+        self.vectors_path = vectors_path
+        self.rerank_factor = rerank_factor
+        self.metadata_path = metadata_path
+        self.filter_exact_max = filter_exact_max
+        self.lexical_path = lexical_path
+        self.thread_map_path = thread_map_path
+        self.answers_path = answers_path
+        self.mmap = mmap
+        self.store = store
+
+        self.model = None
+        self.snapshot: IndexSnapshot | None = None
+
+        self.state = "starting"
+        self.error = None
+        self.load_seconds = None
+        self.last_reload_error = None
+        self._ready = threading.Event()
+        self._load_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._swap_listeners = []
+        self._thread = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    @property
+    def generation(self) -> int:
+        return self.snapshot.generation if self.snapshot else 0
+
+    def add_swap_listener(self, listener):
+        """listener(snapshot) is called after every successful index swap."""
+        self._swap_listeners.append(listener)
+
+    def _build_files(self) -> list:
+        """Side files written together with the index, checked against its manifest."""
+        return [self.id_map_path, self.tombstones_path, self.vectors_path, self.metadata_path, self.thread_map_path]
+
+    def _shared_files(self) -> tuple:
+        """Lexical index and answer store: checked when the index's manifest lists them (parent builds)."""
+        return (self.lexical_path, *(store_files(self.answers_path) if self.answers_path else ()))
+
+    def _index_mtimes(self) -> tuple:
+        """mtimes of the files searched, i.e. everything but the manifest and answer store."""
+        mtimes = (os.stat(self.index_path).st_mtime_ns, os.stat(self.id_map_path).st_mtime_ns)
+        for path in (self.tombstones_path, self.vectors_path, self.metadata_path, self.lexical_path,
+                     self.thread_map_path):
+            if path and os.path.exists(path):
+                mtimes += (os.stat(path).st_mtime_ns,)
+        return mtimes
+
+    def _files_mtime(self) -> tuple:
+        mtimes = self._index_mtimes()
+        answers_files = store_files(self.answers_path) if self.answers_path else ()
+        for path in (manifest_path(self.index_path), *answers_files):
+            if os.path.exists(path):
+                mtimes += (os.stat(path).st_mtime_ns,)
+        return mtimes
+
+    def _read_index(self):
+        if not self.mmap:
+            return faiss.read_index(self.index_path)
+        # Map the stored vectors instead of copying them into RAM; pages are faulted
+        # in on demand and shared between workers on the same host.
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+        return faiss.read_index(self.index_path, flags)
+
+    def _load_snapshot(self, generation: int) -> IndexSnapshot:
+        files_mtime = self._files_mtime()
+        try:
+            build_id = verify_manifest(self.index_path, self._build_files(), self._shared_files())
+        except ValueError as e:
+            raise IndexValidationError(str(e)) from e  # mid-build; the watcher retries
+        if build_id is None:
+            print(f"⚠️ {manifest_path(self.index_path)} not found; index files are not checked against one build")
+        print(f"📦 Loading FAISS index {self.index_path} (mmap={self.mmap}, build {build_id})")
+        index = self._read_index()
+        id_map = load_id_map(self.id_map_path, mmap=True)
+        self._validate(index, id_map)
+        metadata = self._load_metadata(index)
+        tombstones = load_tombstones(self.tombstones_path, index.ntotal) if self.tombstones_path else None
+        if tombstones is not None and len(tombstones) != index.ntotal:
+            raise IndexValidationError(
+                f"Index has {index.ntotal} vectors but tombstone mask has {len(tombstones)} entries"
+            )
+        snapshot = IndexSnapshot(index, id_map, generation, time.time(), files_mtime,
+                                 store=self._build_store(index, id_map, metadata, tombstones),
+                                 tombstones=int(tombstones.sum()) if tombstones is not None else 0,
+                                 metadata=metadata, lexical=self._load_lexical(),
+                                 threads=self._load_thread_map(index), answers=self._load_answers(),
+                                 build_id=build_id)
+        if self._files_mtime() != files_mtime:
+            raise IndexValidationError("Index files changed while loading; retrying on the next poll")
+        return snapshot
+
+    def _build_store(self, index, id_map, metadata, tombstones):
+        """The vector store searching this index: the FAISS index, or its vectors searched exactly in RAM."""
+        selector, bitmap = live_selector(tombstones) if tombstones is not None else (None, None)
+        live = tombstones == 0 if selector is not None else None
+        if self.store == "exact":
+            # Quantized indexes keep their original vectors in the re-rank file
+            exact_vectors = load_exact_vectors(self.vectors_path) if self.vectors_path else None
+            if exact_vectors is not None and exact_vectors.shape != (index.ntotal, index.d):
+                raise IndexValidationError(
+                    f"Index has {index.ntotal} x {index.d} vectors but re-rank file has {exact_vectors.shape}"
+                )
+            try:
+                vectors = index_vectors(index, exact_vectors)
+            except ValueError as e:
+                raise IndexValidationError(str(e)) from e
+            return ExactStore(vectors, id_map, metadata, live)
+        return FaissStore(index, id_map, metadata, selector, bitmap, live, self._load_exact_vectors(index),
+                          self.rerank_factor, self.filter_exact_max)
+
+    def _load_metadata(self, index):
+        if not self.metadata_path:
+            return None
+        metadata = load_metadata(self.metadata_path)
+        if metadata is None:
+            print(f"⚠️ {self.metadata_path} not found; filtered search is unavailable")
+        elif len(metadata) != index.ntotal:
+            raise IndexValidationError(
+                f"Index has {index.ntotal} vectors but filter metadata has {len(metadata)} entries"
+            )
+        return metadata
+
+    def _load_thread_map(self, index):
+        """Message → thread map of a whole-thread index; required when a path is configured."""
+        if not self.thread_map_path:
+            return None
+        threads = load_thread_map(self.thread_map_path)
+        if threads is None:
+            raise IndexValidationError(f"{self.thread_map_path} not found; build it with setup_thread_index.py")
+        if len(threads) != index.ntotal:
+            raise IndexValidationError(
+                f"Index has {index.ntotal} vectors but thread map has {len(threads)} entries"
+            )
+        return threads
+
+    def _load_answers(self):
+        if not self.answers_path:
+            return None
+        try:
+            answers = load_answer_store(self.answers_path)
+        except ValueError as e:
+            raise IndexValidationError(str(e)) from e  # being rewritten; the watcher retries
+        if answers is None:
+            print(f"⚠️ Answer store {self.answers_path} not found; answers are hydrated from the DB")
+        return answers
+
+    def _load_lexical(self):
+        if not self.lexical_path:
+            return None
+        lexical = load_lexical_index(self.lexical_path)
+        if lexical is None:
+            print(f"⚠️ {self.lexical_path} not found; serving vector search only")
+        return lexical
+
+    def _load_exact_vectors(self, index):
+        """Re-rank vectors for a quantized index, or None to serve the index's own scores."""
+        if not self.vectors_path or self.rerank_factor <= 0 or has_exact_storage(index):
+            return None
+        exact_vectors = load_exact_vectors(self.vectors_path)
+        if exact_vectors is None:
+            print(f"⚠️ {self.vectors_path} not found; serving quantized scores without re-ranking")
+            return None
+        if exact_vectors.shape != (index.ntotal, index.d):
+            raise IndexValidationError(
+                f"Index has {index.ntotal} x {index.d} vectors but re-rank file has {exact_vectors.shape}"
+            )
+        return exact_vectors
+
+    def _validate(self, index, id_map):
+        """The id map must describe exactly this index, and the index must match the model."""
+        if index.ntotal != len(id_map):
+            raise IndexValidationError(
+                f"Index has {index.ntotal} vectors but id map has {len(id_map)} entries"
+            )
+        dim = self.model.dimension
+        if index.d != dim:
+            raise IndexValidationError(f"Index dimension {index.d} does not match model dimension {dim}")
+
+    def load(self):
+        """Load everything synchronously. Safe to call more than once; later calls are no-ops."""
+        with self._load_lock:
+            if self.ready:
+                return
+            self.state = "loading"
+            self.error = None
+            start = time.perf_counter()
+            try:
+                print(f"📦 Loading model {self.model_name} ({self.encoder_backend})")
+                self.model = load_encoder(self.model_name, self.encoder_backend)
+                if self.index_path:
+                    self.snapshot = self._load_snapshot(generation=1)
+            except Exception as e:
+                self.state = "failed"
+                self.error = str(e)
+                print(f"❌ Query engine failed to load: {e}")
+                traceback.print_exc()
+                raise
+            self.load_seconds = time.perf_counter() - start
+            self.state = "ready"
+            self._ready.set()
+            vectors = f"{self.snapshot.index.ntotal} vectors" if self.snapshot else "encoder only"
+            print(f"✅ Query engine ready in {self.load_seconds:.2f}s ({vectors})")
+
+    def reload(self) -> IndexSnapshot:
+        """
+        Load the index and id map from disk again, validate them against each other and
+        swap them in. On any error the current snapshot keeps serving and the error is raised.
+        """
+        self.require_ready()
+        if not self.index_path:
+            raise IndexValidationError("No index files to reload; this engine only encodes queries")
+        with self._reload_lock:
+            start = time.perf_counter()
+            try:
+                snapshot = self._load_snapshot(generation=self.generation + 1)
+            except Exception as e:
+                self.last_reload_error = str(e)
+                print(f"❌ Index reload rejected, still serving generation {self.generation}: {e}")
+                raise
+            self.snapshot = snapshot
+            self.last_reload_error = None
+            print(f"🔄 Swapped to index generation {snapshot.generation} "
+                  f"({snapshot.index.ntotal} vectors) in {time.perf_counter() - start:.2f}s")
+        for listener in self._swap_listeners:
+            listener(snapshot)
+        return snapshot
+
+    def reload_answers(self, labels_generation: int) -> bool:
+        """
+        Swap in the answer store on disk when it has caught up with labels_generation,
+        keeping the searched index files. update_answer_store.py rewrites only the store
+        (and re-stamps the manifest), so this is all a stale store needs, with or without
+        an IndexWatcher. Returns False, serving the current store, while the store on disk
+        is behind, invalid, or the index files changed too (a full reload() is due then).
+        """
+        self.require_ready()
+        if not self.answers_path or self.snapshot is None:
+            return False
+        with self._reload_lock:
+            snapshot = self.snapshot
+            try:
+                files_mtime = self._files_mtime()
+                index_mtimes = self._index_mtimes()
+                if snapshot.files_mtime[:len(index_mtimes)] != index_mtimes:
+                    return False
+                build_id = verify_manifest(self.index_path, [], store_files(self.answers_path))
+                answers = load_answer_store(self.answers_path)
+                if self._files_mtime() != files_mtime:
+                    return False  # rewritten while loading; retried on the next stale request
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Answer store reload skipped, still serving the loaded store: {e}")
+                return False
+            if answers is None or answers.labels_generation < labels_generation:
+                return False
+            self.snapshot = replace(snapshot, answers=answers, files_mtime=files_mtime,
+                                    build_id=build_id or snapshot.build_id)
+        print(f"🔄 Swapped to answer store for labels generation {answers.labels_generation} "
+              f"({len(answers)} threads)")
+        return True
+
+    def files_changed(self) -> bool:
+        """True when the index or id map on disk differ from the files behind the current snapshot."""
+        if self.snapshot is None:
+            return False
+        try:
+            return self._files_mtime() != self.snapshot.files_mtime
+        except FileNotFoundError:
+            return False  # mid-write or being replaced; check again later
+
+    def start_background(self) -> threading.Thread:
+        """Load in a daemon thread so the web server can answer /healthz while warming up."""
+        def _run():
+            try:
+                self.load()
+            except Exception:
+                pass  # state/error already recorded for /readyz
+
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=_run, name="query-engine-load", daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def require_ready(self):
+        if not self.ready:
+            raise EngineNotReady(f"Query engine is {self.state}")
+
+    def status(self) -> dict:
+        snapshot = self.snapshot
+        return {
+            "state": self.state,
+            "error": self.error,
+            "model": self.model_name,
+            "encoder_backend": self.encoder_backend,
+            "index_path": self.index_path,
+            "mmap": self.mmap,
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            "index_generation": snapshot.generation if snapshot else None,
+            "build_id": snapshot.build_id if snapshot else None,
+            "vectors": snapshot.index.ntotal if snapshot else None,
+            "tombstones": snapshot.tombstones if snapshot else None,
+            "vector_store": snapshot.store.name if snapshot else None,
+            "rerank_factor": snapshot.store.rerank_factor
+            if snapshot and getattr(snapshot.store, "exact_vectors", None) is not None else 0,
+            "lexical_documents": snapshot.lexical.live_count if snapshot and snapshot.lexical else None,
+            "index_mode": "thread" if self.thread_map_path else "parent",
+            "threads": len(snapshot.threads.threads) if snapshot and snapshot.threads else None,
+            "last_reload_error": self.last_reload_error,
+        }
+
+
+class IndexWatcher:
+    """
+    Polls the index and id map files and triggers engine.reload() once they have
+    changed and stayed unchanged for one interval (so a build still writing is skipped).
+    """
+
+    def __init__(self, engine: QueryEngine, interval_seconds: float):
+        self.engine = engine
+        self.interval_seconds = interval_seconds
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="index-watcher", daemon=True)
+        self._thread.start()
+        print(f"👀 Watching {self.engine.index_path} every {self.interval_seconds}s")
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        pending = None
+        while not self._stop.wait(self.interval_seconds):
+            if not self.engine.ready or not self.engine.files_changed():
+                pending = None
+                continue
+            current = self.engine._files_mtime()
+            if current != pending:
+                pending = current  # changed since last poll; wait until writes settle
+                continue
+            try:
+                self.engine.reload()
+            except Exception:
+                pass  # logged by reload(); retried when the files change again
+            pending = None
@@ -1,31 +1,78 @@
-from fastapi import FastAPI, Request, Form
-from fastapi.responses import HTMLResponse
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Form, HTTPException, Header
+from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
+from pydantic import BaseModel
 import uvicorn
+import httpx
 import os
 import sys
-import requests
 import json
 import re
+from datetime import date
 
 # Add backend directory to sys.path to import query_service
 BASE_DIR = os.path.dirname(__file__)
 sys.path.append(BASE_DIR)
 
-from query_service import get_thread_response
+import query_service
+from query_service import get_thread_response_async, get_thread_responses_async
+from config import BATCH_MAX_QUERIES, ENGINE_BACKGROUND_LOAD, INDEX_WATCH_INTERVAL_SECONDS
+from engine import EngineNotReady, IndexValidationError
+from answer_cache import build_answer_cache
 
 # Gemini Config
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 if not GEMINI_API_KEY:
     raise ValueError("GEMINI_API_KEY environment variable is not set")
 
-GEMINI_URL = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={GEMINI_API_KEY}"
+GEMINI_MODEL_URL = os.getenv(
+    "GEMINI_MODEL_URL",
+    "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash"
+)
+GEMINI_URL = f"{GEMINI_MODEL_URL}:generateContent?key={GEMINI_API_KEY}"
+GEMINI_STREAM_URL = f"{GEMINI_MODEL_URL}:streamGenerateContent?alt=sse&key={GEMINI_API_KEY}"
+
+# Pooled async HTTP client for Gemini, created in the app lifespan
+GEMINI_MAX_CONNECTIONS = int(os.getenv("GEMINI_MAX_CONNECTIONS", "20"))
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "60"))
+gemini_client: httpx.AsyncClient | None = None
+
+# Gemini answer cache: "memory" (in-process), "disk" (SQLite, survives restarts) or "none"
+GEMINI_CACHE_BACKEND = os.getenv("GEMINI_CACHE_BACKEND", "memory")
+GEMINI_CACHE_PATH = os.getenv("GEMINI_CACHE_PATH", os.path.join(BASE_DIR, "gemini_answer_cache.sqlite3"))
+GEMINI_CACHE_SIZE = int(os.getenv("GEMINI_CACHE_SIZE", "2048"))
+GEMINI_CACHE_TTL_SECONDS = float(os.getenv("GEMINI_CACHE_TTL_SECONDS", "86400"))
+gemini_cache = build_answer_cache(GEMINI_CACHE_BACKEND, GEMINI_CACHE_PATH, GEMINI_CACHE_SIZE, GEMINI_CACHE_TTL_SECONDS)
+
+# Optional shared secret for /admin endpoints (unset = no check, e.g. local development)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 
 # Jinja template setup
 frontend_dir = os.path.abspath(os.path.join(BASE_DIR, "../frontend/templates"))
 templates = Jinja2Templates(directory=frontend_dir)
 
-app = FastAPI(title="Query Assistant")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global gemini_client
+    gemini_client = httpx.AsyncClient(
+        timeout=httpx.Timeout(GEMINI_TIMEOUT_SECONDS),
+        limits=httpx.Limits(
+            max_connections=GEMINI_MAX_CONNECTIONS,
+            max_keepalive_connections=GEMINI_MAX_CONNECTIONS
+        )
+    )
+    await query_service.startup(background=ENGINE_BACKGROUND_LOAD, watch_interval=INDEX_WATCH_INTERVAL_SECONDS)
+    try:
+        yield
+    finally:
+        await query_service.shutdown()
+        await gemini_client.aclose()
+        gemini_client = None
+
+
+app = FastAPI(title="Query Assistant", lifespan=lifespan)
 
 
 def _get_gemini_instructions() -> str:
@@ -89,10 +136,10 @@ def _build_gemini_prompt(user_query: str, thread_question: str, thread_answer: s
     return {"contents": [{"parts": parts}]}
 
 
-def _call_gemini(prompt_body):
+async def _call_gemini(prompt_body):
     headers = {'Content-Type': 'application/json'}
     try:
-        response = requests.post(GEMINI_URL, headers=headers, json=prompt_body)
+        response = await gemini_client.post(GEMINI_URL, headers=headers, json=prompt_body)
         response.raise_for_status()
         content = response.json()["candidates"][0]["content"]["parts"]
         raw_text = content[0]["text"]
@@ -105,10 +152,150 @@ def _call_gemini(prompt_body):
         return None
 
 
+def _is_complete_reply(raw_text) -> bool:
+    """Only replies that parse into the expected JSON shape are worth caching."""
+    if not raw_text:
+        return False
+    try:
+        parsed = json.loads(_extract_json_from_markdown(raw_text))
+    except json.JSONDecodeError:
+        return False
+    return isinstance(parsed, dict) and all(k in parsed for k in ("response", "confidence_score", "reasoning"))
+
+
+async def _get_gemini_reply(prompt_body):
+    """Gemini call behind the answer cache; concurrent identical prompts share one request."""
+    if gemini_cache is None:
+        return await _call_gemini(prompt_body)
+    return await gemini_cache.get_or_call(prompt_body, _call_gemini, cacheable=_is_complete_reply)
+
+
 def _extract_json_from_markdown(text: str) -> str:
     return re.sub(r"^```(?:json)?\s*|\s*```$", "", text.strip(), flags=re.IGNORECASE)
 
 
+def _parse_gemini_reply(raw_response):
+    """Returns (assistant_response, confidence_score, reasoning, backend_error) for a raw Gemini reply."""
+    assistant_response = "I'm unable to provide a suitable response right now. Please check the matched response below."
+    confidence_score = 0.0
+    reasoning = ""
+    backend_error = None
+
+    if raw_response:
+        try:
+            cleaned = _extract_json_from_markdown(raw_response)
+            print("🔍 Cleaned Gemini JSON attempt:\n", cleaned)
+            parsed = json.loads(cleaned)
+
+            if not all(k in parsed for k in ("response", "confidence_score", "reasoning")):
+                backend_error = "Gemini response missing required fields."
+                print("❌ Gemini response missing keys.")
+            else:
+                assistant_response = parsed["response"]
+                confidence_score = parsed["confidence_score"]
+                reasoning = parsed["reasoning"]
+
+        except json.JSONDecodeError as e:
+            backend_error = f"Failed to parse Gemini JSON: {e}"
+            print("❌ JSON parse error:", e)
+    else:
+        backend_error = "Gemini API failed or returned no content."
+
+    return assistant_response, confidence_score, reasoning, backend_error
+
+
+class _JsonStringFieldStream:
+    """
+    Incrementally decodes one string field (e.g. "response") out of JSON text that
+    arrives in arbitrary chunks, so the answer can be shown while Gemini is still writing.
+    Unpaired surrogate escapes decode to U+FFFD so every token stays valid UTF-8.
+    """
+    _ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f'}
+
+    def __init__(self, field: str):
+        self._pattern = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._buffer = ""
+        self._pos = None
+        self.done = False
+
+    def feed(self, chunk: str) -> str:
+        """Add raw text; return newly decoded characters of the field value."""
+        self._buffer += chunk
+        if self.done:
+            return ""
+        if self._pos is None:
+            match = self._pattern.search(self._buffer)
+            if not match:
+                return ""
+            self._pos = match.end()
+
+        buf = self._buffer
+        i = self._pos
+        out = []
+        while i < len(buf):
+            ch = buf[i]
+            if ch == '"':
+                self.done = True
+                i += 1
+                break
+            if ch != '\\':
+                out.append(ch)
+                i += 1
+                continue
+            # Escape sequence: wait for the rest of it if it is split across chunks
+            if i + 1 >= len(buf):
+                break
+            esc = buf[i + 1]
+            if esc != 'u':
+                out.append(self._ESCAPES.get(esc, esc))
+                i += 2
+                continue
+            if i + 6 > len(buf):
+                break
+            code = int(buf[i + 2:i + 6], 16)
+            if 0xD800 <= code < 0xDC00:
+                # Surrogate pair: needs the following \uXXXX too
+                follow = buf[i + 6:i + 8]
+                if follow == '\\u':
+                    if i + 12 > len(buf):
+                        break
+                    low = int(buf[i + 8:i + 12], 16)
+                    if 0xDC00 <= low < 0xE000:
+                        code = 0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)
+                        i += 6
+                    else:
+                        code = 0xFFFD  # unpaired; the next escape is decoded on its own
+                elif '\\u'.startswith(follow):
+                    break  # not arrived yet
+                else:
+                    code = 0xFFFD
+            elif 0xDC00 <= code < 0xE000:
+                code = 0xFFFD
+            out.append(chr(code))
+            i += 6
+        self._pos = i
+        return "".join(out)
+
+
+async def _stream_gemini(prompt_body):
+    """Yields raw text chunks from Gemini's streamGenerateContent (SSE) endpoint."""
+    headers = {'Content-Type': 'application/json'}
+    async with gemini_client.stream("POST", GEMINI_STREAM_URL, headers=headers, json=prompt_body) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            chunk = json.loads(line[len("data:"):].strip())
+            for candidate in chunk.get("candidates", [])[:1]:
+                for part in candidate.get("content", {}).get("parts", []):
+                    if part.get("text"):
+                        yield part["text"]
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
 def _is_query_too_vague(query: str) -> bool:
     tokens = re.findall(r'\w+', query.lower())
     stopwords = {"the", "is", "in", "on", "of", "to", "a", "and", "what", "how", "why", "when", "need", "some", "information"}
@@ -117,6 +304,15 @@ def _is_query_too_vague(query: str) -> bool:
     return len(keywords) < 2
 
 
+class BatchQueryRequest(BaseModel):
+    queries: list[str]
+    k: int | None = None          # candidates per query, capped by SEARCH_K_MAX
+    ef_search: int | None = None  # HNSW search effort, capped by SEARCH_EF_MAX
+    space_id: str | None = None   # only threads from this Webex space
+    since: date | None = None     # only threads created on or after this day
+    until: date | None = None     # ... and before this day
+
+
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
     return templates.TemplateResponse("index.html", {
@@ -131,8 +327,49 @@ async def home(request: Request):
     })
 
 
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving HTTP, even while the engine is still loading."""
+    return {"status": "ok", "engine": query_service.engine.state}
+
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 200 once the model, FAISS index and id map are loaded, 503 before that."""
+    status = query_service.engine.status()
+    return JSONResponse(status, status_code=200 if query_service.engine.ready else 503)
+
+
+@app.get("/metrics")
+async def metrics():
+    metrics = query_service.service_metrics()
+    metrics["gemini_cache"] = gemini_cache.stats() if gemini_cache else None
+    return metrics
+
+
+@app.post("/admin/reload-index")
+async def reload_index(x_admin_token: str | None = Header(default=None)):
+    """
+    Load the FAISS index and id map from disk again and swap them in without a restart.
+    In-flight requests finish on the old index; a mismatched index/id map is rejected.
+    """
+    if ADMIN_TOKEN and x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    try:
+        generation = await query_service.reload_index()
+    except EngineNotReady as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except IndexValidationError as e:
+        raise HTTPException(status_code=409, detail=f"Index rejected: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Index reload failed: {e}")
+    return {"status": "reloaded", "index_generation": generation}
+
+
 @app.post("/", response_class=HTMLResponse)
-async def handle_query(request: Request, query: str = Form(...)):
+async def handle_query(request: Request, query: str = Form(...), k: int | None = Form(None),
+                       ef_search: int | None = Form(None), space_id: str | None = Form(None),
+                       since: date | None = Form(None), until: date | None = Form(None)):
     backend_error = None
 
     if _is_query_too_vague(query):
@@ -152,7 +389,7 @@ async def handle_query(request: Request, query: str = Form(...)):
 
     # Call backend FAISS+DB
     try:
-        result = get_thread_response(query)
+        result = await get_thread_response_async(query, k, ef_search, space_id or None, since, until)
     except Exception as e:
         print(f"\n❌ Backend error while querying FAISS/DB: {e}")
         backend_error = f"Backend error: {e}"
@@ -172,31 +409,9 @@ async def handle_query(request: Request, query: str = Form(...)):
 
     # Call Gemini
     gemini_prompt = _build_gemini_prompt(query, result["thread_question"], result["answer"], result["follow_ups"])
-    raw_response = _call_gemini(gemini_prompt)
-
-    assistant_response = "I'm unable to provide a suitable response right now. Please check the matched response below."
-    confidence_score = 0.0
-    reasoning = ""
-
-    if raw_response:
-        try:
-            cleaned = _extract_json_from_markdown(raw_response)
-            print("🔍 Cleaned Gemini JSON attempt:\n", cleaned)
-            parsed = json.loads(cleaned)
+    raw_response = await _get_gemini_reply(gemini_prompt)
 
-            if not all(k in parsed for k in ("response", "confidence_score", "reasoning")):
-                backend_error = "Gemini response missing required fields."
-                print("❌ Gemini response missing keys.")
-            else:
-                assistant_response = parsed["response"]
-                confidence_score = parsed["confidence_score"]
-                reasoning = parsed["reasoning"]
-
-        except json.JSONDecodeError as e:
-            backend_error = f"Failed to parse Gemini JSON: {e}"
-            print("❌ JSON parse error:", e)
-    else:
-        backend_error = "Gemini API failed or returned no content."
+    assistant_response, confidence_score, reasoning, backend_error = _parse_gemini_reply(raw_response)
 
     return templates.TemplateResponse("index.html", {
         "request": request,
@@ -210,5 +425,99 @@ async def handle_query(request: Request, query: str = Form(...)):
     })
 
 
+@app.post("/api/batch")
+async def batch_query(payload: BatchQueryRequest):
+    """
+    Retrieval only (no Gemini) for many queries at once, e.g. backlog replays and
+    nightly evaluations. Results come back in input order; null means no answered thread.
+    """
+    if len(payload.queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUERIES} queries per batch")
+    try:
+        results = await get_thread_responses_async(payload.queries, payload.k, payload.ef_search,
+                                                   payload.space_id or None, payload.since, payload.until)
+    except IndexValidationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"results": [{"query": q, "result": r} for q, r in zip(payload.queries, results)]}
+
+
+@app.post("/stream")
+async def stream_query(query: str = Form(...), k: int | None = Form(None), ef_search: int | None = Form(None),
+                       space_id: str | None = Form(None), since: date | None = Form(None),
+                       until: date | None = Form(None)):
+    """
+    Server-Sent Events version of handle_query. Emits, in order:
+      thread  - the matched thread and faiss_score (0.0 for a BM25-only match), as soon as retrieval finishes
+      token   - pieces of the rewritten answer as they arrive from Gemini
+      done    - final response, confidence_score, reasoning and backend_error
+    """
+    async def events():
+        if _is_query_too_vague(query):
+            print("Query received: " + query + " is vague.")
+            yield _sse("done", {
+                "response": "Your question seems a bit unclear. Could you please provide more details so I can help better.",
+                "confidence_score": 0.0,
+                "reasoning": "The question was too vague and did not contain enough specific keywords.",
+                "backend_error": None
+            })
+            return
+
+        backend_error = None
+        try:
+            result = await get_thread_response_async(query, k, ef_search, space_id or None, since, until)
+        except Exception as e:
+            print(f"\n❌ Backend error while querying FAISS/DB: {e}")
+            backend_error = f"Backend error: {e}"
+            result = None
+
+        if result is None:
+            yield _sse("done", {
+                "response": "Unable to retrieve support thread data. Please try again later.",
+                "confidence_score": 0.0,
+                "reasoning": "The backend system failed to provide any matching threads. Possible reasons: DB down, FAISS unavailable, or no relevant data.",
+                "backend_error": backend_error or "No thread results available from backend."
+            })
+            return
+
+        yield _sse("thread", result)
+
+        gemini_prompt = _build_gemini_prompt(query, result["thread_question"], result["answer"], result["follow_ups"])
+        # Identical prompts streaming at once share one upstream call: the others wait for
+        # the leader's reply and get it in their done event
+        raw_response, lead = await gemini_cache.lookup_or_lead(gemini_prompt) if gemini_cache else (None, None)
+
+        if raw_response is None:
+            field_stream = _JsonStringFieldStream("response")
+            chunks = []
+            try:
+                try:
+                    async for chunk in _stream_gemini(gemini_prompt):
+                        chunks.append(chunk)
+                        text = field_stream.feed(chunk)
+                        if text:
+                            yield _sse("token", {"text": text})
+                    raw_response = "".join(chunks)
+                    print("\n📥 Raw Gemini text:\n", raw_response[:1000], "\n")
+                except Exception as e:
+                    print(f"\n❌ Gemini streaming call failed: {e}")
+                    raw_response = None
+                if gemini_cache and _is_complete_reply(raw_response):
+                    await gemini_cache.store(gemini_prompt, raw_response)
+            finally:
+                # Also runs when the client disconnects mid-stream, so followers never hang
+                if lead is not None:
+                    gemini_cache.release(gemini_prompt, lead, raw_response)
+
+        assistant_response, confidence_score, reasoning, backend_error = _parse_gemini_reply(raw_response)
+        yield _sse("done", {
+            "response": assistant_response,
+            "confidence_score": confidence_score,
+            "reasoning": reasoning,
+            "backend_error": backend_error
+        })
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="127.0.0.1", port=8001, reload=True)
@@ -1,127 +1,706 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import psycopg2
-from psycopg2 import OperationalError, Error
-from sentence_transformers import SentenceTransformer
-import faiss
-import pickle
+from psycopg import OperationalError, Error
+from psycopg_pool import PoolTimeout
 import sys
 import os
+import time
 import traceback
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../embedding-service')))
-from config import DB_CONFIG, FAISS_INDEX_PATH, FAISS_ID_MAP_PATH
+from config import (
+    FAISS_INDEX_PATH, FAISS_ID_MAP_PATH, FAISS_TOMBSTONES_PATH, FAISS_VECTORS_PATH, FAISS_RERANK_FACTOR,
+    QUERY_EXECUTOR_WORKERS, QUERY_CACHE_SIZE, QUERY_CACHE_TTL_SECONDS, LABELS_GENERATION_POLL_SECONDS,
+    EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND, FAISS_MMAP, SEARCH_K_DEFAULT, SEARCH_K_MAX, SEARCH_EF_DEFAULT,
+    SEARCH_EF_MAX, SEARCH_SHED_IN_FLIGHT, SEARCH_EF_MIN, FAISS_METADATA_PATH, SEARCH_FILTER_EXACT_MAX,
+    LEXICAL_INDEX_PATH, HYBRID_SEARCH, HYBRID_RRF_K, LEXICAL_MAX_POSTINGS, LEXICAL_BUDGET_MS, INDEX_MODE,
+    THREAD_INDEX_PATH, THREAD_ID_MAP_PATH, THREAD_TOMBSTONES_PATH, THREAD_VECTORS_PATH, THREAD_METADATA_PATH,
+    THREAD_MAP_PATH, THREAD_AGGREGATION, THREAD_AGGREGATION_TOP_N, THREAD_CANDIDATE_FACTOR, ANSWER_STORE_PATH,
+    SEARCH_BACKEND, PGVECTOR_EF_SEARCH, PGVECTOR_ITERATIVE_SCAN
+)
+import db_pool
+from cache import TTLCache
+from engine import QueryEngine, IndexWatcher, IndexValidationError
+from thread_map import AGGREGATIONS
+from answer_store import select_answer
+from vector_store import BACKENDS, PgvectorStore
 
-model = SentenceTransformer("sentence-transformers/all-mpnet-base-v2")
-index = faiss.read_index(FAISS_INDEX_PATH)
+# Model, index and id map are loaded by startup() (FastAPI lifespan) or by the
+# blocking entry points, never at import time.
+# INDEX_MODE picks the parent index (one vector per thread root) or the whole-thread
+# index (every message, hits aggregated per thread).
+_INDEX_FILES = {
+    "parent": dict(index_path=FAISS_INDEX_PATH, id_map_path=FAISS_ID_MAP_PATH, tombstones_path=FAISS_TOMBSTONES_PATH,
+                   vectors_path=FAISS_VECTORS_PATH, metadata_path=FAISS_METADATA_PATH),
+    "thread": dict(index_path=THREAD_INDEX_PATH, id_map_path=THREAD_ID_MAP_PATH, tombstones_path=THREAD_TOMBSTONES_PATH,
+                   vectors_path=THREAD_VECTORS_PATH, metadata_path=THREAD_METADATA_PATH, thread_map_path=THREAD_MAP_PATH),
+}
+if SEARCH_BACKEND not in BACKENDS:
+    raise ValueError(f"Unknown SEARCH_BACKEND {SEARCH_BACKEND!r}; expected one of {BACKENDS}")
+if INDEX_MODE not in _INDEX_FILES:
+    raise ValueError(f"Unknown INDEX_MODE {INDEX_MODE!r}; expected one of {tuple(_INDEX_FILES)}")
+if INDEX_MODE == "thread" and THREAD_AGGREGATION not in AGGREGATIONS:
+    raise ValueError(f"Unknown THREAD_AGGREGATION {THREAD_AGGREGATION!r}; expected one of {AGGREGATIONS}")
+_pgvector_store = None
+if SEARCH_BACKEND == "pgvector":
+    # Search runs in Postgres through PgvectorStore on the async pool; only the encoder is loaded
+    engine = QueryEngine(EMBEDDING_MODEL_NAME, index_path=None, id_map_path=None, encoder_backend=EMBEDDING_BACKEND)
+    _pgvector_store = PgvectorStore(None, EMBEDDING_MODEL_NAME, PGVECTOR_EF_SEARCH, PGVECTOR_ITERATIVE_SCAN)
+else:
+    engine = QueryEngine(EMBEDDING_MODEL_NAME, mmap=FAISS_MMAP, **_INDEX_FILES[INDEX_MODE],
+                         rerank_factor=FAISS_RERANK_FACTOR, encoder_backend=EMBEDDING_BACKEND,
+                         filter_exact_max=SEARCH_FILTER_EXACT_MAX,
+                         lexical_path=LEXICAL_INDEX_PATH if HYBRID_SEARCH else None, answers_path=ANSWER_STORE_PATH,
+                         store=SEARCH_BACKEND)
+_index_watcher = None
 
-with open(FAISS_ID_MAP_PATH, "rb") as f:
-    id_map = pickle.load(f)
+# Bounded pool for the CPU-bound encode/search step so it never runs on the event loop.
+# torch and FAISS release the GIL, so a few threads give real parallelism.
+_executor = ThreadPoolExecutor(max_workers=QUERY_EXECUTOR_WORKERS, thread_name_prefix="query-cpu")
 
-def get_thread_response(query: str):
-    try:
-        print(f"\n🔍 Query: {query}")
+# Query vectors depend only on the text; retrieval results also depend on the
+# loaded index and on thread_labels, so their keys carry both generations.
+_vector_cache = TTLCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL_SECONDS)
+_result_cache = TTLCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL_SECONDS)
 
-        # Step 1: Embed the query
-        query_vec = model.encode([query], normalize_embeddings=True).astype(np.float32)
+# Last seen cache_generations value for thread_labels and when it was read
+_labels_generation = {"value": 0, "checked_at": 0.0}
 
-        # Step 2: Search FAISS
-        k = 5
-        D, I = index.search(query_vec, k)
+# Searches queued or running on _executor (updated on the event loop), for load shedding
+_search_load = {"in_flight": 0, "shed": 0}
+
+# Requests answered from the precomputed answer store vs. hydrated from the DB
+_answer_store_stats = {"served": 0, "fallbacks": 0, "reloads": 0}
+
+# Background engine.reload_answers() for a stale store: running future and when it was started
+_answers_reload = {"future": None, "started_at": 0.0}
+
+# Lexical (BM25) leg of hybrid search: queries, time spent and queries over LEXICAL_BUDGET_MS
+_lexical_stats = {"searches": 0, "total_ms": 0.0, "max_ms": 0.0, "over_budget": 0}
+
+# SEARCH_BACKEND=pgvector: statements run and time spent in them
+_pgvector_stats = {"searches": 0, "total_ms": 0.0, "max_ms": 0.0}
 
-        print("📊 FAISS distances (similarity scores):", D[0])
-        print("🔢 FAISS indexes:", I[0])
 
+def _normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def _embed_queries(texts: list[str]):
+    """Vectors for normalized query texts; cache misses are encoded in one batched call."""
+    vectors = [_vector_cache.get(text) for text in texts]
+    missing = [i for i, vec in enumerate(vectors) if vec is None]
+    if missing:
+        encoded = engine.model.encode([texts[i] for i in missing], normalize=True)
+        for row, i in enumerate(missing):
+            vectors[i] = encoded[row:row + 1]
+            _vector_cache.set(texts[i], vectors[i])
+    return np.vstack(vectors)
+
+
+def _resolve_hits(snapshot, D, I, verbose: bool = True):
+    """
+    Map a FAISS result matrix to [(parent_ids, scores)] per query row, resolving all
+    positions with one vectorized id map lookup and skipping unmapped ones.
+    """
+    message_ids = snapshot.id_map.resolve(I)
+    results = []
+    for row in range(len(I)):
         parent_ids = []
-        for idx in I[0]:
-            if idx in id_map:
-                msg_id = id_map[idx]
+        scores = []
+        for idx, msg_id, score in zip(I[row], message_ids[row], D[row]):
+            if msg_id is not None:
                 parent_ids.append(msg_id)
-                print(f"🧭 FAISS match: idx={idx} → message_id={msg_id}")
-            else:
+                scores.append(float(score))
+                if verbose:
+                    print(f"🧭 FAISS match: idx={idx} → message_id={msg_id}")
+            elif verbose:
                 print(f"⚠️ No mapping found for FAISS index {idx}")
+        results.append((parent_ids, scores))
+    return results
 
-        if not parent_ids:
-            print("❌ No matching parent message_ids found in FAISS results.")
-            return None
 
-        # Step 3: DB lookup
-        connection = None
-        try:
-            connection = psycopg2.connect(**DB_CONFIG)
+def _search_hits(snapshot, query_vecs, k: int, ef_search: int | None, filters: tuple, verbose: bool = False):
+    """
+    Vector store search (FAISS or exact, see vector_store.py) resolved to
+    [(parent_ids, scores)] per query row. A whole-thread index fetches
+    k * THREAD_CANDIDATE_FACTOR message hits and aggregates them into the best k
+    threads in NumPy, with no per-hit DB lookups.
+    """
+    allowed = snapshot.filter_mask(*filters)
+    if snapshot.threads is None:
+        D, I = snapshot.search(query_vecs, k, ef_search, allowed)
+    else:
+        fetch = k * THREAD_CANDIDATE_FACTOR
+        if snapshot.default_ef_search is not None:
+            ef_search = max(ef_search or snapshot.default_ef_search, fetch)  # HNSW returns at most efSearch
+        D, I = snapshot.search(query_vecs, fetch, ef_search, allowed)
+    if verbose:
+        print("📊 FAISS distances (similarity scores):", D[0])
+        print("🔢 FAISS indexes:", I[0])
+    if snapshot.threads is None:
+        return _resolve_hits(snapshot, D, I, verbose)
+    return snapshot.threads.aggregate(D, I, k, THREAD_AGGREGATION, THREAD_AGGREGATION_TOP_N)
+
+
+def _lexical_search(snapshot, query: str, k: int, filters: tuple) -> list[str]:
+    """Parent ids of the top k BM25 matches for query, or [] without a lexical index."""
+    lexical = snapshot.lexical
+    if lexical is None:
+        return []
+    start = time.perf_counter()
+    parent_ids, _ = lexical.search(query, k, lexical.metadata.mask(*filters), LEXICAL_MAX_POSTINGS)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    _lexical_stats["searches"] += 1
+    _lexical_stats["total_ms"] += elapsed_ms
+    _lexical_stats["max_ms"] = max(_lexical_stats["max_ms"], elapsed_ms)
+    if elapsed_ms > LEXICAL_BUDGET_MS:
+        _lexical_stats["over_budget"] += 1
+    return parent_ids
+
+
+def _fuse(parent_ids: list[str], scores: list[float], lexical_ids: list[str], k: int):
+    """
+    Reciprocal-rank fusion of the FAISS and BM25 rankings: each list adds
+    1 / (HYBRID_RRF_K + rank) to a thread. Returns the top k as (parent_ids, scores),
+    keeping the FAISS similarity as the score.
+
+    Threads only BM25 found have no similarity and score 0.0 (faiss_score in responses),
+    though they may rank first. Anything thresholding faiss_score must let them through
+    or it silently turns hybrid search back into vector search.
+    """
+    if not lexical_ids:
+        return parent_ids, scores
+    fused = {}
+    for ranking in (parent_ids, lexical_ids):
+        for rank, parent_id in enumerate(ranking, start=1):
+            fused[parent_id] = fused.get(parent_id, 0.0) + 1.0 / (HYBRID_RRF_K + rank)
+    similarity = dict(zip(parent_ids, scores))
+    ranked = sorted(fused, key=fused.get, reverse=True)[:k]  # stable: ties keep FAISS order
+    return ranked, [similarity.get(parent_id, 0.0) for parent_id in ranked]
+
+
+def resolve_search_params(snapshot, k: int | None = None, ef_search: int | None = None):
+    """
+    Apply server defaults and caps to a request's k / efSearch, then shed load: with
+    SEARCH_SHED_IN_FLIGHT or more searches in flight, efSearch is scaled down in
+    proportion (floored at SEARCH_EF_MIN and k). Returns (k, ef_search, requested_ef, shed);
+    an ef of None means the efSearch stored in the index (or a non-HNSW index).
+    """
+    k = max(1, min(k or SEARCH_K_DEFAULT, SEARCH_K_MAX))
+    default_ef = snapshot.default_ef_search
+    if default_ef is None:
+        return k, None, None, False
+    # HNSW returns fewer than k results if efSearch < k
+    requested_ef = ef_search or SEARCH_EF_DEFAULT or None
+    if requested_ef is not None or k > default_ef:
+        requested_ef = max(k, min(requested_ef or default_ef, SEARCH_EF_MAX))
+
+    in_flight = _search_load["in_flight"]
+    if SEARCH_SHED_IN_FLIGHT and in_flight >= SEARCH_SHED_IN_FLIGHT:
+        effective = requested_ef or default_ef
+        # This search is not counted in in_flight yet; with it, the effort is shared by in_flight + 1
+        shed_ef = max(SEARCH_EF_MIN, k, effective * SEARCH_SHED_IN_FLIGHT // (in_flight + 1))
+        if shed_ef < effective:
+            _search_load["shed"] += 1
+            return k, shed_ef, requested_ef, True
+    return k, requested_ef, requested_ef, False
+
+
+async def _run_search(fn, *args):
+    """Run a CPU-bound search on _executor, counting it as in flight until it finishes."""
+    _search_load["in_flight"] += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+    finally:
+        _search_load["in_flight"] -= 1
+
+
+def _search_candidates(snapshot, query: str, k: int, ef_search: int | None, filters: tuple = (None, None, None)):
+    """
+    Embed the query and search FAISS, restricted to filters (space_id, since, until),
+    fused with the BM25 hits when a lexical index is loaded.
+    Returns (parent_ids, scores) in rank order.
+    """
+    # Step 1: Embed the query (cached by normalized text)
+    query_vec = _embed_queries([query])
+
+    # Step 2: Search the vector store, applying the filters inside the search
+    parent_ids, scores = _search_hits(snapshot, query_vec, k, ef_search, filters, verbose=True)[0]
+
+    # Step 3: BM25 over thread text catches exact tokens (error codes, API names) embeddings blur
+    lexical_ids = _lexical_search(snapshot, query, k, filters)
+    if lexical_ids:
+        print(f"🔤 Lexical matches: {lexical_ids}")
+    return _fuse(parent_ids, scores, lexical_ids, k)
+
+
+def _search_candidates_batch(snapshot, queries: list[str], k: int, ef_search: int | None,
+                             filters: tuple = (None, None, None)):
+    """Batched _search_candidates: one encode call and one matrix search for all queries."""
+    query_vecs = _embed_queries(queries)
+    hits = _search_hits(snapshot, query_vecs, k, ef_search, filters)
+    return [_fuse(parent_ids, scores, _lexical_search(snapshot, query, k, filters), k)
+            for query, (parent_ids, scores) in zip(queries, hits)]
+
+
+async def _hydrate_threads(cursor, parent_ids):
+    """
+    Fetch parents, children and child labels for all candidate threads in one round trip.
+    Returns {parent_id: {"thread_question": str, "children": [(message_id, text, label), ...]}}
+    with children in creation order. Parents missing from the DB are absent from the result.
+    """
+    await cursor.execute("""
+        SELECT p.message_id, p.text, c.message_id, c.text, l.label
+        FROM messages p
+        LEFT JOIN messages c ON c.parent_id = p.message_id
+        LEFT JOIN thread_labels l ON l.message_id = c.message_id
+        WHERE p.message_id = ANY(%s)
+        ORDER BY p.message_id, c.created
+    """, (list(parent_ids),))
+    rows = await cursor.fetchall()
+
+    threads = {}
+    for parent_id, thread_question, child_id, child_text, label in rows:
+        thread = threads.setdefault(parent_id, {"thread_question": thread_question, "children": []})
+        if child_id is not None:
+            thread["children"].append((child_id, child_text, label))
+    return threads
+
+
+def _select_answer(children, verbose: bool = True):
+    """Pick the first 'answer' child; later answers and clarifications become follow-ups."""
+    answer, follow_ups = select_answer(children)  # same rule the answer store is built with
+    if verbose and answer:
+        message_id = next(message_id for message_id, text, label in children if label == "answer" and text)
+        print(f"🔹 Child message: {message_id}, label=answer")
+    return answer, follow_ups
+
+
+def _select_thread(parent_ids, scores, threads, verbose: bool = True):
+    """First candidate, in fused rank order, whose thread has a labeled answer."""
+    for parent_id, faiss_score in zip(parent_ids, scores):
+        if verbose:
+            print(f"\n🗂 Checking thread for parent_id: {parent_id} (FAISS score: {faiss_score:.4f})")
+
+        thread = threads.get(parent_id)
+        if not thread:
+            if verbose:
+                print(f"⚠️ No parent message found for parent_id={parent_id}. Skipping.")
+            continue
+
+        if not thread["children"]:
+            if verbose:
+                print("📭 No child messages found.")
+            continue
+
+        answer, follow_ups = _select_answer(thread["children"], verbose)
+
+        if answer:
+            if verbose:
+                print(f"✅ Answer found for thread {parent_id}")
+            return {
+                "thread_id": parent_id,
+                "thread_question": thread["thread_question"],
+                "answer": answer,
+                "follow_ups": follow_ups,
+                "faiss_score": float(faiss_score)
+            }
+        elif verbose:
+            print(f"❌ No labeled answer found for thread {parent_id}")
+    return None
+
+
+def _select_stored_thread(answers, parent_ids, scores, verbose: bool = True):
+    """_select_thread over the precomputed answer store: no SQL, only answered threads are stored."""
+    for parent_id, faiss_score in zip(parent_ids, scores):
+        record = answers.get(parent_id)
+        if record is not None and record.get("answer"):  # stores built before empty answers were dropped
+            if verbose:
+                print(f"✅ Stored answer for thread {parent_id} (FAISS score: {faiss_score:.4f})")
+            return {**record, "faiss_score": float(faiss_score)}
+    return None
+
+
+def _answers_current(snapshot, labels_generation: int) -> bool:
+    """True when the snapshot's answer store reflects labels_generation, so it can answer without SQL."""
+    current = snapshot.answers is not None and snapshot.answers.labels_generation == labels_generation
+    _answer_store_stats["served" if current else "fallbacks"] += 1
+    if snapshot.answers is not None and snapshot.answers.labels_generation < labels_generation:
+        _reload_answers_soon(labels_generation)
+    return current
+
+
+def _reload_answers_soon(labels_generation: int):
+    """
+    Pick up the store update_answer_store.py writes for labels_generation without
+    waiting for an index reload (none happens with INDEX_WATCH_INTERVAL_SECONDS=0).
+    Runs off the event loop, at most once per LABELS_GENERATION_POLL_SECONDS.
+    """
+    future, now = _answers_reload["future"], time.monotonic()
+    if future is not None and not future.done():
+        return
+    if now - _answers_reload["started_at"] < LABELS_GENERATION_POLL_SECONDS:
+        return
+    _answers_reload["started_at"] = now
+    future = asyncio.get_running_loop().run_in_executor(None, engine.reload_answers, labels_generation)
+    future.add_done_callback(_answers_reloaded)
+    _answers_reload["future"] = future
+
+
+def _answers_reloaded(future):
+    if not future.cancelled() and future.exception() is None and future.result():
+        _answer_store_stats["reloads"] += 1
+
+
+async def _select_thread_from_db(parent_ids, scores):
+    """Hydrate the candidate threads from the DB and pick the answer; None on DB errors."""
+    try:
+        async with db_pool.connection() as connection:
             cursor = connection.cursor()
+            threads = await _hydrate_threads(cursor, parent_ids)
+        return _select_thread(parent_ids, scores, threads)
+    except PoolTimeout as pool_err:
+        print(f"\n❌ Timed out waiting for a pooled DB connection: {pool_err}")
+    except OperationalError as conn_err:
+        print(f"\n❌ Could not connect to PostgreSQL database: {conn_err}")
+    except Error as db_err:
+        print(f"\n❌ General database error: {db_err}")
+    return None
 
-            for i, parent_id in enumerate(parent_ids):
-                faiss_score = D[0][i]
-                print(f"\n🗂 Checking thread for parent_id: {parent_id} (FAISS score: {faiss_score:.4f})")
-
-                # Fetch the parent question text (thread question)
-                try:
-                    cursor.execute("""
-                        SELECT text FROM messages
-                        WHERE message_id = %s
-                    """, (parent_id,))
-                    parent_row = cursor.fetchone()
-                    if not parent_row:
-                        print(f"⚠️ No parent message found for parent_id={parent_id}. Skipping.")
-                        continue
-                    thread_question = parent_row[0]
-                except Error as parent_query_err:
-                    print(f"❌ Failed to fetch parent question for parent_id={parent_id}: {parent_query_err}")
-                    continue
-
-                # Fetch child messages
-                try:
-                    cursor.execute("""
-                        SELECT m.message_id, m.text, l.label
-                        FROM messages m
-                        LEFT JOIN thread_labels l ON m.message_id = l.message_id
-                        WHERE m.parent_id = %s
-                        ORDER BY m.created
-                    """, (parent_id,))
-                    rows = cursor.fetchall()
-                except Error as child_query_err:
-                    print(f"❌ Database query failed for children of parent_id={parent_id}: {child_query_err}")
-                    continue  # Try next thread
-
-                if not rows:
-                    print("📭 No child messages found.")
-                    continue
-
-                # Step 4: Process children
-                answer = None
-                follow_ups = []
-                for message_id, text, label in rows:
-                    if label == "answer" and not answer:
-                        print(f"🔹 Child message: {message_id}, label={label}")
-                        answer = text
-                    elif label in {"clarification", "answer"}:
-                        follow_ups.append(text)
-
-                if answer:
-                    print(f"✅ Answer found for thread {parent_id}")
-                    return {
-                        "thread_id": parent_id,
-                        "thread_question": thread_question,
-                        "answer": answer,
-                        "follow_ups": follow_ups,
-                        "faiss_score": float(faiss_score)
-                    }
-                else:
-                    print(f"❌ No labeled answer found for thread {parent_id}")
 
+def _pgvector_search_params(k: int | None = None, ef_search: int | None = None):
+    """k / hnsw.ef_search for a pgvector search, with the same defaults and caps as FAISS."""
+    k = max(1, min(k or SEARCH_K_DEFAULT, SEARCH_K_MAX))
+    return k, max(k, min(ef_search or SEARCH_EF_DEFAULT or PGVECTOR_EF_SEARCH, SEARCH_EF_MAX))
+
+
+async def _pgvector_search(cursor, query_vec, k: int, ef_search: int, filters: tuple):
+    """
+    Nearest threads for query_vec from the pgvector HNSW index, with their replies and
+    labels, through the pgvector vector store. Returns (parent_ids, scores, threads).
+    """
+    start = time.perf_counter()
+    # Transaction-local settings; the pooled connection's transaction ends on release
+    hits = (await _pgvector_store.search_threads_async(cursor, query_vec[None], k, ef_search, filters))[0]
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    _pgvector_stats["searches"] += 1
+    _pgvector_stats["total_ms"] += elapsed_ms
+    _pgvector_stats["max_ms"] = max(_pgvector_stats["max_ms"], elapsed_ms)
+    return hits
+
+
+async def _get_thread_responses_pgvector(queries: list[str], k: int | None, ef_search: int | None, filters: tuple):
+    """
+    get_thread_response(s) with SEARCH_BACKEND=pgvector: encode the uncached queries in
+    one call, then one search statement per query on a single pooled connection.
+    Results are cached like FAISS results, keyed by the labels generation.
+    """
+    normalized = [_normalize_query(q) for q in queries]
+    labels_generation = await _current_labels_generation()
+    k, ef_search = _pgvector_search_params(k, ef_search)
+    cache_keys = {text: (text, "pgvector", labels_generation, k, ef_search, filters) for text in normalized}
+
+    resolved = {}
+    for text in normalized:
+        cached = _result_cache.get(cache_keys[text])
+        if cached is not None:
+            resolved[text] = cached
+    pending = [text for text in dict.fromkeys(normalized) if text not in resolved]
+    if pending:
+        query_vecs = await _run_search(_embed_queries, pending)
+        verbose = len(queries) == 1
+        try:
+            async with db_pool.connection() as connection:
+                cursor = connection.cursor()
+                for text, query_vec in zip(pending, query_vecs):
+                    parent_ids, scores, threads = await _pgvector_search(cursor, query_vec, k, ef_search, filters)
+                    if verbose and not parent_ids:
+                        print("❌ No matching parent messages found by pgvector.")
+                    result = _select_thread(parent_ids, scores, threads, verbose)
+                    if result:
+                        result["index_generation"] = None
+                        result["search"] = {"k": k, "ef_search": ef_search, "shed": False, "backend": "pgvector"}
+                        _result_cache.set(cache_keys[text], result)
+                    resolved[text] = result
+        except PoolTimeout as pool_err:
+            print(f"\n❌ Timed out waiting for a pooled DB connection: {pool_err}")
         except OperationalError as conn_err:
             print(f"\n❌ Could not connect to PostgreSQL database: {conn_err}")
         except Error as db_err:
             print(f"\n❌ General database error: {db_err}")
-        finally:
-            if connection:
-                connection.close()
-                print("🔒 Database connection closed.")
+    return [dict(resolved[text]) if resolved.get(text) else None for text in normalized]
+
+
+async def _current_labels_generation() -> int:
+    """
+    Generation counter maintained by triggers on thread_labels and on message text edits
+    (see the cache_generations and message_text_answer_changes migrations). Polled at
+    most every LABELS_GENERATION_POLL_SECONDS.
+    """
+    now = time.monotonic()
+    if now - _labels_generation["checked_at"] < LABELS_GENERATION_POLL_SECONDS:
+        return _labels_generation["value"]
+
+    _labels_generation["checked_at"] = now
+    try:
+        async with db_pool.connection() as connection:
+            cursor = connection.cursor()
+            await cursor.execute("SELECT generation FROM cache_generations WHERE name = 'thread_labels'")
+            row = await cursor.fetchone()
+        generation = row[0] if row else 0
+        if generation != _labels_generation["value"]:
+            # Old keys can no longer be hit; free them instead of waiting for LRU eviction
+            _result_cache.clear()
+            _labels_generation["value"] = generation
+    except (PoolTimeout, Error) as e:
+        print(f"⚠️ Could not read thread_labels generation, keeping {_labels_generation['value']}: {e}")
+    return _labels_generation["value"]
+
+
+def invalidate_query_cache(vectors: bool = False):
+    """Drop cached retrieval results (and optionally query vectors, e.g. after a model change)."""
+    _result_cache.clear()
+    if vectors:
+        _vector_cache.clear()
+
+
+# Results from an older index generation can no longer be hit; free them on swap
+engine.add_swap_listener(lambda snapshot: invalidate_query_cache())
+
+
+async def reload_index():
+    """Hot swap the FAISS index and id map from disk without dropping in-flight requests."""
+    loop = asyncio.get_running_loop()
+    snapshot = await loop.run_in_executor(None, engine.reload)
+    return snapshot.generation
+
+
+async def get_thread_response_async(query: str, k: int | None = None, ef_search: int | None = None,
+                                    space_id: str | None = None, since=None, until=None):
+    """
+    Best answered thread for query, or None. k (candidates) and ef_search (HNSW effort)
+    default to the server settings and are capped by them. space_id and the
+    [since, until) creation window restrict which threads are searched.
+    """
+    filters = (space_id, since, until)
+    try:
+        print(f"\n🔍 Query: {query}")
+
+        if not engine.ready:
+            print(f"⏳ Query engine is {engine.state}; cannot search yet.")
+            return None
+
+        if SEARCH_BACKEND == "pgvector":
+            return (await _get_thread_responses_pgvector([query], k, ef_search, filters))[0]
+
+        # Pin one index snapshot for the whole request; a concurrent hot swap does not affect it
+        snapshot = engine.snapshot
+        normalized = _normalize_query(query)
+        labels_generation = await _current_labels_generation()
+        k, ef_search, requested_ef, shed = resolve_search_params(snapshot, k, ef_search)
+        cache_key = (normalized, snapshot.generation, labels_generation, k, requested_ef, filters)
+        cached = _result_cache.get(cache_key)
+        if cached is not None:
+            print(f"⚡ Cache hit for thread {cached['thread_id']}")
+            return dict(cached)
+
+        if shed:
+            print(f"🪫 {_search_load['in_flight']} searches in flight; efSearch lowered to {ef_search}")
+        parent_ids, scores = await _run_search(_search_candidates, snapshot, normalized, k, ef_search, filters)
+
+        if not parent_ids:
+            print("❌ No matching parent message_ids found in FAISS results.")
+            return None
+
+        # Step 3: Walk candidates in fused rank order, first labeled answer wins. The
+        # precomputed answer store serves it without SQL unless labels changed since it was built.
+        if _answers_current(snapshot, labels_generation):
+            result = _select_stored_thread(snapshot.answers, parent_ids, scores)
+        else:
+            result = await _select_thread_from_db(parent_ids, scores)
+        if result:
+            result["index_generation"] = snapshot.generation
+            result["search"] = {"k": k, "ef_search": ef_search or snapshot.default_ef_search, "shed": shed}
+            # Reduced-effort results are not cached in place of full-effort ones
+            if not shed:
+                _result_cache.set(cache_key, result)
+            return dict(result)
 
         print("❌ No relevant thread with answer found.")
         return None
 
+    except IndexValidationError:
+        # Filters the current index cannot apply; the caller reports it
+        raise
     except Exception as e:
         print("\n❌ Unexpected error in get_thread_response():")
         traceback.print_exc()
         return None
+
+
+async def get_thread_responses_async(queries: list[str], k: int | None = None, ef_search: int | None = None,
+                                     space_id: str | None = None, since=None, until=None):
+    """
+    Batched get_thread_response for replays and evaluations. Encodes all uncached
+    queries in one model.encode call, runs one matrix FAISS search and answers from the
+    answer store, or hydrates every candidate thread with a single query. Returns results in input order (None = no answer).
+    The search options apply to every query in the batch.
+    """
+    filters = (space_id, since, until)
+    print(f"\n🔍 Batch of {len(queries)} queries")
+    if not engine.ready:
+        print(f"⏳ Query engine is {engine.state}; cannot search yet.")
+        return [None] * len(queries)
+    if SEARCH_BACKEND == "pgvector":
+        return await _get_thread_responses_pgvector(queries, k, ef_search, filters)
+    snapshot = engine.snapshot
+    normalized = [_normalize_query(q) for q in queries]
+    labels_generation = await _current_labels_generation()
+    k, ef_search, requested_ef, shed = resolve_search_params(snapshot, k, ef_search)
+    cache_keys = [(text, snapshot.generation, labels_generation, k, requested_ef, filters) for text in normalized]
+
+    results = [_result_cache.get(key) for key in cache_keys]
+    pending = list(dict.fromkeys(text for text, result in zip(normalized, results) if result is None))
+    print(f"⚡ {len(queries) - sum(r is None for r in results)} cached, {len(pending)} distinct to search")
+
+    if pending:
+        hits = await _run_search(_search_candidates_batch, snapshot, pending, k, ef_search, filters)
+        hits_by_text = dict(zip(pending, hits))
+
+        all_parent_ids = list(dict.fromkeys(pid for parent_ids, _ in hits for pid in parent_ids))
+        use_store = _answers_current(snapshot, labels_generation)
+        threads = {}
+        if all_parent_ids and not use_store:
+            try:
+                async with db_pool.connection() as connection:
+                    cursor = connection.cursor()
+                    threads = await _hydrate_threads(cursor, all_parent_ids)
+            except (PoolTimeout, Error) as db_err:
+                print(f"\n❌ Database error during batch hydration: {db_err}")
+                return [dict(r) if r else None for r in results]
+
+        resolved = {}
+        for text, (parent_ids, scores) in hits_by_text.items():
+            resolved[text] = (_select_stored_thread(snapshot.answers, parent_ids, scores, verbose=False) if use_store
+                              else _select_thread(parent_ids, scores, threads, verbose=False))
+            if resolved[text]:
+                resolved[text]["index_generation"] = snapshot.generation
+                resolved[text]["search"] = {"k": k, "ef_search": ef_search or snapshot.default_ef_search, "shed": shed}
+                if not shed:
+                    _result_cache.set((text, snapshot.generation, labels_generation, k, requested_ef, filters),
+                                      resolved[text])
+
+        results = [result if result is not None else resolved.get(text)
+                   for text, result in zip(normalized, results)]
+
+    return [dict(r) if r else None for r in results]
+
+
+async def startup(background: bool = False, watch_interval: float = 0):
+    """
+    Load the engine and open/warm the DB pool. Called from the FastAPI lifespan.
+    With background=True the engine loads in a thread and /readyz reports progress.
+    A watch_interval > 0 reloads the index automatically when its files change.
+    """
+    global _index_watcher
+    if background:
+        engine.start_background()
+    else:
+        await asyncio.get_running_loop().run_in_executor(None, engine.load)
+    if watch_interval > 0 and _index_watcher is None:
+        _index_watcher = IndexWatcher(engine, watch_interval)
+        _index_watcher.start()
+    await db_pool.open_pool(wait=True)
+
+
+async def shutdown():
+    global _index_watcher
+    if _index_watcher is not None:
+        _index_watcher.stop()
+        _index_watcher = None
+    await db_pool.close_pool()
+
+
+def service_metrics() -> dict:
+    return {
+        "engine": engine.status(),
+        "db_pool": db_pool.pool_metrics(),
+        "query_cache": {
+            "index_generation": engine.generation,
+            "labels_generation": _labels_generation["value"],
+            "vectors": _vector_cache.stats(),
+            "results": _result_cache.stats(),
+        },
+        "search": {
+            "in_flight": _search_load["in_flight"],
+            "shed_searches": _search_load["shed"],
+            "k_default": SEARCH_K_DEFAULT,
+            "k_max": SEARCH_K_MAX,
+            "ef_default": SEARCH_EF_DEFAULT or (engine.snapshot.default_ef_search if engine.snapshot else None),
+            "ef_max": SEARCH_EF_MAX,
+            "ef_min": SEARCH_EF_MIN,
+            "shed_in_flight": SEARCH_SHED_IN_FLIGHT,
+        },
+        "threads": {
+            "index_mode": INDEX_MODE,
+            "aggregation": THREAD_AGGREGATION if INDEX_MODE == "thread" else None,
+            "aggregation_top_n": THREAD_AGGREGATION_TOP_N,
+            "candidate_factor": THREAD_CANDIDATE_FACTOR,
+        },
+        "answer_store": {
+            "threads": len(engine.snapshot.answers) if engine.snapshot and engine.snapshot.answers else None,
+            "labels_generation": engine.snapshot.answers.labels_generation
+            if engine.snapshot and engine.snapshot.answers else None,
+            "served": _answer_store_stats["served"],
+            "fallbacks": _answer_store_stats["fallbacks"],
+            "reloads": _answer_store_stats["reloads"],
+        },
+        "lexical": {
+            "enabled": bool(engine.snapshot and engine.snapshot.lexical),
+            "searches": _lexical_stats["searches"],
+            "avg_ms": round(_lexical_stats["total_ms"] / _lexical_stats["searches"], 3)
+            if _lexical_stats["searches"] else None,
+            "max_ms": round(_lexical_stats["max_ms"], 3),
+            "budget_ms": LEXICAL_BUDGET_MS,
+            "over_budget": _lexical_stats["over_budget"],
+            "max_postings": LEXICAL_MAX_POSTINGS,
+            "rrf_k": HYBRID_RRF_K,
+        },
+        "pgvector": {
+            "enabled": SEARCH_BACKEND == "pgvector",
+            "searches": _pgvector_stats["searches"],
+            "avg_ms": round(_pgvector_stats["total_ms"] / _pgvector_stats["searches"], 3)
+            if _pgvector_stats["searches"] else None,
+            "max_ms": round(_pgvector_stats["max_ms"], 3),
+            "ef_search": PGVECTOR_EF_SEARCH,
+            "iterative_scan": PGVECTOR_ITERATIVE_SCAN,
+        },
+    }
+
+
+def get_thread_response(query: str, k: int | None = None, ef_search: int | None = None,
+                        space_id: str | None = None, since=None, until=None):
+    """Blocking entry point for scripts such as cli_query.py."""
+    async def _run():
+        await startup()
+        try:
+            return await get_thread_response_async(query, k, ef_search, space_id, since, until)
+        finally:
+            await shutdown()
+
+    return asyncio.run(_run())
+
+
+def get_thread_responses(queries: list[str], k: int | None = None, ef_search: int | None = None,
+                         space_id: str | None = None, since=None, until=None):
+    """Blocking batch entry point, e.g. for nightly evaluation scripts."""
+    async def _run():
+        await startup()
+        try:
+            return await get_thread_responses_async(queries, k, ef_search, space_id, since, until)
+        finally:
+            await shutdown()
+
+    return asyncio.run(_run())
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Same layout the backend runs with: its own modules plus the embedding-service ones
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../embedding-service")))
@@ -0,0 +1,111 @@
+import asyncio
+
+from answer_cache import AnswerCache, MemoryAnswerBackend
+
+PROMPT = {"contents": [{"parts": [{"text": "q"}]}]}
+
+
+def _cache():
+    return AnswerCache(MemoryAnswerBackend(maxsize=8, ttl_seconds=60))
+
+
+def test_streaming_misses_share_the_leaders_reply():
+    async def run():
+        cache = _cache()
+        value, lead = await cache.lookup_or_lead(PROMPT)
+        assert value is None and lead is not None
+        followers = [asyncio.ensure_future(cache.lookup_or_lead(PROMPT)) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert not any(f.done() for f in followers)
+        await cache.store(PROMPT, "reply")
+        cache.release(PROMPT, lead, "reply")
+        assert await asyncio.gather(*followers) == [("reply", None)] * 3
+        assert cache.stats()["upstream_calls"] == 1
+        assert cache.stats()["coalesced"] == 3
+        assert cache.stats()["in_flight"] == 0
+
+    asyncio.run(run())
+
+
+def test_follower_leads_when_the_streaming_leader_goes_away():
+    async def run():
+        cache = _cache()
+        _, lead = await cache.lookup_or_lead(PROMPT)
+        follower = asyncio.ensure_future(cache.lookup_or_lead(PROMPT))
+        await asyncio.sleep(0)
+        cache.release(PROMPT, lead, None)  # client disconnected before Gemini finished
+        value, new_lead = await follower
+        assert value is None and new_lead is not None and new_lead is not lead
+        assert cache.stats()["upstream_calls"] == 2
+
+    asyncio.run(run())
+
+
+def test_get_or_call_joins_a_streaming_leader():
+    async def run():
+        cache = _cache()
+        _, lead = await cache.lookup_or_lead(PROMPT)
+        calls = []
+
+        async def call(prompt_body):
+            calls.append(prompt_body)
+            return "own"
+
+        joined = asyncio.ensure_future(cache.get_or_call(PROMPT, call))
+        await asyncio.sleep(0)
+        cache.release(PROMPT, lead, "streamed")
+        assert await joined == "streamed"
+        assert calls == []
+
+    asyncio.run(run())
+
+
+def test_identical_calls_share_one_upstream_call_and_only_complete_replies_are_cached():
+    async def run():
+        cache = _cache()
+        release = asyncio.Event()
+        calls = []
+
+        async def call(prompt_body):
+            calls.append(prompt_body)
+            await release.wait()
+            return None if len(calls) == 1 else "reply"
+
+        callers = [asyncio.ensure_future(cache.get_or_call(PROMPT, call)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        assert await asyncio.gather(*callers) == [None] * 3
+        assert len(calls) == 1
+        assert await cache.get_or_call(PROMPT, call) == "reply"  # the failed reply was not cached
+        assert await cache.get_or_call(PROMPT, call) == "reply"
+        assert len(calls) == 2
+
+    asyncio.run(run())
+
+
+def test_cancelled_leader_does_not_cancel_the_shared_call():
+    async def run():
+        cache = _cache()
+        release = asyncio.Event()
+        calls = []
+
+        async def call(prompt_body):
+            calls.append(prompt_body)
+            await release.wait()
+            return "reply"
+
+        leader = asyncio.ensure_future(cache.get_or_call(PROMPT, call))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(cache.get_or_call(PROMPT, call))
+        await asyncio.sleep(0)
+        leader.cancel()  # client went away
+        await asyncio.sleep(0)
+        assert leader.cancelled()
+        release.set()
+        assert await follower == "reply"
+        assert len(calls) == 1
+        assert cache.stats()["in_flight"] == 0
+        assert await cache.get_or_call(PROMPT, call) == "reply"  # cached by the call the leader started
+        assert len(calls) == 1
+
+    asyncio.run(run())
@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+from answer_store import AnswerStore, save_answer_store
+from engine import IndexSnapshot, QueryEngine
+
+RECORD = {"thread_question": "q", "answer": "a", "follow_ups": []}
+
+
+@pytest.fixture
+def engine(tmp_path):
+    index_path, id_map_path = str(tmp_path / "index.bin"), str(tmp_path / "index.ids.npy")
+    answers_path = str(tmp_path / "index.answers")
+    for path in (index_path, id_map_path):
+        with open(path, "wb") as f:
+            f.write(b"x")
+    save_answer_store(answers_path, AnswerStore.build({"t1": RECORD}, labels_generation=1, last_change_id=1))
+    engine = QueryEngine("model", index_path, id_map_path, answers_path=answers_path)
+    engine.snapshot = IndexSnapshot(None, None, 1, 0.0, engine._files_mtime(), store=None,
+                                    answers=engine._load_answers())
+    engine._ready.set()
+    return engine
+
+
+def test_store_that_caught_up_is_swapped_in_without_an_index_reload(engine):
+    before = engine.snapshot
+    store = before.answers.updated({"t2": RECORD}, labels_generation=2, last_change_id=2)
+    save_answer_store(engine.answers_path, store)
+    assert engine.reload_answers(2)
+    assert engine.snapshot.answers.labels_generation == 2
+    assert engine.snapshot.answers.get("t2")["answer"] == "a"
+    assert engine.snapshot.generation == before.generation
+    assert not engine.files_changed()
+
+
+def test_store_still_behind_is_not_swapped(engine):
+    before = engine.snapshot
+    assert not engine.reload_answers(2)
+    assert engine.snapshot is before
+
+
+def test_changed_index_files_leave_the_swap_to_a_full_reload(engine):
+    before = engine.snapshot
+    store = before.answers.updated({}, labels_generation=2, last_change_id=2)
+    save_answer_store(engine.answers_path, store)
+    stat = os.stat(engine.index_path)
+    os.utime(engine.index_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert not engine.reload_answers(2)
+    assert engine.snapshot is before
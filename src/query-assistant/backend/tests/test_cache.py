@@ -0,0 +1,52 @@
+import pytest
+
+import cache
+from cache import TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_entries_expire_after_the_ttl(clock):
+    c = TTLCache(maxsize=4, ttl_seconds=10)
+    c.set("a", 1)
+    clock[0] += 9.9
+    assert c.get("a") == 1
+    clock[0] += 0.1
+    assert c.get("a", "gone") == "gone"
+    assert len(c) == 0
+    assert (c.hits, c.misses) == (1, 1)
+
+
+def test_least_recently_used_is_evicted_first(clock):
+    c = TTLCache(maxsize=2, ttl_seconds=10)
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.get("a") == 1  # b is now the oldest
+    c.set("c", 3)
+    assert c.get("b") is None
+    assert (c.get("a"), c.get("c")) == (1, 3)
+    assert c.stats()["evictions"] == 1
+
+
+def test_set_refreshes_ttl_and_recency(clock):
+    c = TTLCache(maxsize=2, ttl_seconds=10)
+    c.set("a", 1)
+    c.set("b", 2)
+    clock[0] += 8
+    c.set("a", 10)
+    c.set("c", 3)  # evicts b, not the rewritten a
+    clock[0] += 8
+    assert c.get("a") == 10
+    assert c.get("b") is None
+
+
+def test_zero_size_cache_stores_nothing(clock):
+    c = TTLCache(maxsize=0, ttl_seconds=10)
+    c.set("a", 1)
+    assert c.get("a") is None
+    assert c.stats()["hit_rate"] == 0.0
@@ -0,0 +1,30 @@
+import pytest
+
+import query_service
+from query_service import _fuse
+
+
+def test_without_lexical_hits_the_vector_ranking_is_returned_unchanged():
+    assert _fuse(["a", "b"], [0.9, 0.8], [], k=2) == (["a", "b"], [0.9, 0.8])
+
+
+def test_reciprocal_rank_fusion_order(monkeypatch):
+    monkeypatch.setattr(query_service, "HYBRID_RRF_K", 60)
+    parent_ids, scores = _fuse(["a", "b", "c"], [0.9, 0.8, 0.7], ["c", "d", "a"], k=4)
+    # a: 1/61 + 1/63, c: 1/63 + 1/61 (tie, vector order wins), b: 1/62, d: 1/62 (tie, b first)
+    assert parent_ids == ["a", "c", "b", "d"]
+    # Vector similarities are kept; a thread only BM25 found scores 0.0
+    assert scores == [0.9, 0.7, 0.8, 0.0]
+
+
+def test_fusion_truncates_to_k():
+    parent_ids, scores = _fuse(["a", "b", "c"], [0.9, 0.8, 0.7], ["d", "c"], k=2)
+    assert parent_ids == ["c", "a"]
+    assert len(scores) == 2
+
+
+def test_lexical_only_hit_can_rank_first(monkeypatch):
+    monkeypatch.setattr(query_service, "HYBRID_RRF_K", 0)
+    parent_ids, scores = _fuse(["a", "b"], [0.9, 0.8], ["b", "x"], k=3)
+    assert parent_ids == ["b", "a", "x"]
+    assert scores == pytest.approx([0.8, 0.9, 0.0])
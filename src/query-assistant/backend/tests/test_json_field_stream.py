@@ -0,0 +1,59 @@
+import json
+import os
+
+import pytest
+
+os.environ.setdefault("GEMINI_API_KEY", "test")  # main refuses to import without one
+from main import _JsonStringFieldStream
+
+VALUE = 'Restart the client.\nThen run "webex --reset" \\ check C:\\logs — done ✅ 🎉\t(é)'
+REPLY = json.dumps({"confidence_score": 0.9, "response": VALUE, "reasoning": "It worked"})
+
+
+def _decode(chunks):
+    stream = _JsonStringFieldStream("response")
+    return "".join(stream.feed(chunk) for chunk in chunks), stream.done
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, len(REPLY)])
+def test_any_chunking_decodes_the_field_like_json(size):
+    decoded, done = _decode([REPLY[i:i + size] for i in range(0, len(REPLY), size)])
+    assert decoded == VALUE
+    assert done
+
+
+def test_unicode_escapes_and_surrogate_pairs_split_across_chunks():
+    reply = json.dumps({"response": VALUE}, ensure_ascii=True)
+    assert "\\ud83c\\udf89" in reply  # 🎉 as a surrogate pair
+    for split in range(len(reply)):
+        decoded, done = _decode([reply[:split], reply[split:]])
+        assert decoded == VALUE, split
+        assert done
+
+
+def test_other_fields_and_text_after_the_value_are_ignored():
+    stream = _JsonStringFieldStream("response")
+    assert stream.feed('{"reasoning": "not this", "resp') == ""
+    assert stream.feed('onse" : "yes') == "yes"
+    assert stream.feed('", "response": "again"}') == ""
+    assert stream.done
+
+
+def test_missing_field_yields_nothing():
+    decoded, done = _decode(['{"confidence_score": 0.1}'])
+    assert decoded == ""
+    assert not done
+
+
+@pytest.mark.parametrize("escape, expected", [
+    ('\\ud83cab\\u00e9', '\ufffdab\u00e9'),  # high surrogate followed by plain text
+    ('\\ud83c\\n\\u00e9', '\ufffd\n\u00e9'),  # ... by another escape
+    ('\\ud83c\\u00e9', '\ufffd\u00e9'),  # ... by a \u escape that is not a low surrogate
+    ('\\udf89x', '\ufffdx'),  # lone low surrogate
+])
+def test_unpaired_surrogates_do_not_swallow_the_following_text(escape, expected):
+    reply = '{"response": "%s", "reasoning": "r"}' % escape
+    for split in range(len(reply)):
+        decoded, done = _decode([reply[:split], reply[split:]])
+        assert decoded == expected, split
+        assert done
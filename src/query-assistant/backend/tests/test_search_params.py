@@ -0,0 +1,71 @@
+from types import SimpleNamespace
+
+import pytest
+
+import query_service
+from query_service import resolve_search_params
+
+HNSW = SimpleNamespace(default_ef_search=64)
+FLAT = SimpleNamespace(default_ef_search=None)
+
+
+@pytest.fixture(autouse=True)
+def limits(monkeypatch):
+    for name, value in (("SEARCH_K_DEFAULT", 5), ("SEARCH_K_MAX", 50), ("SEARCH_EF_DEFAULT", 0),
+                        ("SEARCH_EF_MAX", 512), ("SEARCH_SHED_IN_FLIGHT", 4), ("SEARCH_EF_MIN", 16)):
+        monkeypatch.setattr(query_service, name, value)
+    monkeypatch.setitem(query_service._search_load, "in_flight", 0)
+    monkeypatch.setitem(query_service._search_load, "shed", 0)
+
+
+def test_defaults_keep_the_index_ef():
+    assert resolve_search_params(HNSW) == (5, None, None, False)
+
+
+@pytest.mark.parametrize("k, expected", [(None, 5), (0, 5), (-3, 1), (7, 7), (500, 50)])
+def test_k_is_defaulted_and_clamped(k, expected):
+    assert resolve_search_params(HNSW, k=k)[0] == expected
+
+
+@pytest.mark.parametrize("k, ef, expected", [
+    (5, 100, 100),
+    (5, 10_000, 512),  # SEARCH_EF_MAX
+    (20, 8, 20),       # never below k
+    (50, None, 64),    # k <= index ef: the index ef is fine
+])
+def test_ef_is_clamped_between_k_and_the_cap(k, ef, expected):
+    _, ef_search, requested_ef, shed = resolve_search_params(HNSW, k=k, ef_search=ef)
+    assert ef_search == (None if ef is None else expected)
+    assert requested_ef == ef_search
+    assert not shed
+
+
+def test_k_above_the_index_ef_raises_ef_to_k(monkeypatch):
+    monkeypatch.setattr(query_service, "SEARCH_K_MAX", 100)
+    assert resolve_search_params(HNSW, k=80)[1] == 80
+
+
+def test_flat_index_has_no_ef():
+    assert resolve_search_params(FLAT, k=10, ef_search=100) == (10, None, None, False)
+
+
+def test_shedding_starts_at_the_threshold():
+    query_service._search_load["in_flight"] = 3
+    assert resolve_search_params(HNSW, ef_search=200) == (5, 200, 200, False)
+    query_service._search_load["in_flight"] = 4
+    # 200 * 4 // (4 + 1)
+    assert resolve_search_params(HNSW, ef_search=200) == (5, 160, 200, True)
+    assert query_service._search_load["shed"] == 1
+
+
+def test_shedding_is_floored_at_ef_min_and_k():
+    query_service._search_load["in_flight"] = 100
+    assert resolve_search_params(HNSW, ef_search=200)[1] == 16
+    assert resolve_search_params(HNSW, k=30, ef_search=200)[1] == 30
+
+
+def test_shedding_applies_to_the_index_ef_and_can_be_disabled(monkeypatch):
+    query_service._search_load["in_flight"] = 8
+    assert resolve_search_params(HNSW) == (5, 28, None, True)  # 64 * 4 // 9
+    monkeypatch.setattr(query_service, "SEARCH_SHED_IN_FLIGHT", 0)
+    assert resolve_search_params(HNSW) == (5, None, None, False)